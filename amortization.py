@@ -0,0 +1,572 @@
+#!/usr/bin/env python3
+#
+# amortization.py
+#
+# Loan schedule maths used by calc_uno_python_amortization.py.
+#
+# There is no "import uno" in this file, so it may be imported and timed
+# without LibreOffice running. For the Calc scrollbar callbacks to find it,
+# place a copy in:
+# ~/.config/libreoffice/4/user/Scripts/python/pythonpath/
+#
+# NumPy is optional. When it is installed the whole schedule is computed in
+# one closed-form pass. Without it the original month by month loop is used.
+#
+# Each schedule row is: [Month, Interest, Principal, Balance]
+# Row 0 holds the opening balance. Rows 1 to total_payments are the payments.
+#
+# iter_schedule() yields the rows one at a time instead, and
+# schedule_array() packs them into one flat array('d').
+#
+# It is also a command line tool, for computing many schedules on a machine
+# without LibreOffice. The input is a CSV file with a header row and the
+# columns principal, rate (annual percent) and years, plus optionally loan,
+# an identifier. The output has one row per month per loan, and is written
+# as each loan is computed, so the input may be of any size. A row that
+# can't be scheduled is reported and skipped, and the exit status is 1.
+# $ python3 amortization.py loans.csv --out schedules.csv
+# $ python3 amortization.py loans.csv --out schedules.parquet
+#
+# Parquet output requires pyarrow.
+#
+# For a portfolio of many loans, portfolio() computes every schedule in one
+# array pass per chunk of loans:
+#   schedules = amortization.portfolio(principals, rates, years)
+#   totals = amortization.portfolio_cash_flows(principals, rates, years)
+#
+import argparse
+from array import array
+import collections
+import csv
+import io
+import itertools
+import math
+import sys
+import threading
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Columns of a schedule file.
+COLUMNS = ("loan", "month", "interest", "principal", "balance")
+# Rows buffered before each Parquet row group is written.
+PARQUET_BATCH_ROWS = 1000000
+# Schedules kept by a ScheduleCache. A 30 year schedule is about 70 KB.
+CACHE_SIZE = 256
+# Loans computed together by the portfolio functions. A chunk of 256 loans
+# of 30 years is about 3 MB of schedules. Larger chunks were slower, as the
+# working set no longer fits in cache.
+PORTFOLIO_CHUNK = 256
+
+
+def monthly_payment(principal, interest_percent, total_payments):
+    """ Total Monthly Payment = Loan Amount [ i (1+i) ÷ n / ((1+i) ÷ n) - 1) ] """
+    if total_payments < 1:
+        raise ValueError("total_payments must be at least 1")
+    monthly_interest_ratio = (interest_percent * 0.01) / 12
+    if monthly_interest_ratio == 0:
+        # No interest. Just split the principal evenly.
+        return principal / total_payments
+    return ((principal * monthly_interest_ratio) /
+            (1 - (1 + monthly_interest_ratio) ** - total_payments))
+
+
+def schedule(principal, rate, years, use_numpy=True):
+    """
+    Schedule of a loan of principal at rate annual percent, repaid monthly
+    over years. See amortization_schedule() for the rows.
+    """
+    return amortization_schedule(principal, rate, int(round(years * 12)), use_numpy)
+
+
+def amortization_schedule(principal, interest_percent, total_payments,
+                          use_numpy=True):
+    """
+    Return the schedule as (total_payments + 1) rows of 4 floats.
+    With NumPy this is a C-contiguous 2-D float64 array, otherwise a list of
+    lists as built by the original recalculate() loop.
+    """
+    if np is not None and use_numpy:
+        return _schedule_numpy(principal, interest_percent, total_payments)
+    return _schedule_loop(principal, interest_percent, total_payments)
+
+
+def _schedule_loop(principal, interest_percent, total_payments):
+    """ The original scalar loop. One month at a time. """
+    return [list(row) for row in
+            iter_schedule(principal, interest_percent, total_payments)]
+
+
+def iter_schedule(principal, interest_percent, total_payments):
+    """
+    Yield the schedule a row at a time, as (Month, Interest, Principal,
+    Balance) tuples of floats, without building the table. e.g. to write
+    rows as they are computed.
+    """
+    interest_monthly = (interest_percent * 0.01) / 12
+    total_monthly_payment = monthly_payment(principal, interest_percent,
+                                            total_payments)
+
+    # Row 0. The initial balance, which is the principal
+    balance = float(principal)
+    yield (0.0, 0.0, 0.0, balance)
+
+    # I=P*r*t, where I=Interest, P=principal, r=rate, and t=time.
+    for i in range(1, total_payments + 1):
+        # previous balance * monthly interest
+        interest_month_amount = balance * interest_monthly
+        repayment_amount = total_monthly_payment - interest_month_amount
+        balance = balance - repayment_amount
+        yield (float(i), interest_month_amount, repayment_amount, balance)
+
+
+def schedule_array(principal, interest_percent, total_payments):
+    """
+    The whole schedule as one flat array('d'), 4 doubles per row. Row k is
+    table[4 * k:4 * k + 4]. 32 bytes a row, where a list of 4 floats is
+    about 180. No NumPy needed.
+    """
+    table = array("d")
+    for row in iter_schedule(principal, interest_percent, total_payments):
+        table.extend(row)
+    return table
+
+
+def _schedule_numpy(principal, interest_percent, total_payments):
+    """
+    Closed form. The balance after k payments is:
+    B(k) = P(1+r)^k - M((1+r)^k - 1) / r
+    Interest for month k is B(k-1) * r and the principal repaid is M less that.
+    """
+    r = (interest_percent * 0.01) / 12
+    m = monthly_payment(principal, interest_percent, total_payments)
+
+    table = np.empty((total_payments + 1, 4), dtype=np.float64)
+    months = np.arange(total_payments + 1, dtype=np.float64)
+    table[:, 0] = months
+
+    if r == 0:
+        balance = principal - m * months
+    else:
+        growth = (1 + r) ** months
+        balance = principal * growth - m * (growth - 1) / r
+    table[:, 3] = balance
+
+    table[0, 1] = 0.0
+    table[0, 2] = 0.0
+    table[1:, 1] = balance[:-1] * r
+    table[1:, 2] = m - table[1:, 1]
+    return table
+
+
+def data_array(principal, interest_percent, total_payments):
+    """ 
+    Months 1 to total_payments as a tuple of row tuples of floats, ready
+    for setDataArray().
+    """
+    if np is not None:
+        rows = _schedule_numpy(principal, interest_percent, total_payments)[1:].tolist()
+    else:
+        rows = itertools.islice(
+                iter_schedule(principal, interest_percent, total_payments), 1, None)
+    return tuple(tuple(row) for row in rows)
+
+
+class ScheduleCache():
+    """
+    Least recently used cache of data_array() results, keyed by
+    (principal, interest_percent, total_payments). Thread safe, so it may
+    be filled in the background by prewarm().
+    """
+
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, principal, interest_percent, total_payments):
+        """ The data array, from the cache or computed and added. """
+        key = (principal, interest_percent, total_payments)
+        with self._lock:
+            data = self._data.get(key)
+            if data is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return data
+            self.misses += 1
+        # Computed outside the lock, so prewarm() does not hold up a caller.
+        data = data_array(principal, interest_percent, total_payments)
+        self._put(key, data)
+        return data
+
+    def _put(self, key, data):
+        with self._lock:
+            self._data[key] = data
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def prewarm(self, keys):
+        """ 
+        Compute the schedules for keys, in order, in a daemon thread. Keys
+        already cached are skipped. Stops when the cache is full, so it
+        never evicts. Returns the thread.
+        """
+        def fill():
+            for key in keys:
+                with self._lock:
+                    if len(self._data) >= self.maxsize:
+                        return
+                    if key in self._data:
+                        continue
+                self._put(key, data_array(*key))
+
+        thread = threading.Thread(target=fill, daemon=True)
+        thread.start()
+        return thread
+
+
+def _portfolio_terms(principal, rate, years):
+    """ The inputs as float arrays, and the number of payments of each loan. """
+    principal = np.asarray(principal, dtype=np.float64)
+    rate = np.asarray(rate, dtype=np.float64)
+    total_payments = np.rint(np.asarray(years, dtype=np.float64) * 12).astype(np.int64)
+    if not (principal.shape == rate.shape == total_payments.shape):
+        raise ValueError("principal, rate and years must be the same length")
+    if len(total_payments) and total_payments.min() < 1:
+        raise ValueError("every loan must have at least 1 payment")
+    return principal, rate, total_payments
+
+
+def _portfolio_numpy(principal, rate, total_payments):
+    """
+    Schedules of a chunk of loans, as a loans x (months + 1) x 4 array, where
+    months is the longest term. The closed form of _schedule_numpy(), with
+    one row of the array per loan. After a loan's last payment its rows are
+    [Month, 0, 0, 0].
+    """
+    r = (rate * 0.01 / 12)[:, None]
+    n = total_payments[:, None]
+    principal = principal[:, None]
+    months = np.arange(total_payments.max() + 1, dtype=np.float64)
+    zero = rate == 0
+
+    # The columns are written in place, as each whole 2-D temporary costs
+    # about as much as the arithmetic.
+    table = np.empty((len(r), len(months), 4), dtype=np.float64)
+    table[:, :, 0] = months
+    balance = table[:, :, 3]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Zero rate loans give 0 / 0 here, and are replaced below.
+        payment = principal * r / (1 - (1 + r) ** -n)
+        payment[zero] = principal[zero] / n[zero]
+        # B(k) = P(1+r)^k - M((1+r)^k - 1) / r = (1+r)^k (P - M/r) + M/r
+        annuity = payment / r
+        np.power(1 + r, months, out=balance)
+        balance *= principal - annuity
+        balance += annuity
+    if zero.any():
+        balance[zero] = principal[zero] - payment[zero] * months
+    live = months <= n
+    balance *= live
+
+    interest = table[:, 1:, 1]
+    np.multiply(balance[:, :-1], r, out=interest)
+    interest *= live[:, 1:]
+    repaid = table[:, 1:, 2]
+    np.subtract(payment, interest, out=repaid)
+    repaid *= live[:, 1:]
+    table[:, 0, 1:3] = 0.0
+    return table
+
+
+def _portfolio_loop(principal, rate, total_payments):
+    """ As _portfolio_numpy(), but lists of lists from _schedule_loop(). """
+    months = max(total_payments)
+    tables = []
+    for p, i, n in zip(principal, rate, total_payments):
+        table = _schedule_loop(p, i, n)
+        table.extend([float(k), 0.0, 0.0, 0.0] for k in range(n + 1, months + 1))
+        tables.append(table)
+    return tables
+
+
+def portfolio_chunks(principal, rate, years, chunk=PORTFOLIO_CHUNK, use_numpy=True):
+    """
+    Yield (first loan, schedules) for each chunk of loans, where schedules
+    is padded to the longest term in the chunk as for _portfolio_numpy().
+    principal, rate (annual percent) and years are sequences, one per loan.
+    """
+    if np is not None and use_numpy:
+        principal, rate, total_payments = _portfolio_terms(principal, rate, years)
+        for start in range(0, len(principal), chunk):
+            end = start + chunk
+            yield start, _portfolio_numpy(principal[start:end], rate[start:end],
+                                          total_payments[start:end])
+    else:
+        total_payments = [int(round(y * 12)) for y in years]
+        if len(principal) != len(rate) or len(rate) != len(total_payments):
+            raise ValueError("principal, rate and years must be the same length")
+        for start in range(0, len(principal), chunk):
+            end = start + chunk
+            yield start, _portfolio_loop(principal[start:end], rate[start:end],
+                                         total_payments[start:end])
+
+
+def portfolio(principal, rate, years, chunk=PORTFOLIO_CHUNK, use_numpy=True):
+    """
+    Every schedule, as a loans x (months + 1) x 4 array padded to the
+    longest term. Computed a chunk at a time, so the only large allocation
+    is the result. See portfolio_ragged() for no padding.
+    """
+    if not len(principal):
+        return np.zeros((0, 1, 4)) if np is not None and use_numpy else []
+    if not (np is not None and use_numpy):
+        tables = []
+        for start, chunk_tables in portfolio_chunks(principal, rate, years, chunk, False):
+            tables.extend(chunk_tables)
+        months = max(len(t) for t in tables)
+        for table in tables:
+            table.extend([float(k), 0.0, 0.0, 0.0] for k in range(len(table), months))
+        return tables
+
+    principal, rate, total_payments = _portfolio_terms(principal, rate, years)
+    months = total_payments.max() + 1
+    schedules = np.zeros((len(principal), months, 4), dtype=np.float64)
+    # Padding past a chunk's longest term still counts the months.
+    schedules[:, :, 0] = np.arange(months)
+    for start, table in portfolio_chunks(principal, rate, years, chunk):
+        schedules[start:start + len(table), :table.shape[1]] = table
+    return schedules
+
+
+def portfolio_ragged(principal, rate, years, chunk=PORTFOLIO_CHUNK):
+    """
+    Every schedule without padding, as (rows, offsets). rows stacks all the
+    schedules, a total of sum(months + 1) rows of 4. Loan i's schedule is
+    rows[offsets[i]:offsets[i + 1]]. Requires NumPy.
+    """
+    principal, rate, total_payments = _portfolio_terms(principal, rate, years)
+    offsets = np.zeros(len(principal) + 1, dtype=np.int64)
+    np.cumsum(total_payments + 1, out=offsets[1:])
+    rows = np.empty((offsets[-1], 4), dtype=np.float64)
+    for start, table in portfolio_chunks(principal, rate, years, chunk):
+        n = total_payments[start:start + len(table)]
+        # Rows of each loan, up to and including its last payment.
+        live = np.arange(table.shape[1]) <= n[:, None]
+        rows[offsets[start]:offsets[start + len(table)]] = table[live]
+    return rows, offsets
+
+
+def portfolio_cash_flows(principal, rate, years, chunk=PORTFOLIO_CHUNK, use_numpy=True):
+    """
+    Totals over all loans for each month, as (months + 1) rows of
+    [Month, Interest, Principal, Balance]. Memory is bounded by the chunk,
+    whatever the number of loans.
+    """
+    totals = None
+    for start, table in portfolio_chunks(principal, rate, years, chunk, use_numpy):
+        if np is not None and use_numpy:
+            chunk_totals = table.sum(axis=0)
+            if totals is None:
+                totals = chunk_totals
+            elif len(chunk_totals) > len(totals):
+                chunk_totals[:len(totals), 1:] += totals[:, 1:]
+                totals = chunk_totals
+            else:
+                totals[:len(chunk_totals), 1:] += chunk_totals[:, 1:]
+        else:
+            for loan in table:
+                if totals is None:
+                    totals = [[row[0], 0.0, 0.0, 0.0] for row in loan]
+                for k, row in enumerate(loan):
+                    if k == len(totals):
+                        totals.append([row[0], 0.0, 0.0, 0.0])
+                    for col in (1, 2, 3):
+                        totals[k][col] += row[col]
+    if totals is None:
+        return []
+    if np is not None and use_numpy:
+        # Month, not the sum of the months.
+        totals[:, 0] = np.arange(len(totals))
+    return totals
+
+
+def read_loans(fin, errors=None):
+    """
+    Yield (loan, principal, rate, years) for each row of a loans CSV. A row
+    that can't be scheduled, e.g. a term of less than one payment, is
+    reported on stderr and skipped, so one bad row doesn't stop the run.
+    Its message is also appended to the list errors, if given.
+    """
+    for number, row in enumerate(csv.DictReader(fin), 1):
+        loan = row.get("loan") or str(number)
+        try:
+            principal = float(row["principal"])
+            rate = float(row["rate"])
+            years = float(row["years"])
+            # float() takes "nan" and "inf", which can't be scheduled.
+            for name, value in (("principal", principal), ("rate", rate), ("years", years)):
+                if not math.isfinite(value):
+                    raise ValueError("{} {!r} is not a finite number".format(name, row[name]))
+            if not int(round(years * 12)) >= 1:
+                raise ValueError("years {!r} is less than one payment".format(row["years"]))
+        except KeyError as e:
+            message = "no {} column".format(e)
+        except (TypeError, ValueError, OverflowError) as e:
+            # OverflowError: years too big for a payment count, e.g. "1e308".
+            message = str(e)
+        else:
+            yield loan, principal, rate, years
+            continue
+        message = "Skipped row {}, loan {}: {}".format(number, loan, message)
+        print(message, file=sys.stderr)
+        if errors is not None:
+            errors.append(message)
+
+
+def loan_schedules(loans, use_numpy=True):
+    """
+    Yield (loan, schedule rows) for each loan. The rows are a list of lists
+    with NumPy, otherwise an iter_schedule() generator.
+    """
+    for loan, principal, rate, years in loans:
+        if np is not None and use_numpy:
+            # tolist() gives Python floats from an array, and is much faster
+            # than iterating over its rows.
+            yield loan, schedule(principal, rate, years).tolist()
+        else:
+            yield loan, iter_schedule(principal, rate, int(round(years * 12)))
+
+
+def write_csv(loans, fout, use_numpy=True, decimals=None):
+    """
+    Write the loans' schedules to a CSV file. Returns the row count.
+    Amounts are written in full, or rounded to decimals places.
+    """
+    # One string per loan, from a % format, is several times faster than
+    # csv.writer.writerow() for each month.
+    number = "%r" if decimals is None else "%.{}f".format(int(decimals))
+    line = "%d,{0},{0},{0}\n".format(number)
+    quote = io.StringIO()
+    quote_writer = csv.writer(quote, lineterminator="")
+
+    fout.write(",".join(COLUMNS) + "\n")
+    count = 0
+    for loan, table in loan_schedules(loans, use_numpy):
+        # Quote the loan identifier if it holds a comma or quote.
+        quote.seek(0)
+        quote.truncate()
+        quote_writer.writerow((loan,))
+        # Outside the % format, as the loan may hold a "%".
+        prefix = quote.getvalue() + ","
+        lines = [prefix + line % tuple(row) for row in table]
+        fout.write("".join(lines))
+        count += len(lines)
+    return count
+
+
+def write_parquet(loans, path, use_numpy=True, batch_rows=PARQUET_BATCH_ROWS):
+    """
+    Write the loans' schedules to a Parquet file. Returns the row count.
+    Each row group is built from the schedule arrays, about batch_rows rows.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        sys.exit("Parquet output requires pyarrow. $ pip install pyarrow")
+    if np is None:
+        sys.exit("Parquet output requires NumPy. $ pip install numpy")
+
+    schema = pa.schema([("loan", pa.string()), ("month", pa.int32()),
+                        ("interest", pa.float64()), ("principal", pa.float64()),
+                        ("balance", pa.float64())])
+
+    def row_group(names, tables):
+        data = np.concatenate(tables)
+        loan = np.repeat(np.array(names, dtype=object), [len(t) for t in tables])
+        return pa.Table.from_arrays(
+                [pa.array(loan, pa.string()), pa.array(data[:, 0].astype(np.int32)),
+                 pa.array(data[:, 1]), pa.array(data[:, 2]), pa.array(data[:, 3])],
+                schema=schema)
+
+    count = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        names, tables, rows = [], [], 0
+        for loan, principal, rate, years in loans:
+            names.append(loan)
+            # An array already with NumPy. The loop's list of lists is converted.
+            tables.append(np.asarray(schedule(principal, rate, years, use_numpy),
+                                     dtype=float))
+            rows += len(tables[-1])
+            if rows >= batch_rows:
+                writer.write_table(row_group(names, tables))
+                count += rows
+                names, tables, rows = [], [], 0
+        if tables:
+            writer.write_table(row_group(names, tables))
+            count += rows
+    return count
+
+
+def main(argv=None):
+    """ Command line entry point. """
+    parser = argparse.ArgumentParser(description="Compute loan amortization schedules.")
+    parser.add_argument("loans", help="CSV file of principal, rate, years. - for stdin")
+    parser.add_argument("--out", default="-", help="output file. - for stdout")
+    parser.add_argument("--format", choices=("csv", "parquet"),
+                        help="output format. Default from the --out extension")
+    parser.add_argument("--decimals", type=int,
+                        help="round CSV amounts to this many places")
+    parser.add_argument("--loop", action="store_true",
+                        help="use the month by month loop, not NumPy")
+    args = parser.parse_args(argv)
+
+    out_format = args.format or ("parquet" if args.out.endswith(".parquet") else "csv")
+    if out_format == "parquet" and args.out == "-":
+        parser.error("Parquet output needs an --out file")
+
+    try:
+        fin = sys.stdin if args.loans == "-" else open(args.loans, newline="")
+    except OSError as e:
+        parser.error("can't open {}: {}".format(args.loans, e.strerror))
+    errors = []
+    try:
+        loans = read_loans(fin, errors)
+        use_numpy = not args.loop
+        if out_format == "parquet":
+            count = write_parquet(loans, args.out, use_numpy)
+        elif args.out == "-":
+            count = write_csv(loans, sys.stdout, use_numpy, args.decimals)
+        else:
+            with open(args.out, "w", newline="") as fout:
+                count = write_csv(loans, fout, use_numpy, args.decimals)
+    finally:
+        if fin is not sys.stdin:
+            fin.close()
+    print("Rows written:", count, file=sys.stderr)
+    if errors:
+        print("Rows skipped:", len(errors), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+
+    sys.exit(main())
@@ -0,0 +1,1154 @@
+#!/usr/bin/env python3
+#
+# benchmarks.py
+#
+# Timings for the hot spots in the Calc and Draw scripts.
+#
+# Run all of them:
+# $ python3 benchmarks.py
+# Or just one, by name:
+# $ python3 benchmarks.py schedule
+#
+# Exits 1 if a check fails. "budgets" checks the bridge calls of the Draw
+# and Calc scripts against BUDGETS, for CI.
+#
+import contextlib
+import io
+import sys
+import tempfile
+import timeit
+import types
+import tracemalloc
+
+import amortization
+import uno_mock
+
+# The scripts import uno at load time. Use the mock bridge instead.
+BRIDGE = uno_mock.install()
+
+import uno
+
+import calc_uno_python_amortization as calc
+import draw_batch
+import draw_uno_plan as draw
+import floor_plan_scene
+import office_pool
+import uno_connection
+
+
+def best_of(func, number, repeat=5):
+    """ Best wall time in seconds for one call of func(). """
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def bench_schedule():
+    """
+    NumPy closed form versus the month by month loop. 12 to 480 months.
+    Returns False if the two schedules differ.
+    """
+    print("Amortization schedule. $300,000 at 3.0% p.a.")
+    if amortization.np is None:
+        print("NumPy is not installed. Only the loop is timed.")
+    print("{:>7} {:>12} {:>12} {:>8} {:>6}".format(
+            "Months", "Loop us", "NumPy us", "Speedup", "Same"))
+    passed = True
+    for total_payments in (12, 60, 120, 240, 360, 480):
+        loop = best_of(lambda: amortization.amortization_schedule(
+                300000, 3.0, total_payments, use_numpy=False), 200)
+        if amortization.np is None:
+            print("{:>7} {:>12.1f} {:>12} {:>8}".format(
+                    total_payments, loop * 1e6, "-", "-"))
+            continue
+        vector = best_of(lambda: amortization.amortization_schedule(
+                300000, 3.0, total_payments), 200)
+        # To a millionth of a cent. The closed form rounds differently.
+        same = amortization.np.allclose(
+                amortization.amortization_schedule(300000, 3.0, total_payments),
+                amortization.amortization_schedule(300000, 3.0, total_payments,
+                                                   use_numpy=False),
+                rtol=1e-9, atol=1e-6)
+        passed = passed and same
+        print("{:>7} {:>12.1f} {:>12.1f} {:>7.1f}x {:>6}".format(
+                total_payments, loop * 1e6, vector * 1e6, loop / vector,
+                "yes" if same else "NO"))
+    print()
+    return passed
+
+
+def bench_portfolio():
+    """ One vectorized pass per chunk of loans versus a schedule per loan. """
+    print("Portfolio schedules. Random loans of 1 to 30 years.")
+    if amortization.np is None:
+        print("NumPy is not installed. Skipped.")
+        print()
+        return
+    np = amortization.np
+    rng = np.random.default_rng(1)
+    print("{:>7} {:>10} {:>10} {:>10} {:>10}".format(
+            "Loans", "Loop s", "Per-loan s", "Batch s", "Totals s"))
+    for loans in (1000, 10000):
+        principal = rng.integers(1, 10, loans) * 100000.0
+        rate = rng.uniform(0, 8, loans).round(2)
+        years = rng.choice([1, 10, 15, 20, 30], loans)
+        terms = list(zip(principal, rate, years))
+        loop = best_of(lambda: [amortization.schedule(p, r, y, use_numpy=False)
+                                for p, r, y in terms], 1, 3)
+        single = best_of(lambda: [amortization.schedule(p, r, y)
+                                  for p, r, y in terms], 1, 3)
+        batch = best_of(lambda: amortization.portfolio(principal, rate, years), 1, 3)
+        totals = best_of(lambda: amortization.portfolio_cash_flows(
+                principal, rate, years), 1, 3)
+        print("{:>7} {:>10.3f} {:>10.3f} {:>10.3f} {:>10.3f}".format(
+                loans, loop, single, batch, totals))
+    print()
+
+
+def peak_bytes(func):
+    """ Peak Python memory allocated while func() runs. """
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_stream():
+    """
+    Memory of the list table, array('d') and the row generator. Returns
+    False if the array('d') schedule differs from amortization_schedule().
+    """
+    print("Schedule memory. Peak KiB to build, or to stream through a loop.")
+    print("{:>7} {:>10} {:>10} {:>10} {:>6}".format(
+            "Months", "Lists", "array('d')", "Generator", "Same"))
+    passed = True
+
+    def drain(rows):
+        for row in rows:
+            pass
+
+    for total_payments in (120, 480, 4800):
+        args = (300000, 3.0, total_payments)
+        lists = peak_bytes(lambda: amortization.amortization_schedule(*args, use_numpy=False))
+        flat = peak_bytes(lambda: amortization.schedule_array(*args))
+        stream = peak_bytes(lambda: drain(amortization.iter_schedule(*args)))
+        table = amortization.schedule_array(*args)
+        # Row by row, against the loop the array is filled from. Exact.
+        same = [table[i:i + 4].tolist() for i in range(0, len(table), 4)] == \
+            amortization.amortization_schedule(*args, use_numpy=False)
+        if amortization.np is not None:
+            # And the NumPy closed form, to a hundredth of a cent. Over 400
+            # years the loop drifts from it by about 4e-5.
+            same = same and amortization.np.allclose(
+                    amortization.np.frombuffer(table).reshape(-1, 4),
+                    amortization.amortization_schedule(*args), rtol=1e-9, atol=1e-4)
+        passed = passed and same
+        print("{:>7} {:>10.1f} {:>10.1f} {:>10.1f} {:>6}".format(
+                total_payments, lists / 1024, flat / 1024, stream / 1024,
+                "yes" if same else "NO"))
+    print()
+    return passed
+
+
+# Bridge calls for write_schedule() to write a table of any length in bulk.
+# One getCellRangeByPosition() and one setDataArray().
+WRITE_CALLS = 2
+
+
+def bench_write():
+    """
+    UNO calls to write the table. setDataArray() versus cell by cell.
+    Returns False if the bulk write takes more than WRITE_CALLS, or its
+    cells differ from those written one by one.
+    """
+    print("Amortization table write. UNO calls per recalculation.")
+    print("{:>7} {:>10} {:>10} {:>6}".format("Months", "Per-cell", "Bulk", "Same"))
+    passed = True
+    for total_payments in (12, 120, 480):
+        rows = amortization.amortization_schedule(300000, 3.0, total_payments)
+        counts = []
+        cells = []
+        for bulk in (False, True):
+            sheet = uno_mock.MockSheet(BRIDGE)
+            BRIDGE.reset()
+            calc.write_schedule(sheet, rows, total_payments, bulk=bulk)
+            counts.append(BRIDGE.total)
+            cells.append(sheet._data)
+        same = cells[0] == cells[1]
+        over = counts[1] > WRITE_CALLS
+        passed = passed and same and not over
+        print("{:>7} {:>10} {:>10} {:>6}".format(total_payments, *counts,
+                                                  "yes" if same else "NO") +
+              ("  OVER {}".format(WRITE_CALLS) if over else ""))
+    print()
+    return passed
+
+
+def bench_clear():
+    """ UNO calls to clear the table on scrollbar mouse-up. """
+    print("Amortization table clear. 500 rows x 4 columns.")
+    print("{:>10} {:>10} {:>8} {:>8}".format("Term from", "Term to", "Calls", "Saved"))
+    for previous, total_payments in ((500, 0), (480, 120), (120, 480), (240, 240)):
+        sheet = uno_mock.MockSheet(BRIDGE)
+        counter = {}
+        calc.clear_column(sheet, 0, calc.OFFSET, previous, total_payments, counter)
+        print("{:>10} {:>10} {:>8} {:>8}".format(
+                previous, total_payments, counter["calls"], counter["saved"]))
+    print()
+
+
+def drag_events(doc, count):
+    """ adjustmentValueChanged events of ScrollBar_2 dragged from 5 to 30 years. """
+    model = types.SimpleNamespace(Name="ScrollBar_2", ScrollValue=5,
+                                  Parent=types.SimpleNamespace(
+                                          Parent=types.SimpleNamespace(Parent=doc)))
+    source = types.SimpleNamespace(Model=model, Value=5)
+    event = types.SimpleNamespace(value=types.SimpleNamespace(Source=source))
+    for i in range(count):
+        model.ScrollValue = 5 + 25 * i // (count - 1)
+        yield event
+
+
+class ManualTimer():
+    """ threading.Timer on the mock clock. Fired by hand with run(). """
+
+    def __init__(self, clock, interval, function, args):
+        self.due = clock[0] + interval
+        self.function = function
+        self.args = args
+        self.cancelled = False
+        self.daemon = False
+
+    def start(self):
+        pass
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        if not self.cancelled:
+            self.function(*self.args)
+
+
+def bench_live():
+    """ 
+    UNO calls while dragging a scrollbar. 200 events, 10 ms apart. Returns
+    False if the last event is never recalculated.
+    """
+    print("Live recalculation while dragging. 200 events over 2 seconds.")
+    print("{:>28} {:>8} {:>8} {:>8}".format("", "Updates", "Calls", "Values"))
+    clock = [0.0]
+    trailing = True
+    monotonic = calc.time.monotonic
+    timer = calc.threading.Timer
+    calc.time.monotonic = lambda: clock[0]
+    calc.threading.Timer = lambda interval, function, args: ManualTimer(
+            clock, interval, function, args)
+
+    def fire_due():
+        """ Run the pending trailing update if its time has come. 1 if it ran. """
+        pending = calc.live_timer
+        if pending is None or pending.due > clock[0]:
+            return 0
+        pending.run()
+        return 1
+
+    try:
+        for label, mode in (("Inputs only (before)", None),
+                            ("Full table every event", "full"),
+                            ("Throttled, rows on screen", "live")):
+            doc = uno_mock.MockDocument(BRIDGE)
+            sheet = doc._sheets._elements["Amortization"]
+            # Loan amount and percent per annum, as set up by main().
+            sheet._data.update({(1, 1): 300000.0, (1, 2): 3.0})
+            calc.LIVE = mode == "live"
+            calc.live_last = 0.0
+            calc.live_timer = None
+            calc.table_rows = 60
+            updates = 0
+            BRIDGE.reset()
+            for event in drag_events(doc, 200):
+                clock[0] += 0.01
+                updates += fire_due()
+                before = calc.live_last
+                calc.cb_scrollbar_adjust(event)
+                if mode == "full":
+                    args = calc.read_inputs(sheet)
+                    calc.write_summary(sheet, *args)
+                    calc.write_schedule(sheet, amortization.amortization_schedule(
+                            args[0], args[1], args[3]), args[3])
+                    updates += 1
+                elif calc.live_last != before:
+                    updates += 1
+            last_event = clock[0]
+            if calc.live_timer is not None:
+                # No more events. The trailing update comes when it is due.
+                clock[0] = calc.live_timer.due
+                updates += fire_due()
+            if mode == "live" and calc.live_last < last_event:
+                trailing = False
+            print("{:>28} {:>8} {:>8} {:>8}".format(
+                    label, updates, BRIDGE.total, BRIDGE.values))
+    finally:
+        calc.time.monotonic = monotonic
+        calc.threading.Timer = timer
+        calc.LIVE = True
+    print("The last event recalculated." if trailing else "The last event was dropped.")
+    print()
+    return trailing
+
+
+def bench_cache():
+    """ recalculate() with the schedule cache, sliding the rate back and forth. """
+    print("Schedule cache. Rate slider 2.0% to 4.0% and back, 3 times. 30 years.")
+    print("{:>22} {:>10} {:>8} {:>8}".format("", "Total ms", "Hits", "Misses"))
+    positions = list(range(20, 41)) + list(range(39, 19, -1))
+    positions = positions * 3
+    for label, size, prewarm in (("No cache", 0, False), ("Cache", 256, False),
+                                 ("Cache, prewarmed", 256, True)):
+        sheet = uno_mock.MockSheet(BRIDGE)
+        sheet._data.update({(1, 1): 300000.0, (1, 2): 3.0, (1, 3): 30.0, (1, 4): 360.0})
+        calc.CACHE_SIZE = size
+        calc.schedule_cache = amortization.ScheduleCache(256)
+        calc.table_key = None
+        if prewarm:
+            calc.schedule_cache.prewarm(calc.slider_keys(300000.0, 3.0, 30)).join()
+        start = timeit.default_timer()
+        for step in positions:
+            sheet._data[(1, 2)] = step * 0.1
+            calc.recalculate(sheet)
+        elapsed = timeit.default_timer() - start
+        print("{:>22} {:>10.2f} {:>8} {:>8}".format(
+                label, elapsed * 1000, calc.schedule_cache.hits,
+                calc.schedule_cache.misses))
+    calc.CACHE_SIZE = amortization.CACHE_SIZE
+    calc.schedule_cache = amortization.ScheduleCache(calc.CACHE_SIZE)
+    calc.table_key = None
+    print()
+
+
+def legacy_update_chart(sheet, rows, total_payments):
+    """ The chart update as it was. Every recalculation re-ranges the chart. """
+    charts = sheet.Charts
+    chart = charts.getByIndex(0)
+    ranges = chart.getRanges()
+    ranges[0].EndRow = calc.OFFSET + total_payments - 1
+    chart.setRanges(ranges)
+
+
+def bench_chart():
+    """ Chart calls over 40 recalculations: 20 rate moves, then 20 term moves. """
+    print("Chart update. 20 rate moves at 30 years, then 20 term moves, 21 to 40 years.")
+    print("{:>30} {:>10} {:>10} {:>10}".format("", "setRanges", "Chart", "Max points"))
+    steps = [(3.0 + i * 0.1, 30) for i in range(20)] + [(5.0, 21 + i) for i in range(20)]
+    update_chart = calc.update_chart
+    for label, legacy, max_points in (("Re-range every time (before)", True, 0),
+                                      ("Only when rows change", False, 0),
+                                      ("Downsampled to 120 points", False, 120)):
+        sheet = uno_mock.MockSheet(BRIDGE)
+        calc.chart_range = None
+        calc.CHART_MAX_POINTS = max_points
+        if legacy:
+            calc.update_chart = legacy_update_chart
+        most = 0
+        BRIDGE.reset()
+        try:
+            for rate, years in steps:
+                sheet._data.update({(1, 1): 300000.0, (1, 2): rate,
+                                    (1, 3): float(years), (1, 4): years * 12.0})
+                calc.recalculate(sheet)
+                chart_range = sheet._charts._charts[0]._ranges[0]
+                most = max(most, chart_range.EndRow - chart_range.StartRow)
+        finally:
+            calc.update_chart = update_chart
+        chart_calls = sum(count for name, count in BRIDGE.calls.items()
+                          if "Chart" in name)
+        print("{:>30} {:>10} {:>10} {:>10}".format(
+                label, BRIDGE.calls["TableChart.setRanges"], chart_calls, most))
+    calc.CHART_MAX_POINTS = 0
+    calc.chart_range = None
+    print()
+
+
+def legacy_line(oDoc, oPage, x, y, width, height):
+    """ A grid line as draw_add_grid() created it, one property at a time. """
+    LineShape = oDoc.createInstance("com.sun.star.drawing.LineShape")
+    LineShape.setPosition(draw.Point(x, y))
+    LineShape.setSize(draw.Size(width, height))
+    LineShape.LayerID = 6
+    LineShape.LineColor = 0
+    LineShape.LineWidth = 10
+    LineShape.LineStyle = draw.DASH
+    LineShape.LineDash.Style = 1
+    LineShape.LineDash.Dots = 2
+    LineShape.LineDash.DotLen = 1
+    LineShape.LineDash.Dashes = 1
+    LineShape.LineDash.DashLen = 100
+    LineShape.LineDash.Distance = 50
+    oPage.add(LineShape)
+
+
+def legacy_pile(oDoc, oPage, x, y):
+    """ A pile as pile() created it, one property at a time. """
+    RectangleShape = oDoc.createInstance("com.sun.star.drawing.RectangleShape")
+    RectangleShape.setPosition(draw.Point(x, y))
+    RectangleShape.setSize(draw.Size(draw.PILE_X_SIZE, draw.PILE_Y_SIZE))
+    RectangleShape.LineColor = 0
+    RectangleShape.LineWidth = 10
+    RectangleShape.LayerID = 7
+    RectangleShape.FillStyle = draw.SOLID
+    RectangleShape.FillTransparence = 20
+    RectangleShape.FillColor = 0x0000FF
+    oPage.add(RectangleShape)
+
+
+def count_calls(func, *args):
+    """ Bridge calls made by func(*args). """
+    BRIDGE.reset()
+    func(*args)
+    return BRIDGE.total
+
+
+def bench_shapes():
+    """ UNO calls to draw the grids and pile layouts. Before and after batching. """
+    print("Shape creation. UNO calls.")
+    print("{:<26} {:>8} {:>8}".format("", "Before", "After"))
+
+    def legacy_grids(oDoc, oPage):
+        for spec in (draw.grid_line_specs(3000, 4000, 13, 11, 15000, 12500, {}) +
+                     draw.grid_line_specs(18000, 4000, 8, 5, 8750, 5000, {}, 1)):
+            legacy_line(oDoc, oPage, *(spec.position + spec.size))
+
+    def grids(oDoc, oPage):
+        draw.draw_add_grid(oDoc, oPage)
+        draw.draw_add_grid_supplement(oDoc, oPage)
+
+    def legacy_piles(oDoc, oPage):
+        for i in range(4):
+            for j in range(4):
+                legacy_pile(oDoc, oPage, i*4*draw.M1 + 2900, j*3.333*draw.M1 + 3900)
+
+    def piles(oDoc, oPage):
+        specs = [draw.pile_spec(i*4*draw.M1 + 2900, j*3.333*draw.M1 + 3900)
+                 for i in range(4) for j in range(4)]
+        draw.draw_shapes(oDoc, oPage, specs)
+
+    for name, before, after in (("Grids (36 lines)", legacy_grids, grids),
+                                ("Piles 4m x 3.33m (16)", legacy_piles, piles)):
+        counts = [count_calls(func, uno_mock.MockDrawDocument(BRIDGE),
+                              uno_mock.MockDrawPage(BRIDGE))
+                  for func in (before, after)]
+        print("{:<26} {:>8} {:>8}".format(name, *counts))
+    print()
+
+
+def bench_grid_style():
+    """ Grid lines with the GridDash style versus per-line dash properties. """
+    print("Grid lines. 1m and 10cm pitch over a 15m x 10m site.")
+    print("{:>6} {:>6} {:>13} {:>13} {:>13} {:>13}".format(
+            "Pitch", "Lines", "Calls before", "Values before",
+            "Calls after", "Values after"))
+    for pitch in (draw.M1, draw.M1 // 10):
+        columns = 15 * draw.M1 // pitch + 1
+        rows = 10 * draw.M1 // pitch + 1
+        specs = draw.grid_line_specs(3000, 4000, columns, rows, 15 * draw.M1,
+                                     10 * draw.M1, {}, pitch=pitch)
+        oDoc = uno_mock.MockDrawDocument(BRIDGE)
+        oPage = uno_mock.MockDrawPage(BRIDGE)
+        BRIDGE.reset()
+        for spec in specs:
+            legacy_line(oDoc, oPage, *(spec.position + spec.size))
+        before = (BRIDGE.total, BRIDGE.values)
+
+        oDoc = uno_mock.MockDocument(BRIDGE)
+        BRIDGE.reset()
+        properties = {"Style": draw.graphic_style(oDoc, "GridDash")}
+        specs = draw.grid_line_specs(3000, 4000, columns, rows, 15 * draw.M1,
+                                     10 * draw.M1, properties, pitch=pitch)
+        draw.draw_shapes(oDoc, oPage, specs)
+        after = (BRIDGE.total, BRIDGE.values)
+        print("{:>6} {:>6} {:>13} {:>13} {:>13} {:>13}".format(
+                pitch, len(specs), *(before + after)))
+
+    # An office that can't make the style still draws the lines dashed.
+    passed = True
+    for service in ("com.sun.star.style.Style", None):
+        oDoc = uno_mock.MockDrawDocument(BRIDGE)
+        if service:
+            oDoc._unknown_services.add(service)
+        oPage = uno_mock.MockDrawPage(BRIDGE)
+        stdout = sys.stdout
+        sys.stdout = io.StringIO()
+        try:
+            draw.draw_add_grid(oDoc, oPage)
+        finally:
+            sys.stdout = stdout
+        styled = "GridDash" in oDoc._style_families._elements["graphics"]._elements
+        dashed = all(shape._props.get("LineStyle") == draw.DASH or
+                     "Style" in shape._props for shape in oPage._shapes)
+        ok = bool(oPage._shapes) and dashed and styled == (service is None)
+        passed = passed and ok
+        print("{:<34} {}".format("Style refused, dash per line" if service else
+                                 "GridDash style", "ok" if ok else "FAILED"))
+    print()
+    return passed
+
+
+def legacy_update_label(oPage, sLabel):
+    """ The Page Label search as add_pile_0/1/2 did it. """
+    for i in range(oPage.getCount() - 1):
+        element = oPage.getByIndex(i)
+        if element.Name == "Page Label":
+            element.String = sLabel
+            break
+
+
+def bench_label():
+    """ UNO calls to update the Page Label as the page fills with shapes. """
+    print("Page Label update. UNO calls per button push.")
+    print("{:>8} {:>10} {:>10}".format("Shapes", "Scan", "Index"))
+    for count in (100, 1000, 10000):
+        oDoc = uno_mock.MockDrawDocument(BRIDGE)
+        oPage = uno_mock.MockDrawPage(BRIDGE)
+        specs = [draw.pile_spec(i, 0) for i in range(count - 1)]
+        draw.draw_shapes(oDoc, oPage, specs)
+        # Label last, the worst case for a scan.
+        label = oDoc.createInstance("com.sun.star.drawing.RectangleShape")
+        draw.shape_index(oPage).add(label, "Page Label", 5)
+        label.Name = "Page Label"
+        scan = count_calls(legacy_update_label, oPage, "Scan")
+        index = count_calls(draw.draw_update_page_label_string, oPage, "Index")
+        print("{:>8} {:>10} {:>10}".format(count, scan, index))
+    print()
+
+
+def legacy_clear_pile(oDoc, oPage):
+    """ clear_pile() as it was. Reads LayerID from every shape on the page. """
+    for i in range(oPage.getCount()-1, -1, -1):
+        element = oPage.getByIndex(i)
+        if element.LayerID == 7:
+            oPage.remove(element)
+
+
+def bench_clear_pile():
+    """ UNO calls and mock wall time to clear the piles off a page. """
+    print("Clear piles. 60 other shapes on the page.")
+    print("{:>8} {:>14} {:>14} {:>14}".format(
+            "Piles", "Scan calls", "Index calls", "Group calls"))
+    print("{:>8} {:>14} {:>14} {:>14}".format(
+            "", "Scan ms", "Index ms", "Group ms"))
+    for count in (1000, 10000, 100000):
+        specs = [draw.pile_spec(i % 1000 * 25, i // 1000 * 25) for i in range(count)]
+        results = []
+        for mode in ("scan", "index", "group"):
+            oDoc = uno_mock.MockDrawDocument(BRIDGE)
+            oPage = uno_mock.MockDrawPage(BRIDGE)
+            draw.draw_shapes(oDoc, oPage, [draw.pile_spec(0, 0)._replace(layer=6)] * 60)
+            if mode == "group":
+                draw.draw_shapes(oDoc, oPage, specs, draw.pile_group(oDoc, oPage))
+            else:
+                draw.draw_shapes(oDoc, oPage, specs)
+            BRIDGE.reset()
+            start = timeit.default_timer()
+            if mode == "scan":
+                legacy_clear_pile(oDoc, oPage)
+            else:
+                draw.clear_pile(oDoc, oPage)
+            elapsed = timeit.default_timer() - start
+            assert len(oPage._shapes) == 60
+            results.append((BRIDGE.total, elapsed * 1e3))
+        print("{:>8} {:>14} {:>14} {:>14}".format(
+                count, *(calls for calls, ms in results)))
+        print("{:>8} {:>14.1f} {:>14.1f} {:>14.1f}".format(
+                "", *(ms for calls, ms in results)))
+    print()
+
+
+def bench_layout():
+    """ UNO calls per button push as an estimator toggles between layouts. """
+    print("Pile layout switching. UNO calls per button push.")
+    print("{:<10} {:>18} {:>14}".format("Button", "Clear and redraw", "Reconcile"))
+    layouts = {"B0": draw.add_pile_0, "B1": draw.add_pile_1, "B2": draw.add_pile_2}
+    oDoc = uno_mock.MockDrawDocument(BRIDGE)
+    page_redraw = uno_mock.MockDrawPage(BRIDGE)
+    page_reconcile = uno_mock.MockDrawPage(BRIDGE)
+    for page in (page_redraw, page_reconcile):
+        draw.draw_border_text_field(oDoc, page)
+
+    for name in ("B0", "B1", "B1", "B2", "B0", "B0"):
+        def redraw(oDoc, oPage):
+            draw.clear_pile(oDoc, oPage)
+            layouts[name](oDoc, oPage)
+        before = count_calls(redraw, oDoc, page_redraw)
+        after = count_calls(layouts[name], oDoc, page_reconcile)
+        print("{:<10} {:>18} {:>14}".format(name, before, after))
+    print()
+
+
+def bench_batch():
+    """ Repaints and undo actions with and without uno_connection.batch_updates(). """
+    print("Batched document changes. Repaints and undo actions the office would do.")
+    print("{:<34} {:>8} {:>10} {:>10}".format("", "Calls", "Repaints", "Undo"))
+
+    def draw_plan(doc):
+        # As main() does.
+        page, lm = draw.draw_initialize(doc)
+        with uno_connection.batch_updates(doc, lock_undo=True):
+            draw.draw_plan(doc, page, lm, controls=False)
+
+    def add_piles(doc):
+        page, lm = draw.draw_initialize(doc)
+        for add_pile in (draw.add_pile_0, draw.add_pile_1, draw.add_pile_2):
+            add_pile(doc, page)
+
+    def recalculate(doc):
+        sheet = doc._sheets._elements["Amortization"]
+        sheet._data.update({(1, 1): 300000.0, (1, 2): 3.0, (1, 3): 30.0, (1, 4): 360.0})
+        calc.table_key = None
+        calc.chart_range = None
+        calc.recalculate(sheet, doc)
+
+    batch_updates = uno_connection.batch_updates
+    for label, job in (("draw_plan(), no controls", draw_plan), ("add_pile_0/1/2", add_piles),
+                       ("recalculate(), 30 years", recalculate)):
+        for batched in (False, True):
+            if not batched:
+                # Not locked: a context manager that does nothing.
+                uno_connection.batch_updates = lambda doc, lock_undo=False: (
+                        contextlib.nullcontext(doc))
+            if job is recalculate:
+                doc = uno_mock.MockDocument(BRIDGE)
+            else:
+                doc = uno_mock.MockDrawDocument(BRIDGE)
+            BRIDGE.reset()
+            try:
+                job(doc)
+            finally:
+                uno_connection.batch_updates = batch_updates
+            print("{:<34} {:>8} {:>10} {:>10}".format(
+                    label + (" batched" if batched else ""), BRIDGE.total,
+                    BRIDGE.repaints, BRIDGE.undo_actions))
+    for page, index in list(draw.shape_indexes):
+        draw.drop_shape_index(page)
+    print()
+
+
+def page_shapes(page):
+    """ (type, position, size, layer, name, text) of each shape, piles ungrouped. """
+    shapes = []
+    for shape in page._shapes:
+        if shape._kind == "GroupShape":
+            shapes += page_shapes(shape)
+            continue
+        shapes.append((shape._kind, shape._position, shape._size, shape._props["LayerID"],
+                       shape._props["Name"], shape._props["String"]))
+    return sorted(shapes)
+
+
+def bench_scene():
+    """ The plan built and rendered offline, and replayed into UNO, versus draw_plan(). """
+    print("Floor plan scene. Built and rendered with no office.")
+    variant = dict(floor_plan_scene.DEFAULTS)
+    variant.update(name="plan", columns=10, rows=10, x_spacing=1.5, y_spacing=1.2)
+    for label, columns in (("3 x 3 piles", 3), ("10 x 10 piles", 10)):
+        variant.update(columns=columns, rows=columns)
+        build = best_of(lambda: floor_plan_scene.variant_scene(variant), 50)
+        scene = floor_plan_scene.variant_scene(variant)
+        svg = best_of(lambda: floor_plan_scene.to_svg(scene), 50)
+        fodg = best_of(lambda: floor_plan_scene.to_fodg(scene), 50)
+        print("{:<14} build {:>6.2f}ms  SVG {:>6.2f}ms  ODG {:>6.2f}ms  {} shapes".format(
+                label, build * 1000, svg * 1000, fodg * 1000, len(scene.shapes)))
+
+    print("Into a document, 3 x 3 piles, no controls. UNO calls.")
+    variant.update(columns=3, rows=3, x_spacing=6.0, y_spacing=5.0)
+
+    def live(doc):
+        # As draw_batch.draw_variant() does.
+        page, lm = draw.draw_initialize(doc)
+        draw.draw_plan(doc, page, lm, controls=False)
+        draw.layout_piles(doc, page, floor_plan_scene.variant_positions(variant))
+        draw.draw_update_page_label_string(page, floor_plan_scene.variant_label(variant))
+        return page
+
+    def replay(doc):
+        page, lm = draw.draw_initialize(doc)
+        draw.draw_remove_layer(lm)
+        draw.draw_add_layer(lm)
+        draw.draw_a4_landscape(page)
+        draw.draw_scene(doc, page, floor_plan_scene.variant_scene(variant))
+        return page
+
+    pages = []
+    for name, job in (("draw_plan()", live), ("draw_scene()", replay)):
+        BRIDGE.reset()
+        pages.append(job(uno_mock.MockDrawDocument(BRIDGE)))
+        print("{:<14} {:>6} calls".format(name, BRIDGE.total))
+    print("Same shapes:", page_shapes(pages[0]) == page_shapes(pages[1]))
+    for page, index in list(draw.shape_indexes):
+        draw.drop_shape_index(page)
+    print()
+
+
+def bench_pile_layout():
+    """ Pile positions for a site. The nested loop of add_pile_0/1/2 versus pile_grid(). """
+    print("Pile layout. Positions snapped to whole 1/100 mm, best time.")
+    print("{:<24} {:>12} {:>12}".format("", "Loop", "pile_grid()"))
+
+    def loop(columns, rows):
+        positions = []
+        for i in range(columns):
+            for j in range(rows):
+                positions.append((i*0.5*draw.M1 + 2900, j*0.4*draw.M1 + 3900))
+        return set((int(round(x)), int(round(y))) for x, y in positions)
+
+    def grid(columns, rows):
+        return set(map(tuple, floor_plan_scene.pile_grid(columns, rows, 0.5, 0.4).tolist()))
+
+    for columns, rows in ((4, 4), (40, 25), (100, 100), (400, 250)):
+        if floor_plan_scene.np is None:
+            print("NumPy is not installed.")
+            break
+        assert loop(columns, rows) == grid(columns, rows)
+        number = max(1, 20000 // (columns * rows))
+        print("{:<24} {:>10.3f}ms {:>10.3f}ms".format(
+                "{} piles".format(columns * rows),
+                best_of(lambda: loop(columns, rows), number) * 1000,
+                best_of(lambda: grid(columns, rows), number) * 1000))
+
+    # Into a document. The bridge has no bulk add, so each new pile is
+    # still its own createInstance() and add(), inside one batch.
+    doc = uno_mock.MockDrawDocument(BRIDGE)
+    page = uno_mock.MockDrawPage(BRIDGE)
+    BRIDGE.reset()
+    draw.layout_piles(doc, page, floor_plan_scene.pile_grid(100, 100, 0.5, 0.4))
+    calls = BRIDGE.total
+    BRIDGE.reset()
+    moved = draw.layout_piles(doc, page, floor_plan_scene.pile_grid(100, 100, 0.5, 0.4))
+    print("layout_piles() of 10000 piles: {} calls, again: {} calls {}".format(
+            calls, BRIDGE.total, moved))
+    draw.drop_shape_index(page)
+    print()
+
+
+def legacy_region(oPage, box, nLayer):
+    """ Shapes in box found by walking the page, as there was no other way. """
+    x0, y0, x1, y1 = box
+    found = []
+    for i in range(oPage.getCount()):
+        shape = oPage.getByIndex(i)
+        if shape.LayerID != nLayer:
+            continue
+        position = shape.getPosition()
+        size = shape.getSize()
+        if (position.X <= x1 and x0 <= position.X + size.Width and
+                position.Y <= y1 and y0 <= position.Y + size.Height):
+            found.append(shape)
+    return found
+
+
+def bench_spatial():
+    """ Region and point queries. A walk of every shape versus the SpatialGrid. """
+    print("Spatial index. 100,000 piles 0.5m apart, 4m x 3m bay query, best time.")
+    boxes = [(x, y, x + draw.PILE_X_SIZE, y + draw.PILE_Y_SIZE)
+             for x, y in floor_plan_scene.pile_grid(400, 250, 0.5, 0.5)]
+    grids = []
+
+    def build_grid():
+        grid = floor_plan_scene.SpatialGrid()
+        for i, box in enumerate(boxes):
+            grid.insert(i, box)
+        grids[:] = [grid]
+
+    build = best_of(build_grid, 1, 3)
+    grid = grids[0]
+    items = list(range(len(boxes)))
+    bay = (50000, 40000, 50000 + 4 * draw.M1, 40000 + 3 * draw.M1)
+
+    def walk(box):
+        x0, y0, x1, y1 = box
+        return [i for i, (ix0, iy0, ix1, iy1) in zip(items, boxes)
+                if ix0 <= x1 and x0 <= ix1 and iy0 <= y1 and y0 <= iy1]
+
+    assert sorted(walk(bay)) == sorted(grid.query(bay))
+    print("Build {:.0f}ms for {} boxes".format(build * 1000, len(grid)))
+    print("{:<16} {:>12} {:>12} {:>8}".format("", "Walk", "Grid", "Found"))
+    # The centre of a pile in the bay.
+    x0, y0, x1, y1 = boxes[grid.query(bay)[0]]
+    point = ((x0 + x1) // 2, (y0 + y1) // 2) * 2
+    for label, box in (("Bay", bay), ("Point", point)):
+        print("{:<16} {:>10.2f}ms {:>10.3f}ms {:>8}".format(
+                label, best_of(lambda: walk(box), 3) * 1000,
+                best_of(lambda: grid.query(box), 100) * 1000, len(grid.query(box))))
+
+    print("On a page. UNO calls to find the grid lines in one bay, 2000 lines.")
+    oDoc = uno_mock.MockDrawDocument(BRIDGE)
+    oPage = uno_mock.MockDrawPage(BRIDGE)
+    draw.draw_shapes(oDoc, oPage, draw.grid_line_specs(0, 0, 1000, 1000, 1000 * 200,
+                                                       1000 * 200, {}, pitch=200))
+    bay = (3000, 4000, 3000 + 4 * draw.M1, 4000 + 3 * draw.M1)
+    walk_calls = count_calls(legacy_region, oPage, bay, 6)
+    index_calls = count_calls(draw.shape_index(oPage).region, bay, 6)
+    assert len(legacy_region(oPage, bay, 6)) == len(draw.shape_index(oPage).region(bay, 6))
+    print("{:<16} {:>12}".format("Walk", walk_calls))
+    print("{:<16} {:>12}".format("region()", index_calls))
+    draw.drop_shape_index(oPage)
+
+    oDoc = uno_mock.MockDrawDocument(BRIDGE)
+    oPage = uno_mock.MockDrawPage(BRIDGE)
+    draw.layout_piles(oDoc, oPage, floor_plan_scene.pile_grid(100, 100, 0.5, 0.4))
+    print("clear_piles_in() one bay of 10,000 piles: {} calls, {} removed".format(
+            count_calls(draw.clear_piles_in, oDoc, oPage, bay),
+            10000 - len(draw.pile_positions(oDoc, oPage))))
+    draw.drop_shape_index(oPage)
+    print()
+
+
+def bench_trace():
+    """ draw_uno_plan.main() traced by uno_trace, and the cost of tracing. """
+    import uno_trace
+    print("Bridge call trace of draw_uno_plan.main().")
+    stdout = sys.stdout
+
+    def run_main():
+        sys.stdout = io.StringIO()
+        try:
+            draw.main()
+        finally:
+            sys.stdout = stdout
+
+    try:
+        run_main()
+        off = best_of(run_main, 5)
+        tracer = uno_trace.enable()
+        # The ShapeIndex of the untraced runs holds the page unwrapped.
+        for page, index in list(draw.shape_indexes):
+            draw.drop_shape_index(page)
+        on = best_of(run_main, 5)
+        tracer.reset()
+        BRIDGE.reset()
+        run_main()
+    finally:
+        uno_trace.disable()
+    tracer.report(top=6)
+    print("Calls seen by the bridge: {}. Traced: {}.".format(BRIDGE.total, tracer.total()[0]))
+    print("main() on the mock: {:.1f}ms untraced, {:.1f}ms traced.".format(
+            off * 1000, on * 1000))
+    connection = uno_connection.get_connection()
+    print("get_desktop() with tracing off: {:.2f}us".format(
+            best_of(connection.get_desktop, 10000) * 1e6))
+    print()
+
+
+def bench_startup():
+    """ Phases of draw_uno_plan.main(), with 0.1 ms modelled per bridge call. """
+    print("draw_uno_plan.main() latency. 0.1 ms per bridge call.")
+    phases = ("connect", "initialize", "clear", "ready", "draw")
+    print("{:<12}".format("Run") + "".join("{:>11}".format(p) for p in phases) +
+          "{:>11}".format("Total"))
+    BRIDGE.latency = 0.0001
+    stdout = sys.stdout
+    try:
+        for run in ("First", "Redraw"):
+            sys.stdout = io.StringIO()
+            try:
+                timings = draw.main()
+            finally:
+                sys.stdout = stdout
+            times = dict(timings.phases)
+            print("{:<12}".format(run) +
+                  "".join("{:>9.1f}ms".format(times[p] * 1000) for p in phases) +
+                  "{:>9.1f}ms".format(timings.total() * 1000))
+    finally:
+        BRIDGE.latency = 0.0
+    print("The fixed time.sleep(2) it replaces was 2000ms on every run.")
+    print()
+
+
+def legacy_main_initialize():
+    """ main_initialize() as it was. A new resolver and resolve() per call. """
+    localContext = uno.getComponentContext()
+    resolver = localContext.ServiceManager.createInstanceWithContext(
+            "com.sun.star.bridge.UnoUrlResolver", localContext)
+    ctx = resolver.resolve(uno_connection.CONNECT_STRING)
+    smgr = ctx.ServiceManager
+    desktop = smgr.createInstanceWithContext("com.sun.star.frame.Desktop", ctx)
+    return desktop, desktop.getCurrentComponent()
+
+
+def bench_connect():
+    """ Callback dispatch. Cold (resolve each time) versus the cached connection. """
+    # Modelled costs. Replace with numbers measured against a real office.
+    BRIDGE.latency = 0.0002
+    BRIDGE.connect_latency = 0.02
+    print("Callback connect. Mock bridge: {} ms per call, {} ms per resolve().".format(
+            BRIDGE.latency * 1e3, BRIDGE.connect_latency * 1e3))
+    print("{:<28} {:>8} {:>10}".format("", "Calls", "ms"))
+    BRIDGE.components.append(uno_mock.MockDocument(BRIDGE))
+    connection = uno_connection.Connection()
+
+    def cold():
+        legacy_main_initialize()
+
+    def first():
+        connection.get_desktop().getCurrentComponent()
+
+    def warm():
+        connection.get_desktop().getCurrentComponent()
+
+    for name, func in (("Cold, resolve every call", cold),
+                       ("Shared connection, first", first),
+                       ("Shared connection, warm", warm)):
+        BRIDGE.reset()
+        start = timeit.default_timer()
+        func()
+        elapsed = timeit.default_timer() - start
+        print("{:<28} {:>8} {:>10.2f}".format(name, BRIDGE.total, elapsed * 1e3))
+    BRIDGE.latency = BRIDGE.connect_latency = 0.0
+    BRIDGE.components.pop()
+    print()
+
+
+def pool_variants(count):
+    """ count variants with the default layout, named v00, v01, ... """
+    return [dict(floor_plan_scene.DEFAULTS, name="v{:02d}".format(i)) for i in range(count)]
+
+
+def bench_pool():
+    """ 
+    office_pool.OfficePool on uno_mock.MockOffice workers. A worker killed
+    mid-job, and one that then fails to restart. Then draw_batch jobs per
+    second at 1, 2 and 4 workers. Returns False if a check fails.
+    """
+    print("Office pool on mock offices.")
+    passed = True
+    stdout = sys.stdout
+
+    def check(name, ok):
+        nonlocal passed
+        passed = passed and ok
+        print("{:<44} {}".format(name, "ok" if ok else "FAILED"))
+
+    def run_map(workers, variants, out_dir, crash=None, fail_restart=False, job=None):
+        """ pool.map() of render_variant(). crash is the worker killed mid-job. """
+        pool = office_pool.OfficePool(workers, office_factory=lambda: uno_mock.MockOffice(
+                "socket", sleep=True))
+        pool.start()
+        if crash is not None:
+            # Part way into its first document.
+            pool.workers[crash].kill(after_calls=20)
+            if fail_restart:
+                pool.workers[crash].fail_starts = 1
+        job = job or (lambda desktop, variant: draw_batch.render_variant(
+                desktop, variant, out_dir, ["odg"]))
+        try:
+            results = pool.map(job, variants)
+        finally:
+            pool.stop()
+        return pool, results
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        variants = pool_variants(6)
+        pool, results = run_map(2, variants, out_dir, crash=0)
+        check("Killed mid-job: retried, worker restarted",
+              results == [None] * len(variants) and pool.retries == 1 and
+              pool.restarts == 1 and
+              all(draw_batch.is_done(v, out_dir, ["odg"]) for v in variants))
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        variants = pool_variants(6)
+        pool, results = run_map(2, variants, out_dir, crash=0, fail_restart=True)
+        check("Restart failed: other worker ran the jobs",
+              results == [None] * len(variants) and pool.retries == 1 and
+              pool.restarts == 0)
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        variants = pool_variants(3)
+        pool, results = run_map(1, variants, out_dir, crash=0, fail_restart=True)
+        check("Restart failed, no worker left: RuntimeError",
+              all(isinstance(r, RuntimeError) and "No office worker left" in str(r)
+                  for r in results) and pool.retries == 1 and pool.restarts == 0)
+
+    def failing_job(desktop, variant):
+        raise ValueError("bad variant")
+
+    pool, results = run_map(2, pool_variants(3), None, job=failing_job)
+    check("Job failed, office alive: not retried",
+          all(isinstance(r, ValueError) for r in results) and
+          pool.retries == 0 and pool.restarts == 0)
+
+    # Throughput. The workers are threads in this process over the mock's
+    # slept socket latency, so this measures the pool's overlap of bridge
+    # waits, not soffice's own CPU. Includes starting the pool.
+    print("draw_batch.run_pool(), 16 variants, odg, mock socket latency.")
+    print("{:<10} {:>8} {:>10} {:>8}".format("Workers", "Seconds", "Jobs/s", "Speedup"))
+    variants = pool_variants(16)
+    base = None
+    for workers in (1, 2, 4):
+        with tempfile.TemporaryDirectory() as out_dir:
+            start = timeit.default_timer()
+            sys.stdout = io.StringIO()
+            try:
+                done, skipped, failed = draw_batch.run_pool(
+                        variants, out_dir, ["odg"], workers,
+                        office_factory=lambda: uno_mock.MockOffice("socket", sleep=True))
+            finally:
+                sys.stdout = stdout
+            elapsed = timeit.default_timer() - start
+        if done != len(variants):
+            check("{} workers rendered every variant".format(workers), False)
+        rate = done / elapsed
+        base = base or rate
+        print("{:<10} {:>8.2f} {:>10.1f} {:>7.1f}x".format(workers, elapsed, rate, rate / base))
+    print()
+    return passed
+
+
+# Bridge calls allowed for each step of budget_steps(). The counts on the
+# mock are exact, so a change that adds calls fails the "budgets" benchmark
+# until its budget is raised, on purpose. For CI:
+# $ python3 benchmarks.py budgets
+BUDGETS = {
+    "draw_uno_plan.main()": 430,
+    "button_push_event() B0": 64,
+    "button_push_event() B1": 37,
+    "button_push_event() B2": 45,
+    "calc main()": 224,
+    "cb_scrollbar_mouse_up()": 30,
+}
+
+
+def budget_steps():
+    """ 
+    (name, function) for each step of a session from a new office: draw the
+    plan, push each button, build the workbook, release a slider.
+    """
+    def draw_main():
+        draw.main()
+
+    def push(name):
+        form = BRIDGE.components[-1]._pages[0]._forms._forms[0]
+        index = [model._props["Name"] for model in form._models].index(name)
+        uno_mock.fire(form, index, "actionPerformed",
+                      uno_mock.control_event(form._models[index]))
+
+    def calc_main():
+        # The script registers its callbacks under its own file name.
+        argv0 = sys.argv[0]
+        sys.argv[0] = calc.__file__
+        try:
+            calc.main()
+        finally:
+            sys.argv[0] = argv0
+
+    def mouse_up():
+        sheet = BRIDGE.components[-1]._sheets._elements["Amortization"]
+        form = sheet._draw_page._forms._forms[0]
+        model = form._models[0]
+        model._props["ScrollValue"] = 40
+        event = types.SimpleNamespace(value=uno_mock.control_event(model, Value=40))
+        uno_mock.fire(form, 0, "mouseReleased", event)
+
+    return [("draw_uno_plan.main()", draw_main),
+            ("button_push_event() B0", lambda: push("B0")),
+            ("button_push_event() B1", lambda: push("B1")),
+            ("button_push_event() B2", lambda: push("B2")),
+            ("calc main()", calc_main),
+            ("cb_scrollbar_mouse_up()", mouse_up)]
+
+
+def new_session():
+    """ As if a new office and new Python: no connection, documents or caches. """
+    uno_connection._connection = None
+    del BRIDGE.components[:]
+    del draw.shape_indexes[:]
+    calc.table_key = calc.table_rows = calc.chart_range = None
+    calc.schedule_cache = amortization.ScheduleCache(calc.CACHE_SIZE)
+
+
+def bench_budgets():
+    """ 
+    Bridge calls of a session against BUDGETS, and its time modelled for
+    each of uno_mock.PROFILES. Returns False if over budget.
+    """
+    profiles = list(uno_mock.PROFILES)
+    print("Bridge call budgets. Modelled ms per profile, not slept.")
+    print("{:<26} {:>7} {:>7}".format("Step", "Calls", "Budget") +
+          "".join("{:>11}".format(p) for p in profiles))
+    results = {}
+    stdout = sys.stdout
+    BRIDGE.sleep = False
+    try:
+        for profile in profiles:
+            BRIDGE.use_profile(profile)
+            new_session()
+            for name, step in budget_steps():
+                BRIDGE.reset()
+                sys.stdout = io.StringIO()
+                try:
+                    step()
+                finally:
+                    sys.stdout = stdout
+                results.setdefault(name, []).append((BRIDGE.total, BRIDGE.elapsed))
+    finally:
+        BRIDGE.latency = BRIDGE.connect_latency = 0.0
+        BRIDGE.sleep = True
+        new_session()
+    passed = True
+    for name, runs in results.items():
+        calls = runs[0][0]
+        assert all(count == calls for count, elapsed in runs), name
+        over = calls > BUDGETS[name]
+        passed = passed and not over
+        print("{:<26} {:>7} {:>7}".format(name, calls, BUDGETS[name]) +
+              "".join("{:>9.1f}ms".format(elapsed * 1000) for count, elapsed in runs) +
+              ("  OVER" if over else ""))
+    print("Within budget." if passed else "Over budget.")
+    print()
+    return passed
+
+
+BENCHMARKS = {
+    "schedule": bench_schedule,
+    "portfolio": bench_portfolio,
+    "stream": bench_stream,
+    "write": bench_write,
+    "clear": bench_clear,
+    "live": bench_live,
+    "cache": bench_cache,
+    "chart": bench_chart,
+    "batch": bench_batch,
+    "startup": bench_startup,
+    "trace": bench_trace,
+    "budgets": bench_budgets,
+    "scene": bench_scene,
+    "pile_layout": bench_pile_layout,
+    "spatial": bench_spatial,
+    "shapes": bench_shapes,
+    "grid_style": bench_grid_style,
+    "label": bench_label,
+    "clear_pile": bench_clear_pile,
+    "layout": bench_layout,
+    "connect": bench_connect,
+    "pool": bench_pool,
+}
+
+
+def main(names):
+    """ 
+    Run the named benchmarks, or all of them. Exits 1 if any check fails,
+    e.g. bench_budgets().
+    """
+    failed = []
+    for name in names or BENCHMARKS:
+        if name not in BENCHMARKS:
+            sys.exit("Unknown benchmark: {}. Choose from: {}".format(
+                    name, ", ".join(BENCHMARKS)))
+        if BENCHMARKS[name]() is False:
+            failed.append(name)
+    if failed:
+        sys.exit("Failed: " + ", ".join(failed))
+
+
+if __name__ == "__main__":
+
+    main(sys.argv[1:])
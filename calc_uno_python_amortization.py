@@ -12,6 +12,10 @@
 # May be saved and run from other folders, so long as a copy also exists in
 # ~/.config/libreoffice/4/user/Scripts/python/ for the callbacks.
 #
+# Requires amortization.py and uno_connection.py. For the callbacks they must
+# be importable from
+# ~/.config/libreoffice/4/user/Scripts/python/pythonpath/
+#
 # The two callbacks display in Control Properties --> Events, as:
 # calc_uno_python_amortization.py$cb_scrollbar_mouse_up (user, Python)
 # calc_uno_python_amortization.py$cb_scrollbar_adjust (user, Python)
@@ -24,6 +28,14 @@
 import uno
 import sys
 import os
+import itertools
+import threading
+import time
+
+# Loan schedule maths. No uno import so may be used outside of LibreOffice.
+import amortization
+# Shared, cached connection to the office. Also used by the Draw script.
+import uno_connection
 
 # Constants
 
@@ -52,6 +64,47 @@ FILE_URL = 'file://' +  FILE_PATH_NAME
 # OFFSET is used for Row on Spreadsheet where Table commences
 OFFSET = 10
 
+# Write the table with one setDataArray() call. False writes cell by cell.
+BULK_WRITE = True
+
+# Live recalculation while a scrollbar is dragged. cb_scrollbar_adjust()
+# recalculates at most once per LIVE_INTERVAL seconds, and writes only the
+# summary cells and the table rows on screen. Events in between just set the
+# input cell, and the last of them is recalculated LIVE_INTERVAL later, so a
+# change from the keyboard, with no mouse release, is not left undone. The
+# full table and the chart follow on mouse release.
+LIVE = True
+LIVE_INTERVAL = 0.1
+# time.monotonic() of the last live recalculation.
+live_last = 0.0
+# threading.Timer of the pending trailing recalculation, or None.
+live_timer = None
+live_lock = threading.Lock()
+
+# Schedules already sent to setDataArray(), by slider position. Moving a
+# scrollbar back to where it was then costs no computation. Set CACHE_SIZE
+# to 0 to turn the cache off. With CACHE_PREWARM, every position reachable
+# by moving one scrollbar is computed in the background after a recalculation.
+CACHE_SIZE = amortization.CACHE_SIZE
+CACHE_PREWARM = False
+schedule_cache = amortization.ScheduleCache(CACHE_SIZE)
+# (principal, interest_percent, total_payments) of the table last written.
+table_key = None
+prewarm_thread = None
+
+# Chart. Its range is only set when the rows plotted change. Terms over
+# CHART_MAX_POINTS months are plotted from a copy of every k-th month, and
+# the last, in the 3 columns from CHART_COLUMN, so the chart reads no more
+# than that many rows. 0 plots every month.
+CHART_MAX_POINTS = 0
+CHART_COLUMN = 26  # Column AA. Clear of the table and the chart.
+# (StartColumn, EndRow) of the chart's range, once known in this process.
+chart_range = None
+
+# Rows currently written in the table. None until recalculate() has run in
+# this process. Used to only clear the rows left over when the term shrinks.
+table_rows = None
+
 from com.sun.star.beans import PropertyValue
 # Get UNO structures.
 from com.sun.star.awt import Size
@@ -65,41 +118,42 @@ from com.sun.star.chart.ChartLegendPosition import BOTTOM
 from com.sun.star.table.CellHoriJustify import CENTER
 from com.sun.star.awt.FontWeight import NORMAL
 from com.sun.star.awt.FontWeight import BOLD   
+from com.sun.star.sheet.CellFlags import VALUE, DATETIME, STRING, FORMULA
+
+# Contents cleared by clear_column(). Leaves the cell formats in place.
+CLEAR_FLAGS = VALUE | DATETIME | STRING | FORMULA
     
 
 def main_initialize_not_embedded():
     """ Create a Calc document and return desktop and doc """
-    # get the uno component context from the PyUNO runtime
-    localContext = uno.getComponentContext()
-    # create the UnoUrlResolver
-    resolver = localContext.ServiceManager.createInstanceWithContext(
-	    "com.sun.star.bridge.UnoUrlResolver", localContext )
-    
+    # Shared connection to the running office. If none is listening, a
+    # headless office is launched. See uno_connection.connect_or_launch()
     try:    
-        # connect to the running office
-        ctx = resolver.resolve( 
-            "uno:socket,host=localhost,port=2002;urp;StarOffice.ComponentContext" )
+        connection = uno_connection.connect_or_launch()
+        desktop = connection.get_desktop()
+    except FileNotFoundError as e:
+        # No office listening, and none installed to launch.
+        print("Error:", e)
+        sys.exit("Exiting...")
+    except (RuntimeError, TimeoutError) as e:
+        # A launched office that exited, or did not answer in time. Python
+        # exceptions, with no typeName. See office_pool.OfficeProcess.start()
+        print("Error: Launching LibreOffice failed:", e)
+        sys.exit("Exiting...")
     except Exception as e:
-        if e.typeName == "com.sun.star.connection.NoConnectException":
+        if getattr(e, "typeName", None) == "com.sun.star.connection.NoConnectException":
             print("Error: No Connection to LibreOffice.")
             # .NoConnectException: Connector : couldn't connect to socket (Connection refused)
             print('The following command must have been executed from a separate terminal window:')
             #print('$ soffice "-accept=socket,host=localhost,port=2002;urp;"') <-- deprecated
-            #print('$ soffice "--accept=socket,host=localhost,port=2002;urp;"')
-            print('$ soffice "--accept=socket,host=localhost,port=2083;urp;StarOffice.ServiceManager"')
+            print('$ soffice "--accept=socket,host=localhost,port=2002;urp;StarOffice.ServiceManager"')
             print()            
             
             sys.exit("Exiting...")
         else:
-            print("Error type:", e.typeName)
+            print("Error type:", getattr(e, "typeName", type(e).__name__))
             sys.exit("Exiting...") 
     
-    # https://wiki.openoffice.org/wiki/Documentation/DevGuide/ProUNO/Characteristics_of_the_Interprocess_Bridge
-    # "uno:socket,host=localhost,port=2002;urp,Negotiate=0,ForceSynchronous=0;StarOffice.ServiceManager"
-    smgr = ctx.ServiceManager
-    # get the central desktop object
-    desktop = smgr.createInstanceWithContext( "com.sun.star.frame.Desktop",ctx)
-    
     # access the current document. i.e. the model
     #doc = desktop.getCurrentComponent()
 
@@ -161,7 +215,12 @@ def setup_cell_format(doc, sheet):
 
 
 def setup_slider_initial(doc, sheet):
-    """ Insert the Form control sliders """
+    """ Insert the Form control sliders. No repaints or undo until done. """
+    with uno_connection.batch_updates(doc, lock_undo=True):
+        _setup_slider_initial(doc, sheet)
+
+
+def _setup_slider_initial(doc, sheet):
     draw_page = sheet.DrawPage
     
     # A form is required to hold the Scrollbars.
@@ -415,11 +474,49 @@ def cb_scrollbar_adjust(event):
         # The cheap and nastie bug reporting system !
         with open("bug.txt", "w") as fout:
             fout.write("Didn't find the name ScrollBar_?\n")
+        return
+
+    # Coalesce the stream of events while dragging. One that comes too soon
+    # after the last recalculation is left to the trailing one.
+    global live_last, live_timer
+    if not LIVE:
+        return
+    doc = event.value.Source.Model.Parent.Parent.Parent
+    with live_lock:
+        live_cancel()
+        wait = LIVE_INTERVAL - (time.monotonic() - live_last)
+        if wait <= 0:
+            live_recalculate(sheet, doc)
+            live_last = time.monotonic()
+        else:
+            live_timer = threading.Timer(wait, live_trailing, (sheet, doc))
+            live_timer.daemon = True
+            live_timer.start()
+
+
+def live_trailing(sheet, doc):
+    """ The live recalculation of the last event of a burst. Runs on a Timer. """
+    global live_last, live_timer
+    with live_lock:
+        live_timer = None
+        live_recalculate(sheet, doc)
+        live_last = time.monotonic()
+
+
+def live_cancel():
+    """ Drop the pending trailing recalculation, if any. """
+    global live_timer
+    if live_timer is not None:
+        live_timer.cancel()
+        live_timer = None
 
 
 def cb_scrollbar_mouse_up(event):
     """ On Scrollbar Mouse_up then redo the calculations """
     #as com.sun.star.awt.MouseEvent
+    # The full recalculation below replaces any trailing live one.
+    with live_lock:
+        live_cancel()
     sheet = event.value.Source.Model.Parent.Parent.Parent.Sheets.getByName("Amortization")
  
     if event.value.Source.Model.Name == "ScrollBar_0":
@@ -444,94 +541,243 @@ def cb_scrollbar_mouse_up(event):
         with open("bug.txt", "w") as fout:
             fout.write("Didn't find the name ScrollBar_?\n")
      
-    # Clear the months column. 
-    clear_column(sheet, 0, OFFSET, 500)    
-    recalculate(sheet)
-
-
-def clear_column(sheet, col, row, length):
-    """ Do this by range. Clear all columns """
+    # Clear the months column. Only rows beyond the new term need clearing,
+    # as recalculate() overwrites the rest.
+    cell = sheet.getCellByPosition(1, 4)
+    total_payments = int(cell.Value)
+    if table_rows is None:
+        # Not known in this process yet. e.g. first callback after loading.
+        clear_column(sheet, 0, OFFSET, 500, total_payments)
+    else:
+        clear_column(sheet, 0, OFFSET, table_rows, total_payments)
+    recalculate(sheet, event.value.Source.Model.Parent.Parent.Parent)
+
+
+def clear_column(sheet, col, row, length, keep=0, counter=None):
+    """ 
+    Do this by range. Clear the 4 table columns for rows row + keep to
+    row + length - 1 with one clearContents() call. Cell formats are kept.
+    Rows before keep are left alone as they are about to be overwritten.
+    If counter (a dict) is given, add the calls made, and the calls saved
+    compared with setting String = "" cell by cell, to it.
+    """
     #oSheet = ThisComponent.Sheets.getByName("Amortization")    
-    for i in range (0, length):
-        for j in range (0, 4):
-            cell = sheet.getCellByPosition(j + col, i + row)    
-            cell.String = "" 
+    calls = 0
+    if keep < length:
+        cell_range = sheet.getCellRangeByPosition(
+                col, row + keep, col + 3, row + length - 1)
+        cell_range.clearContents(CLEAR_FLAGS)
+        calls = 2
+        
+    if counter is not None:
+        # The cell by cell loop was getCellByPosition() plus .String per cell.
+        counter["calls"] = counter.get("calls", 0) + calls
+        counter["saved"] = counter.get("saved", 0) + length * 4 * 2 - calls
+
+
+def write_schedule(sheet, amortization_array, total_payments, bulk=None):
+    """ 
+    Write months 1 to total_payments into the table, starting at row OFFSET.
+    Bulk mode sends the whole block in one setDataArray() call. Otherwise
+    each cell is written on its own, which is one bridge call per cell.
+    """
+    if bulk is None:
+        bulk = BULK_WRITE
+
+    if bulk:
+        cell_range = sheet.getCellRangeByPosition(
+                0, OFFSET, 3, OFFSET + total_payments - 1)
+        # setDataArray() wants a tuple of row tuples of plain floats.
+        rows = amortization_array[1:total_payments + 1]
+        if hasattr(rows, "tolist"):
+            rows = rows.tolist()
+        cell_range.setDataArray(tuple(tuple(row) for row in rows))
+    else:
+        #for i = 0 to total_payments
+        for i in range (1, total_payments + 1):
+            for j in range (0, 4):
+                cell = sheet.getCellByPosition(j, i + OFFSET -1)
+                cell.Value = amortization_array[i][j]
 
 
-def recalculate(sheet):
-    # Total Monthly Payment = Loan Amount [ i (1+i) ÷ n / ((1+i) ÷ n) - 1) ]
+def read_inputs(sheet):
+    """ Principal, percent per annum, years and months from B2:B5. """
     #sheet = ThisComponent.Sheets.getByName("Amortization")
-    cell = sheet.getCellByPosition(1, 1)
-    principal = cell.Value
-    cell = sheet.getCellByPosition(1, 2)
-    interest_percent = cell.Value
-    interest = interest_percent * 0.01
-    interest_monthly = interest / 12
-    
-    cell = sheet.getCellByPosition(1, 3)
-    years = int(cell.Value)
-    cell = sheet.getCellByPosition(1, 4)    
-    total_payments = int(cell.Value)
-    
-    # interest_monthly
-    monthly_interest_ratio = (interest_percent * 0.01) / 12
+    # One getDataArray() rather than getCellByPosition() and .Value for each.
+    values = sheet.getCellRangeByPosition(1, 1, 1, 4).getDataArray()
+    principal, interest_percent, years, total_payments = [row[0] for row in values]
+    return principal, interest_percent, int(years), int(total_payments)
 
-    total_monthly_payment = (( principal * monthly_interest_ratio) / (1- (1+ monthly_interest_ratio) ** - total_payments))
-    
-    #msgbox total_monthly_payment    
-    cell = sheet.getCellByPosition(1, OFFSET-3)
-    cell.Value = total_monthly_payment # Already formatted? "${:,.2f}".format(total_monthly_payment) # Currency
+
+def write_summary(sheet, principal, interest_percent, years, total_payments):
+    """ Write the total and monthly payment cells. Returns the monthly payment. """
+    # Total Monthly Payment = Loan Amount [ i (1+i) ÷ n / ((1+i) ÷ n) - 1) ]
+    total_monthly_payment = amortization.monthly_payment(
+            principal, interest_percent, total_payments)
      
     #The formula to calculate the monthly principal due on an amortized loan is as follows:
     #Principal Payment = Total Monthly Payment - (Outstanding Loan Balance × (Interest Rate/12 Months))
 
     total_payment_amount = total_monthly_payment * years * 12
-    #msgbox total_payment_amount
-    cell = sheet.getCellByPosition(1, OFFSET-4)
-    cell.Value = total_payment_amount # Currency    
     # correct for total interest
-    total_interest_amount = (total_monthly_payment * years * 12) - principal
-    #msgbox total_interest_amount
-
-    # Dim amortization_array(0 to total_payments, 0 to 3) As Single    
-    # Write all zeros
-    amortization_array = [[0 for i in range(4)] for j in range(total_payments +1)]
-
-    # Enter the month in first column    
-    for i in range(0, total_payments + 1):
-        amortization_array[i][0] = i
-    
-    #Insert initial balance, which is the principal
-    amortization_array[0][3] = principal
-
-    # Multiply the principal amount by the monthly interest rate: 
-    # ($100,000 principal multiplied by 0.005 = $500 month’s interest).
-    # You can use the equation: 
-    # I=P*r*t, where I=Interest, P=principal, r=rate, and t=time.
-    for i in range (1, total_payments +1):
-        # previous balance * monthly interest 
-        interest_month_amount = amortization_array[i-1][3] * interest_monthly
-        repayment_amount = total_monthly_payment - interest_month_amount
-        balance = amortization_array[i-1][3] - repayment_amount
-        
-        amortization_array[i][1] = interest_month_amount
-        amortization_array[i][2] = repayment_amount
-        amortization_array[i][3] = balance
+    #total_interest_amount = (total_monthly_payment * years * 12) - principal
+
+    # Total payment in B7 and monthly payment in B8, in one call. Currency
+    # formatted already.
+    cell_range = sheet.getCellRangeByPosition(1, OFFSET-4, 1, OFFSET-3)
+    cell_range.setDataArray(((total_payment_amount,), (total_monthly_payment,)))
+    return total_monthly_payment
+
+
+def visible_months(doc):
+    """ First and last month of the table rows on screen. May be empty. """
+    visible = doc.getCurrentController().getVisibleRange()
+    # Row OFFSET holds month 1.
+    return max(visible.StartRow - OFFSET + 1, 1), visible.EndRow - OFFSET + 1
+
+
+def live_recalculate(sheet, doc):
+    """ 
+    The quick part of recalculate(), while a scrollbar is dragged. Writes
+    the summary cells and only the months on screen. The chart is left.
+    """
+    global table_rows, table_key
+    principal, interest_percent, years, total_payments = read_inputs(sheet)
+    write_summary(sheet, principal, interest_percent, years, total_payments)
+    # The table no longer matches any one key.
+    table_key = None
+
+    first, last = visible_months(doc)
+    top = min(last, total_payments)
+    if first <= top:
+        # The generator stops at the last row on screen.
+        rows = itertools.islice(amortization.iter_schedule(
+                principal, interest_percent, total_payments), first, top + 1)
+        cell_range = sheet.getCellRangeByPosition(
+                0, OFFSET + first - 1, 3, OFFSET + top - 1)
+        cell_range.setDataArray(tuple(rows))
+        if table_rows is not None:
+            # So the release clears these, if the term ends up shorter.
+            table_rows = max(table_rows, top)
+    if last > total_payments:
+        # Rows on screen past the new term.
+        start = max(first, total_payments + 1)
+        clear_column(sheet, 0, OFFSET + start - 1, last - start + 1)
+
+
+def slider_keys(principal, interest_percent, years):
+    """ 
+    Cache keys of every position reached by moving one scrollbar from
+    the current one, nearest first. As set by cb_scrollbar_mouse_up().
+    """
+    principal_step = int(round(principal / 10000))
+    interest_step = int(round(interest_percent / 0.1))
+    steps = []
+    for value in range(1, 101):
+        steps.append((abs(value - principal_step),
+                      (value * 10000, interest_percent, years * 12)))
+        steps.append((abs(value - interest_step),
+                      (principal, value * 0.1, years * 12)))
+    for value in range(1, 41):
+        steps.append((abs(value - years), (principal, interest_percent, value * 12)))
+    steps.sort(key=lambda step: step[0])
+    return [key for distance, key in steps]
+
+
+def recalculate(sheet, doc=None):
+    """ 
+    Recompute the loan and rewrite the table and chart. Given the document,
+    its views are locked until all is written, so the chart repaints once.
+    See uno_connection.batch_updates()
+    """
+    if doc is None:
+        _recalculate(sheet)
+        return
+    # The table is derived from the inputs, so its rewrite is not undoable.
+    with uno_connection.batch_updates(doc, lock_undo=True):
+        _recalculate(sheet)
+
+
+def _recalculate(sheet):
+    global table_rows, table_key, prewarm_thread
+    principal, interest_percent, years, total_payments = read_inputs(sheet)
+    write_summary(sheet, principal, interest_percent, years, total_payments)
+
+    key = (principal, interest_percent, total_payments)
+    if CACHE_SIZE and BULK_WRITE:
+        # Months 1 to total_payments, ready for setDataArray().
+        schedule_cache.maxsize = CACHE_SIZE
+        rows = schedule_cache.get(*key)
+        if key == table_key and table_rows == total_payments:
+            # e.g. a click that did not move the scrollbar. Already written.
+            pass
+        else:
+            cell_range = sheet.getCellRangeByPosition(
+                    0, OFFSET, 3, OFFSET + total_payments - 1)
+            cell_range.setDataArray(rows)
+        if CACHE_PREWARM and not (prewarm_thread and prewarm_thread.is_alive()):
+            prewarm_thread = schedule_cache.prewarm(
+                    slider_keys(principal, interest_percent, years))
+    else:
+        # Rows of [Month, Interest, Principal, Balance]. See amortization.py
+        amortization_array = amortization.amortization_schedule(
+                principal, interest_percent, total_payments)
        
-    # Write to spreadsheet. Start at month 1, so Chart will look OK.
-    #for i = 0 to total_payments
-    for i in range (1, total_payments + 1):
-        for j in range (0, 4):
-            cell = sheet.getCellByPosition(j, i + OFFSET -1)
-            cell.Value = amortization_array[i][j]
-
-    # Charts
-    # Update the chart. i.e. Change the row count. Y-Axis values change automatically
+        # Write to spreadsheet. Start at month 1, so Chart will look OK.
+        write_schedule(sheet, amortization_array, total_payments)
+        rows = amortization_array[1:total_payments + 1]
+    table_rows = total_payments
+    table_key = key
+
+    update_chart(sheet, rows, total_payments)
+
+
+def update_chart(sheet, rows, total_payments):
+    """ 
+    Point the chart at the table, or at a downsampled copy of it for long
+    terms. rows are months 1 to total_payments. The range is only set if
+    it changed. Y-Axis values change automatically with the cells.
+    """
+    global chart_range
+    if CHART_MAX_POINTS and total_payments > CHART_MAX_POINTS:
+        column = CHART_COLUMN
+        step = -(-total_payments // CHART_MAX_POINTS)
+        picked = list(range(step - 1, total_payments, step))
+        if picked[-1] != total_payments - 1:
+            picked.append(total_payments - 1)
+        # Month, Interest and Principal of each picked month.
+        data = tuple(tuple(float(value) for value in rows[i][:3]) for i in picked)
+        if chart_range is None or chart_range[0] != column:
+            # The copy needs the table's headings, for the legend.
+            headings = sheet.getCellRangeByPosition(0, OFFSET-1, 2, OFFSET-1)
+            sheet.getCellRangeByPosition(column, OFFSET-1, column+2, OFFSET-1).setDataArray(
+                    headings.getDataArray())
+        sheet.getCellRangeByPosition(
+                column, OFFSET, column+2, OFFSET + len(data) - 1).setDataArray(data)
+        end_row = OFFSET + len(data) - 1
+        if chart_range is not None and chart_range[0] == column and chart_range[1] > end_row:
+            # Rows left over from a longer copy.
+            clear_column(sheet, column, end_row + 1, chart_range[1] - end_row)
+    else:
+        column = 0
+        end_row = OFFSET + total_payments - 1
+        if chart_range is not None and chart_range[0] == CHART_COLUMN:
+            # Back to the table. Clear the copy, and its headings.
+            clear_column(sheet, CHART_COLUMN, OFFSET - 1, chart_range[1] - OFFSET + 2)
+
+    if chart_range == (column, end_row):
+        return False
     charts = sheet.Charts
     chart = charts.getByIndex(0)
     ranges = chart.getRanges() 
-    ranges[0].EndRow = OFFSET + total_payments -1
-    chart.setRanges(ranges)
+    changed = (ranges[0].StartColumn, ranges[0].EndRow) != (column, end_row)
+    if changed:
+        ranges[0].StartColumn = column
+        ranges[0].EndColumn = column + 2
+        ranges[0].EndRow = end_row
+        chart.setRanges(ranges)
+    chart_range = (column, end_row)
+    return changed
 
 
 def main():
@@ -558,6 +804,15 @@ def main():
             print("Error:", e.typeName)
             sys.exit("Exiting...")
 
+    build_workbook(doc)
+
+    if uno_connection.get_connection().office is not None:
+        # A launched office is terminated at exit, so save the finished sheet.
+        doc.store()
+
+
+def build_workbook(doc):
+    """ Build the Amortization sheet in a new, empty Calc document """
     # change name from Sheet1 to Amortization.
     sheet = doc.Sheets.getByName("Sheet1")
     sheet.setName("Amortization")
@@ -568,6 +823,23 @@ def main():
     
     # Completed creating sheet, so turn off design mode.
     doc.getCurrentController().setFormDesignMode(False)
+    return sheet
+
+
+def create_workbook(desktop, path):
+    """
+    Build the workbook in a hidden document and store it to path as .ods.
+    A job for office_pool.OfficePool.map(), e.g. one workbook per worker.
+    """
+    hidden = (PropertyValue('Hidden', 0, True, 0),)
+    doc = desktop.loadComponentFromURL("private:factory/scalc", "_blank", 0, hidden)
+    try:
+        build_workbook(doc)
+        properties = (PropertyValue('FilterName', 0, 'calc8', 0),)
+        doc.storeToURL(uno.systemPathToFileUrl(os.path.abspath(path)), properties)
+    finally:
+        doc.close(True)
+    return path
 
 
 # Lists the scripts, that shall be visible inside OOo. Can be omitted, if
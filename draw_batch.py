@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+#
+# draw_batch.py
+#
+# Render many floor plan variants, each to ODG, PDF and/or SVG, with no
+# document open on screen. Each variant is drawn by draw_uno_plan.py into a
+# new hidden Draw document, exported with storeToURL() and closed.
+#
+# An office listening at --connect is used, e.g. one started with:
+# $ soffice --headless "--accept=socket,host=localhost,port=2002;urp;StarOffice.ServiceManager"
+# If none is, a headless office is launched for the run, as for
+# draw_uno_plan.py. See uno_connection.connect_or_launch().
+#
+# Run with:
+# $ python3 draw_batch.py variants.json --out renders --formats odg,pdf,svg
+#
+# Or launch 4 headless offices of its own and render on all of them:
+# $ python3 draw_batch.py variants.json --workers 4
+#
+# The variant list is JSON (a list of objects) or CSV (a header row). Fields:
+#   name        Output file name, without extension. Required.
+#   columns     Number of piles across. Default 3.
+#   rows        Number of piles down. Default 3.
+#   x_spacing   Meters between piles across. Default 6.
+#   y_spacing   Meters between piles down. Default 5.
+#   grid        Grid pitch in meters. Default 1.
+#   label       Text for the Page Label. Default describes the layout.
+#
+# The same file renders to SVG without an office, see floor_plan_scene.py
+#
+# The run may be killed and restarted. A variant whose output files all
+# exist is skipped. Each file is stored under a temporary name and renamed
+# when complete, so a killed run never leaves a partial file behind.
+#
+import argparse
+import os
+import sys
+import time
+
+import uno
+from com.sun.star.beans import PropertyValue
+
+import draw_uno_plan as plan
+from floor_plan_scene import read_variants, variant_label, variant_positions
+import office_pool
+import uno_connection
+
+# storeToURL() export filter for each output format.
+FILTERS = {
+    "odg": "draw8",
+    "pdf": "draw_pdf_Export",
+    "svg": "draw_svg_Export",
+}
+
+
+def draw_variant(doc, variant):
+    """ Draw the plan and the variant's piles into an empty Draw document. """
+    page, lm = plan.draw_initialize(doc)
+    plan.draw_plan(doc, page, lm, controls=False,
+                   grid_pitch=int(round(variant["grid"] * plan.M1)))
+    plan.layout_piles(doc, page, variant_positions(variant))
+    plan.draw_update_page_label_string(page, variant_label(variant))
+    return page
+
+
+def render_variant(desktop, variant, out_dir, formats):
+    """ Draw one variant into a hidden document and store each format. """
+    hidden = (PropertyValue("Hidden", 0, True, 0),)
+    doc = desktop.loadComponentFromURL("private:factory/sdraw", "_blank", 0, hidden)
+    page = None
+    try:
+        page = draw_variant(doc, variant)
+        for extension in formats:
+            path = os.path.join(out_dir, variant["name"] + "." + extension)
+            temp_path = path + ".part"
+            filter_name = (PropertyValue("FilterName", 0, FILTERS[extension], 0),)
+            doc.storeToURL(uno.systemPathToFileUrl(os.path.abspath(temp_path)),
+                           filter_name)
+            os.replace(temp_path, path)
+    finally:
+        if page is not None:
+            plan.drop_shape_index(page)
+        doc.close(True)
+
+
+def is_done(variant, out_dir, formats):
+    """ True if every output file of the variant already exists. """
+    return all(os.path.exists(os.path.join(out_dir, variant["name"] + "." + extension))
+               for extension in formats)
+
+
+def run(variants, out_dir, formats, connection=None):
+    """
+    Render each variant not already done. Returns (done, skipped, failed).
+    Without a connection, one is made, launching an office if need be.
+    """
+    connection = connection or uno_connection.connect_or_launch()
+    os.makedirs(out_dir, exist_ok=True)
+    done = skipped = failed = 0
+    for number, variant in enumerate(variants, 1):
+        prefix = "[{}/{}] {}".format(number, len(variants), variant["name"])
+        if is_done(variant, out_dir, formats):
+            skipped += 1
+            continue
+        start = time.time()
+        try:
+            render_variant(connection.get_desktop(), variant, out_dir, formats)
+        except Exception as e:
+            # Carry on with the others. A restart will retry this one.
+            failed += 1
+            print(prefix, "failed:", getattr(e, "typeName", type(e).__name__), e)
+            continue
+        done += 1
+        print(prefix, "{:.2f}s".format(time.time() - start))
+    return done, skipped, failed
+
+
+def run_pool(variants, out_dir, formats, workers, office_factory=None):
+    """
+    As run(), but on a pool of headless offices. See office_pool.py
+    office_factory makes each worker, as for OfficePool.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    pending = [v for v in variants if not is_done(v, out_dir, formats)]
+    skipped = len(variants) - len(pending)
+
+    def job(desktop, variant):
+        render_variant(desktop, variant, out_dir, formats)
+
+    with office_pool.OfficePool(workers, office_factory=office_factory) as pool:
+        results = pool.map(job, pending)
+    failed = 0
+    for variant, result in zip(pending, results):
+        if isinstance(result, Exception):
+            failed += 1
+            print(variant["name"], "failed:",
+                  getattr(result, "typeName", type(result).__name__), result)
+    return len(pending) - failed, skipped, failed
+
+
+def main(argv=None):
+    """ Command line entry point. """
+    parser = argparse.ArgumentParser(description="Render floor plan variants.")
+    parser.add_argument("variants", help="JSON or CSV file of variants")
+    parser.add_argument("--out", default="renders", help="output directory")
+    parser.add_argument("--formats", default="odg,pdf",
+                        help="comma separated, from: " + ", ".join(FILTERS))
+    parser.add_argument("--connect", default=uno_connection.CONNECT_STRING,
+                        help="UNO connect string")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="launch this many headless offices and render in "
+                             "parallel, rather than use the one at --connect")
+    args = parser.parse_args(argv)
+
+    formats = [f.strip().lower() for f in args.formats.split(",") if f.strip()]
+    unknown = [f for f in formats if f not in FILTERS]
+    if unknown:
+        parser.error("unknown format: " + ", ".join(unknown))
+
+    variants = read_variants(args.variants)
+    if args.workers:
+        done, skipped, failed = run_pool(variants, args.out, formats, args.workers)
+    else:
+        connection = uno_connection.connect_or_launch(args.connect)
+        done, skipped, failed = run(variants, args.out, formats, connection)
+    print("Rendered: {}. Already done: {}. Failed: {}.".format(done, skipped, failed))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+
+    sys.exit(main())
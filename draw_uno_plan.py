@@ -13,7 +13,14 @@
 # $ libreoffice --calc --accept="socket,host=localhost,port=2002;urp;StarOffice.ServiceManager"
 # $ libreoffice --draw --accept="socket,host=localhost,port=2002;urp;StarOffice.ServiceManager"
 #
-# TODO: Launch LibreOffice application with socket connection from within this code.
+# If no office is listening, main() launches a headless one, which is
+# terminated when the program exits. See uno_connection.connect_or_launch().
+# The drawing is then stored as draw_uno_plan.odg in the current directory.
+# To keep the drawing on screen, launch LibreOffice as above first.
+#
+# Requires uno_connection.py and floor_plan_scene.py. For the callbacks they
+# must be importable from
+# ~/.config/libreoffice/4/user/Scripts/python/pythonpath/
 #
 # Launch program with:
 # $ python ~/.config/libreoffice/4/user/Scripts/python/draw_uno_plan.py
@@ -25,8 +32,16 @@
 #
 #import socket  # <-- only needed on win32-OOo3.0.0
 import uno
+import os
 import sys
+import threading
 import time
+import collections
+
+# Shared, cached connection to the office. Also used by the Calc script.
+import uno_connection
+# Pile layouts. Pure Python, see floor_plan_scene.py
+import floor_plan_scene
 
 # Constants
 LABEL = "A4 Landscape. Scale 1:80" # Label in bottom rectangle.
@@ -34,33 +49,40 @@ M1 = 1250  # grid points
 # Pile dimensions are 200mm x 200mm. 100mm = 125 points	
 PILE_X_SIZE = 250
 PILE_Y_SIZE = 250
+# Seconds main() waits for the document to be ready to draw on.
+READY_TIMEOUT = 10.0
+# Where main() stores the drawing when it launched the office itself.
+FILE_NAME = os.path.splitext(os.path.basename(__file__))[0] + ".odg"
 
 # Get UNO structures.
 from com.sun.star.awt import Size
+from com.sun.star.beans import PropertyValue
 from com.sun.star.awt import Point
 
 from com.sun.star.drawing.FillStyle import SOLID
 from com.sun.star.drawing.LineJoint import MITER
 from com.sun.star.awt.FontWeight import NORMAL
 from com.sun.star.drawing.LineStyle import DASH	
+from com.sun.star.drawing.DashStyle import ROUND
 from com.sun.star.awt.MessageBoxType import MESSAGEBOX
+from com.sun.star.uno import Exception as UnoException
 
-def main_initialize():
-    # get the uno component context from the PyUNO runtime
-    localContext = uno.getComponentContext()
-    # create the UnoUrlResolver
-    resolver = localContext.ServiceManager.createInstanceWithContext(
-	    "com.sun.star.bridge.UnoUrlResolver", localContext )
-    # connect to the running office
-    ctx = resolver.resolve( 
-        "uno:socket,host=localhost,port=2002;urp;StarOffice.ComponentContext" )
-    # https://wiki.openoffice.org/wiki/Documentation/DevGuide/ProUNO/Characteristics_of_the_Interprocess_Bridge
-    # "uno:socket,host=localhost,port=2002;urp,Negotiate=0,ForceSynchronous=0;StarOffice.ServiceManager"
-    smgr = ctx.ServiceManager
-    # get the central desktop object
-    desktop = smgr.createInstanceWithContext( "com.sun.star.frame.Desktop",ctx)
+def main_initialize(launch=False):
+    """ 
+    Return the desktop and current document. The connection to the office
+    is shared and cached, see uno_connection.py, so callbacks don't resolve
+    the socket again each time. With launch, start an office if none is
+    listening, and create a Draw document if none is open.
+    """
+    if launch:
+        desktop = uno_connection.connect_or_launch().get_desktop()
+    else:
+        desktop = uno_connection.get_connection().get_desktop()
     # access the current document. i.e. the model
     doc = desktop.getCurrentComponent()
+    if doc is None and launch:
+        # A launched office starts with no document.
+        doc = desktop.loadComponentFromURL("private:factory/sdraw", "_blank", 0, ())
     return desktop, doc
     
 
@@ -87,19 +109,226 @@ def draw_initialize(oDoc):
     return oPage, oLM
 
 
+class ShapeIndex():
+    """ 
+    Name and layer lookup for the shapes on one page, so finding the
+    "Page Label" or the piles does not mean a bridge call for every shape.
+    Built by one scan of the page, then kept up to date by add() and remove().
+    Also a spatial index of the shapes' bounding boxes, and of the piles,
+    for region() and at(). See floor_plan_scene.SpatialGrid
+    """
+
+    def __init__(self, oPage):
+        self.page = oPage
+        self.rebuild()
+
+    def rebuild(self):
+        """ Scan the whole page. Needed once, or if shapes changed by hand. """
+        self.by_name = {}
+        self.by_layer = {}
+        # (x, y) to shape for the piles, and their boxes. None until read
+        # by pile_positions().
+        self.piles = None
+        self.pile_spatial = None
+        # Bounding boxes by LayerID. Shapes added without a box, e.g. by the
+        # scan, are kept in unplaced until a query needs their boxes.
+        self.spatial = floor_plan_scene.SpatialGrid()
+        self.unplaced = {}
+        self.count = self.page.getCount()
+        for i in range(self.count):
+            element = self.page.getByIndex(i)
+            sName = element.Name
+            self._insert(element, sName, element.LayerID, spatial=sName != "Piles")
+
+    def _insert(self, shape, sName, nLayer, box=None, spatial=True):
+        if sName:
+            self.by_name[sName] = shape
+        self.by_layer.setdefault(nLayer, []).append(shape)
+        if not spatial:
+            return
+        if box is not None:
+            self.spatial.insert(shape, box, nLayer)
+        else:
+            self.unplaced[id(shape)] = (shape, nLayer)
+
+    def _forget_boxes(self, shapes):
+        for shape in shapes:
+            self.spatial.remove(shape)
+            self.unplaced.pop(id(shape), None)
+
+    def _forget_names(self, shapes):
+        for sName, element in list(self.by_name.items()):
+            if element in shapes:
+                del self.by_name[sName]
+
+    def add(self, shape, sName="", nLayer=0, box=None, spatial=True):
+        """ 
+        Add the shape to the page and index it under its name and layer.
+        Give its bounding box, if known, to save reading it back for region().
+        spatial=False leaves it out of region(), e.g. the "Piles" group.
+        """
+        self.page.add(shape)
+        self._insert(shape, sName, nLayer, box, spatial)
+        self.count += 1
+
+    def remove_layer(self, nLayer):
+        """ Remove every shape on layer nLayer from the page and index. """
+        shapes = self.by_layer.pop(nLayer, [])
+        # Clear from the top down.
+        for shape in reversed(shapes):
+            # Warning "remove" is case sensitive.
+            #oPage.Remove(element) <-- AttributeError: Remove
+            self.page.remove(shape)
+        self._forget_names(shapes)
+        self._forget_boxes(shapes)
+        self.count -= len(shapes)
+
+    def get_by_name(self, sName):
+        """ The shape with this Name, or None. """
+        return self.by_name.get(sName)
+
+    def get_layer(self, nLayer):
+        """ List of the shapes on layer nLayer. """
+        return self.by_layer.get(nLayer, [])
+
+    def region(self, box, nLayer=None):
+        """ 
+        List of the shapes, on layer nLayer if given, whose bounding boxes
+        touch box, (x0, y0, x1, y1). The piles are in pile_region().
+        The first query reads the boxes of unplaced shapes, 2 calls each.
+        """
+        for shape, layer in list(self.unplaced.values()):
+            position = shape.getPosition()
+            size = shape.getSize()
+            self.spatial.insert(shape, floor_plan_scene.shape_box(
+                    position.X, position.Y, size.Width, size.Height), layer)
+        self.unplaced = {}
+        return self.spatial.query(box, nLayer)
+
+    def at(self, x, y, nLayer=None):
+        """ List of the shapes whose bounding boxes contain the point x, y. """
+        return self.region((x, y, x, y), nLayer)
+
+    def reset_piles(self):
+        """ No piles, e.g. once the "Piles" group is removed. """
+        self.piles = {}
+        self.pile_spatial = floor_plan_scene.SpatialGrid()
+
+    def put_pile(self, key, shape):
+        """ Index a pile whose top left corner is key, (x, y). """
+        self.piles[key] = shape
+        x, y = key
+        self.pile_spatial.insert(shape, (x, y, x + PILE_X_SIZE, y + PILE_Y_SIZE), 7)
+
+    def pop_pile(self, key):
+        """ Forget the pile at key and return it. """
+        shape = self.piles.pop(key)
+        self.pile_spatial.remove(shape)
+        return shape
+
+    def pile_region(self, box):
+        """ List of (x, y) of the piles that touch box. """
+        positions = {id(shape): key for key, shape in self.piles.items()}
+        return [positions[id(shape)] for shape in self.pile_spatial.query(box)]
+
+
+# One ShapeIndex per page, as (page, index). Pages compare equal with == 
+# even when they are different Python proxies, so a list is searched.
+# Threads drawing on different documents share it, e.g. office_pool jobs,
+# so it is only changed or searched holding the lock.
+shape_indexes = []
+_shape_indexes_lock = threading.Lock()
+
+
+def _find_shape_index(oPage):
+    with _shape_indexes_lock:
+        for page, index in shape_indexes:
+            if page == oPage:
+                return index
+    return None
+
+
+def shape_index(oPage):
+    """ 
+    Return the ShapeIndex for oPage, building it on first use. If the page
+    no longer has the number of shapes the index expects, e.g. after editing
+    by hand, it is rebuilt. That check is one getCount() call.
+    """
+    index = _find_shape_index(oPage)
+    if index is not None:
+        if oPage.getCount() != index.count:
+            index.rebuild()
+        return index
+    # Built without the lock, as it reads the page.
+    index = ShapeIndex(oPage)
+    with _shape_indexes_lock:
+        for page, other in shape_indexes:
+            if page == oPage:
+                # Another thread indexed the page first.
+                return other
+        shape_indexes.append((oPage, index))
+    return index
+
+
+def drop_shape_index(oPage):
+    """ Forget the ShapeIndex for oPage, e.g. once its document is closed. """
+    with _shape_indexes_lock:
+        shape_indexes[:] = [(page, index) for page, index in shape_indexes
+                            if not page == oPage]
+
+
 def draw_clear_page(oPage):
     """ 
     Clear all elements off the drawing, except the Control buttons. 
-    Work backwards to 0 (-1), step -1. So removal does not impact the indexing.
+    Uses the ShapeIndex, so no LayerID is read from the page per element.
     """
-    for i in range(oPage.Count-1, -1, -1):
-        element = oPage.getByIndex(i)
-        if element.LayerID == 8:  #<--- change to 3 to keep button controls
+    index = shape_index(oPage)
+    for nLayer in list(index.by_layer):
+        if nLayer == 8:  #<--- change to 3 to keep button controls
             pass
         else:
-            # Warning "remove" is case sensitive.
-            #oPage.Remove(element) <-- AttributeError: Remove
-            oPage.remove(element)
+            index.remove_layer(nLayer)
+    index.reset_piles()
+
+
+def wait_until_ready(oDoc, oPage, timeout=READY_TIMEOUT, interval=0.01):
+    """ 
+    Wait until the document's view is up, i.e. it has a controller, and the
+    page holds just the shapes its index expects after draw_clear_page().
+    Usually true on the first look. Replaces a fixed time.sleep(2). Returns
+    the seconds waited. Raises RuntimeError after timeout seconds.
+    """
+    start = time.monotonic()
+    index = shape_index(oPage)
+    while True:
+        if oDoc.getCurrentController() is not None and oPage.getCount() == index.count:
+            return time.monotonic() - start
+        if time.monotonic() - start > timeout:
+            raise RuntimeError("Document not ready after {}s".format(timeout))
+        time.sleep(interval)
+
+
+class Timings():
+    """ Wall time of each phase of a run, e.g. of main(). """
+
+    def __init__(self):
+        self.phases = []
+        self._last = time.perf_counter()
+
+    def mark(self, name):
+        """ End the phase called name. The next one starts now. """
+        now = time.perf_counter()
+        self.phases.append((name, now - self._last))
+        self._last = now
+
+    def total(self):
+        return sum(seconds for name, seconds in self.phases)
+
+    def report(self):
+        """ e.g. "connect 12.1ms, initialize 3.0ms, ... Total 101.4ms" """
+        return ", ".join("{} {:.1f}ms".format(name, seconds * 1000)
+                         for name, seconds in self.phases) + \
+               ". Total {:.1f}ms".format(self.total() * 1000)
 
         
 def draw_a4_landscape(oPage):
@@ -136,7 +365,7 @@ def draw_border_text_field(oDoc, oPage):
     # Also work OK...
     #RectangleShape.setPropertyValue( "FillColor", 13421823 )
     #RectangleShape.setPropertyValue( "FillColor", 0xFF0000 )
-    oPage.add(RectangleShape)
+    shape_index(oPage).add(RectangleShape, "Page Label", 5, (10000, 19500, 29100, 20400))
     # The text can only be inserted after the drawing object has been added to the drawing page.
     # RectangleShape.String = "A4 Landscape. Scale 1:500"
     # Give it a name so it can be found and changed
@@ -154,7 +383,7 @@ def draw_border_line(oDoc, oPage):
     PolyPolygonShape.LineColor = 0
     PolyPolygonShape.LineWidth = 10
     PolyPolygonShape.FillTransparence = 100
-    oPage.add(PolyPolygonShape) #Page.add must take place before the coordinates are set    
+    shape_index(oPage).add(PolyPolygonShape, "", 5, (600, 600, 29100, 20400)) #Page.add must take place before the coordinates are set    
     # Must be an array within an array. In case there are multiple PolyPolygon shapes.
     position_list = [Point(600, 600),  #Top LH
                     Point(29100, 600),  #Top RH
@@ -171,11 +400,9 @@ def draw_border_line(oDoc, oPage):
 
 def draw_update_page_label_string(oPage, sLabel="Updated Page Label"):
     """ Update the Page Label in bottom of A4 rectangle. """  
-    for i in range(oPage.Count):   
-        #print(i)
-        element = oPage.getByIndex(i)
-        if element.Name == "Page Label":
-            element.String = sLabel 
+    element = shape_index(oPage).get_by_name("Page Label")
+    if element is not None:
+        element.String = sLabel 
 
 
 def draw_remove_layer(oLM):
@@ -207,87 +434,135 @@ def draw_add_layer(oLM):
         #print("ID:", str(i), "Name:", oLM.getByIndex(i).Name)
     
 
-def draw_add_grid(oDoc, oPage):
-    """ 1 meter grid over the main floor area """
-    x = 3000
-    y = 4000
+# A shape to be created by draw_shapes().
+# shape_type: e.g. "LineShape". position: (x, y). size: (width, height).
+# layer: LayerID. properties: dict of any other shape properties.
+ShapeSpec = collections.namedtuple(
+        "ShapeSpec", "shape_type position size layer properties")
 
-    for i in range(13):
-        # Vertical Grid lines
-        LineShape = oDoc.createInstance("com.sun.star.drawing.LineShape")
-        LineShape.setPosition(Point(x + (i * M1), y))
-        LineShape.setSize( Size(0, 12500) )
-        LineShape.LayerID = 6		
-        LineShape.LineColor = 0
-        LineShape.LineWidth = 10
-        LineShape.LineStyle = DASH  # com.sun.star.drawing.LineStyle.DASH		
-        # Create a new DashLine object
-        LineShape.LineDash.Style = 1 # 0 = Dashes 1 & 4 = dots 2 = None huh?
-        LineShape.LineDash.Dots = 2
-        LineShape.LineDash.DotLen = 1
-        LineShape.LineDash.Dashes = 1
-        LineShape.LineDash.DashLen = 100
-        LineShape.LineDash.Distance = 50        
-        oPage.add(LineShape)				
-
-    for i in range(11):
-        # Horizontal Grid Lines
-        LineShape = oDoc.createInstance("com.sun.star.drawing.LineShape")
-        LineShape.setPosition(Point(x, y + (i * M1)))
-        LineShape.setSize( Size(15000, 0))
-        LineShape.LayerID = 6		
-        LineShape.LineColor = 0
-        LineShape.LineWidth = 10		
-        LineShape.LineStyle = DASH  #com.sun.star.drawing.LineStyle.DASH		
-        # Create a new DashLine object       
-        LineShape.LineDash.Style = 1 # 0 = Dashes 1 & 4 = dots 2 = None huh?
-        LineShape.LineDash.Dots = 2
-        LineShape.LineDash.DotLen = 1
-        LineShape.LineDash.Dashes = 1
-        LineShape.LineDash.DashLen = 100
-        LineShape.LineDash.Distance = 50          		        
-        oPage.add(LineShape)	
-
-def draw_add_grid_supplement(oDoc, oPage):
-    """ 1 meter grid over the suplemental floor area """
-    x = 18000
-    y = 4000
-
-    for i in range(1, 8):
+
+def draw_shapes(oDoc, oPage, specs, oGroup=None):
+    """
+    Create a batch of shapes from a list of ShapeSpec and add them to the page.
+    Each shape's properties go over in one setPropertyValues() call rather
+    than one bridge call per property. Returns the list of shapes created.
+    The DrawPage has no bulk add, so oPage.add() is still once per shape.
+    The shapes are added through the page's ShapeIndex, or into oGroup.
+    """
+    index = shape_index(oPage)
+    shapes = []
+    for spec in specs:
+        shape = oDoc.createInstance("com.sun.star.drawing." + spec.shape_type)
+        shape.setPosition(Point(*spec.position))
+        shape.setSize(Size(*spec.size))
+        properties = dict(spec.properties)
+        properties["LayerID"] = spec.layer
+        # setPropertyValues() requires the names in alphabetical order.
+        names = tuple(sorted(properties))
+        shape.setPropertyValues(names, tuple(properties[name] for name in names))
+        if oGroup is None:
+            index.add(shape, properties.get("Name", ""), spec.layer,
+                      floor_plan_scene.shape_box(*(spec.position + spec.size)))
+        else:
+            oGroup.add(shape)
+        shapes.append(shape)
+    return shapes
+
+
+def grid_line_dash():
+    """ 
+    The dotted style for grid lines. Note setting LineShape.LineDash.Dots etc.
+    one at a time only changes a python copy of the struct, so build it whole.
+    """
+    line_dash = uno.createUnoStruct("com.sun.star.drawing.LineDash")
+    line_dash.Style = ROUND # 0 = Dashes 1 & 4 = dots 2 = None huh?
+    line_dash.Dots = 2
+    line_dash.DotLen = 1
+    line_dash.Dashes = 1
+    line_dash.DashLen = 100
+    line_dash.Distance = 50
+    return line_dash
+
+
+def graphic_style_properties(sName):
+    """ Properties of the named graphic styles used by this drawing. """
+    if sName == "GridDash":
+        return {
+            "LineColor": 0,
+            "LineWidth": 10,
+            "LineStyle": DASH,  # com.sun.star.drawing.LineStyle.DASH
+            "LineDash": grid_line_dash(),
+        }
+    raise KeyError(sName)
+
+
+def graphic_style(oDoc, sName):
+    """ 
+    Return the named style from the document's "graphics" style family.
+    It is created, with all its properties in one call, on first use only.
+    Shapes then just set Style, rather than each sending the same properties.
+    """
+    family = oDoc.getStyleFamilies().getByName("graphics")
+    if family.hasByName(sName):
+        return family.getByName(sName)
+    # A Draw document's graphics styles are created as the generic Style.
+    style = oDoc.createInstance("com.sun.star.style.Style")
+    family.insertByName(sName, style)
+    properties = graphic_style_properties(sName)
+    names = tuple(sorted(properties))
+    try:
+        style.setPropertyValues(names, tuple(properties[name] for name in names))
+    except UnoException:
+        # Don't leave a style without its dash for the next call to find.
+        family.removeByName(sName)
+        raise
+    return style
+
+
+def style_properties(oDoc, sName):
+    """ 
+    Shape properties for the named style: the style itself, or, if it can't
+    be made in this office, its properties to set on each shape.
+    """
+    try:
+        return {"Style": graphic_style(oDoc, sName)}
+    except UnoException as e:
+        print("Graphic style {} not available, set per shape: {}".format(sName, e))
+        return graphic_style_properties(sName)
+
+
+def grid_line_specs(x, y, columns, rows, width, height, properties,
+                    first_column=0, pitch=M1):
+    """ 
+    ShapeSpecs for vertical grid lines first_column to columns - 1 and 
+    horizontal grid lines 0 to rows - 1, pitch apart, on the Grid layer 6.
+    """
+    specs = []
+    for i in range(first_column, columns):
         # Vertical Grid lines
-        LineShape = oDoc.createInstance("com.sun.star.drawing.LineShape")
-        LineShape.setPosition(Point(x + (i * M1), y))
-        LineShape.setSize( Size(0, 5000) )
-        LineShape.LayerID = 6		
-        LineShape.LineColor = 0
-        LineShape.LineWidth = 10
-        LineShape.LineStyle = DASH  # com.sun.star.drawing.LineStyle.DASH		
-        # Create a new DashLine object
-        LineShape.LineDash.Style = 1 # 0 = Dashes 1 & 4 = dots 2 = None huh?
-        LineShape.LineDash.Dots = 2
-        LineShape.LineDash.DotLen = 1
-        LineShape.LineDash.Dashes = 1
-        LineShape.LineDash.DashLen = 100
-        LineShape.LineDash.Distance = 50        
-        oPage.add(LineShape)				
-
-    for i in range(5):
+        specs.append(ShapeSpec("LineShape", (x + (i * pitch), y), (0, height),
+                               6, properties))
+    for i in range(rows):
         # Horizontal Grid Lines
-        LineShape = oDoc.createInstance("com.sun.star.drawing.LineShape")
-        LineShape.setPosition(Point(x, y + (i * M1)))   
-        LineShape.setSize( Size(8750, 0))
-        LineShape.LayerID = 6		
-        LineShape.LineColor = 0
-        LineShape.LineWidth = 10		
-        LineShape.LineStyle = DASH  #com.sun.star.drawing.LineStyle.DASH		
-        # Create a new DashLine object       
-        LineShape.LineDash.Style = 1 # 0 = Dashes 1 & 4 = dots 2 = None huh?
-        LineShape.LineDash.Dots = 2
-        LineShape.LineDash.DotLen = 1
-        LineShape.LineDash.Dashes = 1
-        LineShape.LineDash.DashLen = 100
-        LineShape.LineDash.Distance = 50          		        
-        oPage.add(LineShape)	
+        specs.append(ShapeSpec("LineShape", (x, y + (i * pitch)), (width, 0),
+                               6, properties))
+    return specs
+
+
+def draw_add_grid(oDoc, oPage, pitch=M1):
+    """ 1 meter grid, or pitch apart, over the main floor area """
+    properties = style_properties(oDoc, "GridDash")
+    draw_shapes(oDoc, oPage, grid_line_specs(
+            3000, 4000, 15000 // pitch + 1, 12500 // pitch + 1, 15000, 12500,
+            properties, pitch=pitch))
+
+
+def draw_add_grid_supplement(oDoc, oPage, pitch=M1):
+    """ 1 meter grid, or pitch apart, over the suplemental floor area """
+    properties = style_properties(oDoc, "GridDash")
+    draw_shapes(oDoc, oPage, grid_line_specs(
+            18000, 4000, 8750 // pitch + 1, 5000 // pitch + 1, 8750, 5000,
+            properties, 1, pitch))
 
 
 def draw_ruler(X, Y, W, H, oDoc, oPage, MDL=1000, MBRE = False):
@@ -299,7 +574,7 @@ def draw_ruler(X, Y, W, H, oDoc, oPage, MDL=1000, MBRE = False):
     MeasureShape = oDoc.createInstance("com.sun.star.drawing.MeasureShape")
     MeasureShape.setPosition( Point(X, Y) )     
     MeasureShape.setSize( Size(W, H) )
-    oPage.add(MeasureShape)
+    shape_index(oPage).add(MeasureShape, "", 4, floor_plan_scene.shape_box(X, Y, W, H))
     # Changes to font must be after adding to the page
     MeasureShape.LayerID = 4		
     MeasureShape.LineColor = 0
@@ -320,7 +595,7 @@ def draw_compass(oDoc, oPage):
     LineShape.LayerID = 6		
     LineShape.LineColor = 0x0000FF
     LineShape.LineWidth = 50
-    oPage.add(LineShape)	
+    shape_index(oPage).add(LineShape, "", 6)	
  
     LineShape.LineStartWidth = 200
     LineShape.LineStartName = "Arrow"
@@ -331,7 +606,7 @@ def draw_compass(oDoc, oPage):
     EllipseShape = oDoc.createInstance("com.sun.star.drawing.EllipseShape")
     EllipseShape.setPosition( Point(28000 - 500, 18000) )
     EllipseShape.setSize( Size(1000, 1000) )
-    oPage.add(EllipseShape)
+    shape_index(oPage).add(EllipseShape, box=(27500, 18000, 28500, 19000))
     EllipseShape.LineColor = 0
     EllipseShape.FillColor = 0x00FF00
     EllipseShape.LineWidth = 5
@@ -341,7 +616,7 @@ def draw_compass(oDoc, oPage):
     TextShape = oDoc.createInstance("com.sun.star.drawing.TextShape")
     TextShape.setPosition( Point(28000 - 350, 18000 + 200) )
     TextShape.setSize( Size(500, 500) )    
-    oPage.add(TextShape)
+    shape_index(oPage).add(TextShape, box=(27650, 18200, 28150, 18700))
     TextShape.String = "N"
     TextShape.CharColor = 0xFF0000	
     TextShape.CharFontName = "FreeSans" #"Ubuntu Mono"
@@ -401,7 +676,7 @@ def add_new_button(sName, sLabel, oDoc, oPage, index):
     oButtonModel.Name = sName
     oButtonModel.Label = sLabel       
     oControlShape.setControl(oButtonModel)
-    oPage.add(oControlShape)
+    shape_index(oPage).add(oControlShape, "", 3, (x, y, x + width, y + height))
     # Layer 3 is the Controls Layer for Form widgets.
     oControlShape.LayerID = 3
     return oButtonModel
@@ -458,7 +733,7 @@ def button_push_event(button):
     #calc_initialize(doc)
     page, lm = draw_initialize(doc)     
     #print( str(page.getCount()))  
-    clear_pile(doc, page)
+    # No clear_pile(). layout_piles() only changes the piles that differ.
       
     if button.Source.Model.Name == "B0":
         #print("B0")
@@ -475,98 +750,221 @@ def button_push_event(button):
     else:
         print("Button Name not found")
 
+def add_piles(oDoc, oPage, x_spacing, y_spacing):
+    """
+    Lay out piles up to x_spacing by y_spacing meters apart over the house
+    footprint, all placed in one layout_piles(), and label the page with
+    the spacing used. Positions come from floor_plan_scene.pile_layout().
+    1m = M1 = 1250
+    """
+    positions = floor_plan_scene.pile_layout(x_spacing, y_spacing)
+    x_spacing = floor_plan_scene.pile_bays(floor_plan_scene.FOOTPRINT[0], x_spacing)[1]
+    y_spacing = floor_plan_scene.pile_bays(floor_plan_scene.FOOTPRINT[1], y_spacing)[1]
+    with uno_connection.batch_updates(oDoc, lock_undo=True):
+        layout_piles(oDoc, oPage, positions)
+        draw_update_page_label_string(oPage, "{:g}m x {:g}m. {} piles. {}".format(
+                round(x_spacing, 2), round(y_spacing, 2), len(positions), LABEL))
+
+
 def add_pile_0(oDoc, oPage):
     """
     Add a grid of piles 6 meters apart horizontal and 5m apart vertical for a
-    total of 9 piles. Calls pile subroutine to draw. 1m = M1 = 1250
+    total of 9 piles.
     """
-    for i in range(3):
-        for j in range(3): 
-            pile(oDoc, oPage, i*6*M1 + 2900, j*5*M1 + 3900)    
-   
-    # element = oPage.getByName("Page Label")
-    for i in range( oPage.getCount() -1):
-        element = oPage.getByIndex(i)
-        #print(element.Name)   
-        if element.Name == "Page Label":
-            element.String = "6m x 5m. 9 piles. " + LABEL
-            break
+    add_piles(oDoc, oPage, 6, 5)
 
 
 def add_pile_1(oDoc, oPage):
     """
     Add a grid of piles 4 meters apart horizontal and 5m apart vertical for a 
-    total of 12 piles. Calls pile subroutine. 1m = M1 = 1250 """
-    for i in range(4):
-        for j in range(3): 
-            pile(oDoc, oPage, i*4*M1 + 2900, j*5*M1 + 3900)    
-
-    # element = oPage.getByName("Page Label")
-    for i in range( oPage.getCount() - 1):
-        element = oPage.getByIndex(i)    
-        if element.Name == "Page Label":
-            element.String = "4m x 5m. 12 piles. " + LABEL
-            break
+    total of 12 piles.
+    """
+    add_piles(oDoc, oPage, 4, 5)
 
 
 def add_pile_2(oDoc, oPage):
     """
     Add a grid of piles 4 meters apart horizontal and 3.33m apart vertical for a
-    total of 16 piles Calls pile subroutine. 1m = M1 = 1250.
+    total of 16 piles.
     """
-    for i in range(4):
-        for j in range(4):
-            pile(oDoc, oPage, i*4*M1 + 2900, j*3.333*M1 + 3900)    
+    add_piles(oDoc, oPage, 4, 3.333)
 
-    # element = oPage.getByName("Page Label")
-    for i in range( oPage.getCount() - 1):
-        element = oPage.getByIndex(i)    
-        if element.Name == "Page Label":
-            element.String = "4m x 3.33m. 16 piles. " + LABEL
-            break
+
+def pile_group(oDoc, oPage):
+    """ 
+    The GroupShape named "Piles", on Layer 7, that holds every pile. It is
+    created empty on first use. Removing it removes all the piles in one call.
+    In Draw, press F3 to enter the group and select a single pile.
+    """
+    index = shape_index(oPage)
+    oGroup = index.get_by_name("Piles")
+    if oGroup is None:
+        oGroup = oDoc.createInstance("com.sun.star.drawing.GroupShape")
+        index.add(oGroup, "Piles", 7, spatial=False)
+        oGroup.setPropertyValues(("LayerID", "Name"), (7, "Piles"))
+    return oGroup
 
 
 def clear_pile(oDoc, oPage):
-    """ Clear any previous piles which are on Layer 7. Clear from the top down. """
-    for i in range(oPage.getCount()-1, -1, -1):
-        element = oPage.getByIndex(i)
-        if element.LayerID == 7:
-            oPage.remove(element)
+    """ 
+    Clear any previous piles which are on Layer 7. Found via the ShapeIndex,
+    so no LayerID is read. As the piles are in one group this is one remove().
+    """
+    index = shape_index(oPage)
+    index.remove_layer(7)
+    index.reset_piles()
+
+
+def pile_positions(oDoc, oPage, index=None):
+    """ 
+    Dict of (x, y) to pile shape for the piles in the "Piles" group. Read
+    from the group once, then kept up to date by layout_piles() and pile().
+    It is read again if the group no longer holds that many piles, e.g. one
+    was deleted by hand. That check is one getCount(). A pile moved by hand
+    is not noticed. Pass the page's ShapeIndex, if already at hand, to save
+    the page's getCount().
+    """
+    index = index or shape_index(oPage)
+    oGroup = index.get_by_name("Piles")
+    if index.piles is not None and (index.piles or oGroup is not None):
+        # Piles deleted or added inside the group don't change the page's
+        # count, so shape_index() can't see them.
+        if (oGroup.getCount() if oGroup is not None else 0) != len(index.piles):
+            index.piles = None
+    if index.piles is None:
+        index.reset_piles()
+        if oGroup is not None:
+            for i in range(oGroup.getCount()):
+                shape = oGroup.getByIndex(i)
+                position = shape.getPosition()
+                index.put_pile((position.X, position.Y), shape)
+    return index.piles
+
+
+def layout_piles(oDoc, oPage, positions):
+    """ 
+    Make the piles on the page match positions, a list of (x, y). Piles
+    already in place are left alone. Piles no longer wanted are moved to new
+    positions, then any still needed are added, or any left over removed.
+    Re-applying the current layout makes no changes at all.
+    Returns the number of piles (moved, added, removed).
+    """
+    if hasattr(positions, "tolist"):
+        # A floor_plan_scene.pile_grid() array, already whole 1/100 mm.
+        target = set(map(tuple, positions.tolist()))
+    else:
+        # Point() wants whole 1/100 mm. e.g. 3.333 * M1 is not.
+        target = set((int(round(x)), int(round(y))) for x, y in positions)
+    index = shape_index(oPage)
+    current = pile_positions(oDoc, oPage, index)
+
+    stale = [key for key in current if key not in target]
+    needed = sorted(key for key in target if key not in current)
+
+    moved = 0
+    while stale and needed:
+        old_key = stale.pop()
+        new_key = needed.pop()
+        shape = index.pop_pile(old_key)
+        shape.setPosition(Point(*new_key))
+        index.put_pile(new_key, shape)
+        moved += 1
+
+    added = len(needed)
+    if needed:
+        shapes = draw_shapes(oDoc, oPage, [pile_spec(x, y) for x, y in needed],
+                             pile_group(oDoc, oPage))
+        for key, shape in zip(needed, shapes):
+            index.put_pile(key, shape)
+
+    removed = len(stale)
+    if stale:
+        oGroup = pile_group(oDoc, oPage)
+        for key in stale:
+            oGroup.remove(index.pop_pile(key))
+
+    return moved, added, removed
             
             
-def pile(oDoc, oPage, x, y):
-    # Create a pile of 200mm x 200mm starting at x, y
+def pile_spec(x, y):
+    """ ShapeSpec for a pile of 200mm x 200mm starting at x, y on Layer 7. """
     # Need to positioning offset if pile size is changed
-    # Layer 7 is for piles.
-        
     # 100mm = 125 points. pile is 200mm x 200mm
-    RectangleShape = oDoc.createInstance("com.sun.star.drawing.RectangleShape")
-    RectangleShape.setPosition( Point(x, y) )
-    RectangleShape.setSize( Size(PILE_X_SIZE, PILE_Y_SIZE) )
+    return ShapeSpec("RectangleShape", (x, y), (PILE_X_SIZE, PILE_Y_SIZE), 7, {
+        "LineColor": 0,
+        "LineWidth": 10,
+        "FillStyle": SOLID,
+        "FillTransparence": 20,
+        "FillColor": 0x0000FF,
+    })
 
-    RectangleShape.LineColor = 0
-    RectangleShape.LineWidth = 10
-    RectangleShape.LayerID = 7
-    RectangleShape.FillStyle = SOLID
 
-    RectangleShape.FillTransparence = 20
-    RectangleShape.FillColor = 0x0000FF     
-    oPage.add(RectangleShape)
+def pile(oDoc, oPage, x, y):
+    # Create a pile of 200mm x 200mm starting at x, y
+    # Layer 7 is for piles. Goes into the "Piles" group.
+    shape = draw_shapes(oDoc, oPage, [pile_spec(x, y)], pile_group(oDoc, oPage))[0]
+    index = shape_index(oPage)
+    pile_positions(oDoc, oPage, index)
+    index.put_pile((x, y), shape)
+    return shape
 
-    
-def main():
-    """ Main menu to launch program. """       
-    desktop, doc = main_initialize()
-    #calc_initialize(doc)
 
-    page, lm = draw_initialize(doc)    
-    #print("doc.DrawPages.Count: ", doc.DrawPages.Count)
-    #print("page.Count:", page.Count)
-    
-    draw_clear_page(page) 
+def clear_piles_in(oDoc, oPage, box):
+    """ 
+    Remove the piles that touch box, (x0, y0, x1, y1), e.g. one bay.
+    Found by the spatial index, not by walking the group. Returns the count.
+    """
+    index = shape_index(oPage)
+    pile_positions(oDoc, oPage, index)
+    keys = index.pile_region(box)
+    if keys:
+        oGroup = pile_group(oDoc, oPage)
+        with uno_connection.batch_updates(oDoc, lock_undo=True):
+            for key in keys:
+                oGroup.remove(index.pop_pile(key))
+    return len(keys)
+
+
+def relabel_in(oDoc, oPage, box, sFormat="P{}", nLayer=7):
+    """ 
+    Set the text of the shapes on layer nLayer that touch box to sFormat
+    numbered from 1, top to bottom then left to right. e.g. mark the piles
+    of a bay P1, P2... Layer 7 is the piles. Returns the count.
+    """
+    index = shape_index(oPage)
+    if nLayer == 7:
+        pile_positions(oDoc, oPage, index)
+        keys = sorted(index.pile_region(box), key=lambda key: (key[1], key[0]))
+        shapes = [index.piles[key] for key in keys]
+    else:
+        shapes = index.region(box, nLayer)
+        boxes = [index.spatial.box(shape) for shape in shapes]
+        shapes = [shape for box, shape in sorted(zip(boxes, shapes),
+                                                 key=lambda pair: (pair[0][1], pair[0][0]))]
+    with uno_connection.batch_updates(oDoc, lock_undo=True):
+        for number, shape in enumerate(shapes, 1):
+            shape.String = sFormat.format(number)
+    return len(shapes)
+
+
+def pile_collisions(oDoc, oPage, nLayer=6):
+    """ 
+    List of (x, y) of each pile and the shapes on layer nLayer, the grid
+    lines by default, that its box touches. Piles on no grid line are off
+    the grid. The spatial index looks only at the grid near each pile.
+    """
+    index = shape_index(oPage)
+    collisions = []
+    for key, shape in pile_positions(oDoc, oPage, index).items():
+        collisions.append((key, index.region(index.pile_spatial.box(shape), nLayer)))
+    return collisions
 
-    time.sleep(2)
     
+def draw_plan(doc, page, lm, controls=True, grid_pitch=M1):
+    """ 
+    Draw the whole floor plan, except the piles, onto an empty page.
+    controls=False leaves out the push-buttons, e.g. for batch rendering.
+    """
     draw_remove_layer(lm)
     
     draw_add_layer(lm)       
@@ -579,15 +977,16 @@ def main():
     draw_border_line(doc, page)
     
     # Add command buttons for piles
-    add_control(doc, page)    
+    if controls:
+        add_control(doc, page)    
     
     draw_update_page_label_string(page, "A4 Landscape")
 
     draw_compass(doc, page)
 
-    draw_add_grid(doc, page)
+    draw_add_grid(doc, page, grid_pitch)
     
-    draw_add_grid_supplement(doc, page)
+    draw_add_grid_supplement(doc, page, grid_pitch)
 
     # Measurment lines:	
     # House horizontal. Pile centers
@@ -605,6 +1004,98 @@ def main():
     # House horizontal outside of pile
     draw_ruler(3000-125, 4000 + M1*10 + 125, (M1*12)+(125*2), 0, doc, page, 1500, True) 
 
+
+# Scene property values that stand for UNO enums. See floor_plan_scene.py
+SCENE_ENUMS = {
+    "FillStyle": {"SOLID": SOLID},
+    "LineJoint": {"MITER": MITER},
+    "LineStyle": {"DASH": DASH},
+}
+
+
+def draw_scene(oDoc, oPage, scene):
+    """
+    Replay a floor_plan_scene.Scene onto the page, as built offline by
+    floor_plan_scene.build_plan(). Each shape is added through the page's
+    ShapeIndex and then given its properties in one setPropertyValues(),
+    after the add, as String and PolyPolygon must be. A "Piles" group goes
+    through layout_piles(). Page setup and layers are left to draw_plan().
+    Returns the list of shapes created, less the piles.
+    """
+    index = shape_index(oPage)
+    styles = {}
+    shapes = []
+    for spec in scene.shapes:
+        if spec.shape_type == "GroupShape" and spec.name == "Piles":
+            layout_piles(oDoc, oPage, [(pile.x, pile.y) for pile in spec.children])
+            continue
+        shape = oDoc.createInstance("com.sun.star.drawing." + spec.shape_type)
+        if spec.points is None:
+            shape.setPosition(Point(spec.x, spec.y))
+            shape.setSize(Size(spec.width, spec.height))
+            box = floor_plan_scene.shape_box(spec.x, spec.y, spec.width, spec.height)
+        else:
+            xs = [x for polygon in spec.points for x, y in polygon]
+            ys = [y for polygon in spec.points for x, y in polygon]
+            box = (min(xs), min(ys), max(xs), max(ys))
+        index.add(shape, spec.name, spec.layer, box)
+        properties = {}
+        for name, value in spec.properties.items():
+            properties[name] = SCENE_ENUMS.get(name, {}).get(value, value)
+        properties["LayerID"] = spec.layer
+        if spec.name:
+            properties["Name"] = spec.name
+        if spec.style:
+            if spec.style not in styles:
+                styles[spec.style] = style_properties(oDoc, spec.style)
+            for name, value in styles[spec.style].items():
+                properties.setdefault(name, value)
+        if spec.points is not None:
+            properties["PolyPolygon"] = tuple(tuple(Point(x, y) for x, y in polygon)
+                                              for polygon in spec.points)
+        # setPropertyValues() requires the names in alphabetical order.
+        names = tuple(sorted(properties))
+        shape.setPropertyValues(names, tuple(properties[name] for name in names))
+        if spec.text:
+            shape.setString(spec.text)
+        shapes.append(shape)
+    return shapes
+
+
+def main():
+    """ Main menu to launch program. Returns the Timings of its phases. """
+    timings = Timings()
+    desktop, doc = main_initialize(launch=True)
+    #calc_initialize(doc)
+    timings.mark("connect")
+
+    page, lm = draw_initialize(doc)    
+    #print("doc.DrawPages.Count: ", doc.DrawPages.Count)
+    #print("page.Count:", page.Count)
+    timings.mark("initialize")
+    
+    draw_clear_page(page) 
+    timings.mark("clear")
+
+    # Was time.sleep(2). Now only waits if the document is not ready.
+    wait_until_ready(doc, page)
+    timings.mark("ready")
+    
+    # One repaint when the plan is complete, and no undo for each shape.
+    with uno_connection.batch_updates(doc, lock_undo=True):
+        draw_plan(doc, page, lm)
+    timings.mark("draw")
+
+    if uno_connection.get_connection().office is not None:
+        # A launched office is terminated at exit, so store the drawing.
+        path = os.path.abspath(FILE_NAME)
+        doc.storeToURL(uno.systemPathToFileUrl(path),
+                       (PropertyValue("FilterName", 0, "draw8", 0),))
+        print("Stored drawing:", path)
+    # A launch's cold start is included in connect.
+    print("Startup latency:", timings.report())
+    return timings
+
     # A messagebox is available. Only displays strings. Place anywhere to debug code
     #omsgbox("My message")
     #dir_list = dir(uno)
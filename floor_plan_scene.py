@@ -0,0 +1,854 @@
+#!/usr/bin/env python3
+#
+# floor_plan_scene.py
+#
+# The floor plan of draw_uno_plan.py as plain Python records, so it can be
+# built and rendered with no LibreOffice running, e.g. previews on a web
+# server. There is no "import uno" in this file.
+#
+# A Scene holds Shape records with the same coordinates (1/100 mm), layer
+# IDs, names and UNO property names as draw_plan() and pile() use. It is
+# rendered by:
+#   to_svg(scene)   SVG, in pure Python.
+#   to_fodg(scene)  Flat ODF drawing XML (.fodg), which LibreOffice opens.
+#   draw_uno_plan.draw_scene(doc, page, scene)  Replays it into a document.
+#
+# Also pure geometry shared with draw_uno_plan.py: pile_grid() and
+# pile_layout() for pile positions, and SpatialGrid, the bounding box index
+# behind ShapeIndex.region() and the other area operations.
+#
+# Usage:
+#   scene = floor_plan_scene.build_plan(piles=positions, label="...")
+#   floor_plan_scene.write(scene, "plan.svg")
+#
+# Or from the command line, for the variant files of draw_batch.py:
+# $ python3 floor_plan_scene.py variants.json --out previews --formats svg,fodg
+#
+# The renderings are previews. Dash patterns, arrow heads, measure line
+# text and the rotation of the compass arrow (about its start point) are
+# close to, not exactly, what Draw shows.
+#
+import argparse
+import csv
+import json
+import math
+import os
+import sys
+from xml.sax.saxutils import escape, quoteattr
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Constants. As draw_uno_plan.py
+LABEL = "A4 Landscape. Scale 1:80" # Label in bottom rectangle.
+M1 = 1250  # grid points
+# Pile dimensions are 200mm x 200mm. 100mm = 125 points
+PILE_X_SIZE = 250
+PILE_Y_SIZE = 250
+
+# Grid point of the first pile, and the footprint of the house in meters
+# between the outer pile centre lines. See the rulers in build_plan()
+PILE_ORIGIN = (3000, 4000)
+FOOTPRINT = (12, 10)
+# Pile top left corner, up and left of its grid point, as piles have always
+# been drawn. pile_layout() centres the pile on the point if given None.
+PILE_EDGE_OFFSET = (100, 100)
+# A bay up to this much wider than asked for is used, not one more bay.
+# e.g. 10m of 3.333m bays is 3 bays, of 3.3333m.
+BAY_TOLERANCE = 0.01
+
+# A4 landscape, with a 6mm border. See draw_a4_landscape()
+PAGE_WIDTH = 29700
+PAGE_HEIGHT = 21000
+PAGE_BORDER = 600
+
+# Layer names by LayerID. The 5 standard layers, then those draw_add_layer() adds.
+LAYERS = ["layout", "background", "backgroundobjects", "controls", "measurelines",
+          "Borders", "Grid", "Piles"]
+
+# Graphic styles by name. See draw_uno_plan.graphic_style_properties()
+STYLES = {
+    "GridDash": {
+        "LineColor": 0,
+        "LineWidth": 10,
+        "LineStyle": "DASH",
+        "LineDash": {"Style": "ROUND", "Dots": 2, "DotLen": 1, "Dashes": 1,
+                     "DashLen": 100, "Distance": 50},
+    },
+}
+
+# Fields of a variant, as read by read_variants(), and their defaults.
+DEFAULTS = {
+    "columns": 3,
+    "rows": 3,
+    "x_spacing": 6.0,
+    "y_spacing": 5.0,
+    "grid": 1.0,
+    "label": "",
+}
+
+# FontWeight.NORMAL
+NORMAL = 100.0
+
+
+class Shape():
+    """
+    One drawing shape. shape_type is the UNO service name less its prefix,
+    e.g. "RectangleShape". properties holds any other UNO shape properties.
+    points is the PolyPolygon of a PolyPolygonShape, children the shapes of
+    a GroupShape.
+    """
+    __slots__ = ("shape_type", "x", "y", "width", "height", "layer", "name",
+                 "text", "style", "properties", "points", "children")
+
+    def __init__(self, shape_type, x=0, y=0, width=0, height=0, layer=0,
+                 name="", text="", style="", properties=None, points=None,
+                 children=None):
+        self.shape_type = shape_type
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.layer = layer
+        self.name = name
+        self.text = text
+        self.style = style
+        self.properties = properties if properties is not None else {}
+        self.points = points
+        self.children = children
+
+    def resolved(self):
+        """ The properties, over those of the shape's style. """
+        if not self.style:
+            return self.properties
+        properties = dict(STYLES[self.style])
+        properties.update(self.properties)
+        return properties
+
+
+class Scene():
+    """ A page of shapes, in drawing order. """
+    __slots__ = ("width", "height", "border", "shapes")
+
+    def __init__(self, width=PAGE_WIDTH, height=PAGE_HEIGHT, border=PAGE_BORDER):
+        self.width = width
+        self.height = height
+        self.border = border
+        self.shapes = []
+
+    def add(self, shape):
+        self.shapes.append(shape)
+        return shape
+
+    def find(self, name):
+        """ The shape with this name, or None. """
+        for shape in self.shapes:
+            if shape.name == name:
+                return shape
+        return None
+
+    def layer(self, layer):
+        """ List of the shapes on a layer. """
+        return [shape for shape in self.shapes if shape.layer == layer]
+
+
+class SpatialGrid():
+    """
+    Bounding boxes (x0, y0, x1, y1) in square buckets cell 1/100 mm wide,
+    so a region or point query looks at the few buckets it covers rather
+    than at every item. Each item may carry a tag, e.g. its LayerID, that
+    queries can filter on. Items are held by identity, so any object will
+    do, e.g. a UNO shape.
+    """
+
+    def __init__(self, cell=M1):
+        self.cell = cell
+        # (i, j) to dict of id(item) to None, which keeps insertion order.
+        self.buckets = {}
+        # id(item) to (item, box, tag).
+        self.items = {}
+
+    def __len__(self):
+        return len(self.items)
+
+    def _cells(self, box):
+        c = self.cell
+        x0, y0, x1, y1 = box
+        return [(i, j) for i in range(int(x0 // c), int(x1 // c) + 1)
+                for j in range(int(y0 // c), int(y1 // c) + 1)]
+
+    def insert(self, item, box, tag=None):
+        """ Add item with its bounding box, or move it if already present. """
+        key = id(item)
+        if key in self.items:
+            self.remove(item)
+        self.items[key] = (item, box, tag)
+        for cell in self._cells(box):
+            self.buckets.setdefault(cell, {})[key] = None
+
+    def remove(self, item):
+        """ Remove item. No error if it is not present. """
+        entry = self.items.pop(id(item), None)
+        if entry is None:
+            return
+        for cell in self._cells(entry[1]):
+            bucket = self.buckets[cell]
+            del bucket[id(item)]
+            if not bucket:
+                del self.buckets[cell]
+
+    def box(self, item):
+        """ The bounding box of item, or None. """
+        entry = self.items.get(id(item))
+        return entry[1] if entry else None
+
+    def query(self, box, tag=None):
+        """ List of the items whose boxes touch box, and have tag if given. """
+        x0, y0, x1, y1 = box
+        found = []
+        seen = set()
+        for cell in self._cells(box):
+            for key in self.buckets.get(cell, ()):
+                if key in seen:
+                    continue
+                seen.add(key)
+                item, (ix0, iy0, ix1, iy1), item_tag = self.items[key]
+                if (ix0 <= x1 and x0 <= ix1 and iy0 <= y1 and y0 <= iy1 and
+                        (tag is None or item_tag == tag)):
+                    found.append(item)
+        return found
+
+    def at(self, x, y, tag=None):
+        """ List of the items whose boxes contain the point x, y. """
+        return self.query((x, y, x, y), tag)
+
+
+def shape_box(x, y, width, height):
+    """ Bounding box of a shape at x, y. Lines have a negative size, or none. """
+    return (min(x, x + width), min(y, y + height), max(x, x + width), max(y, y + height))
+
+
+def scene_page_label(scene, label="Page Information"):
+    """ The text field at the bottom. See draw_border_text_field() """
+    return scene.add(Shape("RectangleShape", 10000, 19500, 19100, 900, 5,
+                           "Page Label", label, properties={
+        "LineColor": 0,
+        "LineWidth": 10,
+        "CharColor": 0,
+        "FillStyle": "SOLID",
+        "LineJoint": "MITER",
+        "FillTransparence": 50,
+        "FillColor": 0x00FF00,
+        "CharWeight": NORMAL,
+        "CharFontName": "FreeSans",
+        "CharHeight": 14,
+    }))
+
+
+def scene_border_line(scene):
+    """ The border at 600. See draw_border_line() """
+    return scene.add(Shape("PolyPolygonShape", layer=5, points=[[
+            (600, 600), (29100, 600), (29100, 20400), (600, 20400)]],
+            properties={"LineColor": 0, "LineWidth": 10, "FillTransparence": 100}))
+
+
+def scene_compass(scene):
+    """ North arrow in a circle, and N. See draw_compass() """
+    scene.add(Shape("LineShape", 28000, 18000, 0, 1000, 6, properties={
+        "LineColor": 0x0000FF,
+        "LineWidth": 50,
+        "LineStartWidth": 200,
+        "LineStartName": "Arrow",
+        "RotateAngle": 3000,
+    }))
+    scene.add(Shape("EllipseShape", 28000 - 500, 18000, 1000, 1000, properties={
+        "LineColor": 0,
+        "FillColor": 0x00FF00,
+        "LineWidth": 5,
+        "FillTransparence": 80,
+    }))
+    scene.add(Shape("TextShape", 28000 - 350, 18000 + 200, 500, 500, text="N",
+                    properties={"CharColor": 0xFF0000, "CharFontName": "FreeSans",
+                                "CharHeight": 12}))
+
+
+def scene_grid(scene, x, y, columns, rows, width, height, first_column=0, pitch=M1):
+    """ Dashed grid lines on layer 6. See grid_line_specs() """
+    for i in range(first_column, columns):
+        # Vertical Grid lines
+        scene.add(Shape("LineShape", x + (i * pitch), y, 0, height, 6, style="GridDash"))
+    for i in range(rows):
+        # Horizontal Grid Lines
+        scene.add(Shape("LineShape", x, y + (i * pitch), width, 0, 6, style="GridDash"))
+
+
+def scene_ruler(scene, X, Y, W, H, MDL=1000, MBRE=False):
+    """ A measure line on layer 4. See draw_ruler() """
+    return scene.add(Shape("MeasureShape", X, Y, W, H, 4, properties={
+        "LineColor": 0,
+        "LineWidth": 5,
+        "MeasureLineDistance": MDL,
+        "MeasureBelowReferenceEdge": MBRE,
+        "CharWeight": NORMAL,
+        "CharFontName": "FreeSans",
+        "CharHeight": 12,
+    }))
+
+
+def scene_piles(scene, positions):
+    """ The "Piles" group on layer 7. See pile_spec() and layout_piles() """
+    if hasattr(positions, "tolist"):
+        # A pile_grid() array.
+        positions = positions.tolist()
+    # Point() wants whole 1/100 mm. e.g. 3.333 * M1 is not.
+    children = [Shape("RectangleShape", int(round(x)), int(round(y)),
+                      PILE_X_SIZE, PILE_Y_SIZE, 7, properties={
+                "LineColor": 0,
+                "LineWidth": 10,
+                "FillStyle": "SOLID",
+                "FillTransparence": 20,
+                "FillColor": 0x0000FF,
+            }) for x, y in positions]
+    return scene.add(Shape("GroupShape", layer=7, name="Piles", children=children))
+
+
+def pile_grid(columns, rows, x_spacing, y_spacing, origin=PILE_ORIGIN,
+              edge_offset=PILE_EDGE_OFFSET, pitch=M1):
+    """
+    Top left corners of columns x rows piles, x_spacing and y_spacing meters
+    apart, snapped to whole 1/100 mm. Column by column, as add_pile_0/1/2
+    placed them. An (n, 2) int array, or a list of (x, y) without NumPy.
+    """
+    x0 = origin[0] - edge_offset[0]
+    y0 = origin[1] - edge_offset[1]
+    if np is None:
+        return [(int(round(i * x_spacing * pitch + x0)), int(round(j * y_spacing * pitch + y0)))
+                for i in range(columns) for j in range(rows)]
+    grid = np.empty((columns, rows, 2), dtype=np.int64)
+    # np.rint() rounds halves to even, as round() does.
+    grid[:, :, 0] = np.rint(np.arange(columns) * (x_spacing * pitch) + x0)[:, None]
+    grid[:, :, 1] = np.rint(np.arange(rows) * (y_spacing * pitch) + y0)[None, :]
+    return grid.reshape(-1, 2)
+
+
+def pile_bays(length, spacing):
+    """
+    (bays, spacing) to span length meters with bays at most spacing meters,
+    give or take BAY_TOLERANCE. The bays are equal, so the outer piles are
+    on the ends. e.g. 12m at 2.5m is 5 bays of 2.4m.
+    """
+    bays = max(1, int(math.ceil(length / spacing - BAY_TOLERANCE)))
+    return bays, length / bays
+
+
+def pile_layout(x_spacing, y_spacing, footprint=FOOTPRINT, pile_size=None,
+                edge_offset=PILE_EDGE_OFFSET, origin=PILE_ORIGIN, pitch=M1):
+    """
+    Piles on bays of up to x_spacing by y_spacing meters over a footprint
+    of (width, depth) meters, from pile centre line to centre line. See
+    pile_bays(). edge_offset (1/100 mm) places the top left corner of a
+    PILE_X_SIZE x PILE_Y_SIZE pile from its grid point, or None centres it.
+    A pile of another pile_size (width, height) keeps that pile's centre.
+    Returns pile_grid() of the layout.
+    """
+    columns, x_spacing = pile_bays(footprint[0], x_spacing)
+    rows, y_spacing = pile_bays(footprint[1], y_spacing)
+    size = pile_size or (PILE_X_SIZE, PILE_Y_SIZE)
+    if edge_offset is None:
+        edge_offset = (size[0] // 2, size[1] // 2)
+    elif pile_size is not None:
+        edge_offset = (edge_offset[0] + (size[0] - PILE_X_SIZE) // 2,
+                       edge_offset[1] + (size[1] - PILE_Y_SIZE) // 2)
+    return pile_grid(columns + 1, rows + 1, x_spacing, y_spacing, origin, edge_offset, pitch)
+
+
+def build_plan(piles=(), label="A4 Landscape", grid_pitch=M1):
+    """
+    The scene draw_plan() draws, less the push-buttons, plus piles at
+    positions, a list of (x, y).
+    """
+    scene = Scene()
+    scene_page_label(scene, label)
+    scene_border_line(scene)
+    scene_compass(scene)
+    scene_grid(scene, 3000, 4000, 15000 // grid_pitch + 1, 12500 // grid_pitch + 1,
+               15000, 12500, pitch=grid_pitch)
+    scene_grid(scene, 18000, 4000, 8750 // grid_pitch + 1, 5000 // grid_pitch + 1,
+               8750, 5000, 1, grid_pitch)
+
+    # Measurment lines:
+    # House horizontal. Pile centers
+    scene_ruler(scene, 3000, 4000, M1 *12, 0, 1500, False)
+    # Grid square of 1 meter
+    scene_ruler(scene, 3000, 4000, M1, 0, 800, False)
+    # House vertical. Pile centers
+    scene_ruler(scene, 3000, 4000, 0, M1 * 10, 800, True)
+    # Overall house horizontal
+    scene_ruler(scene, 3000, 4000, M1*19, 0, 2200, False)
+    # Additional Grid on RHS
+    scene_ruler(scene, 3000+M1*19, 4000, 0, M1*4, 1000, False)
+    # House vertical outside of pile
+    scene_ruler(scene, 3000, 4000-125, 0, (M1*10)+(125*2), 1600, True)
+    # House horizontal outside of pile
+    scene_ruler(scene, 3000-125, 4000 + M1*10 + 125, (M1*12)+(125*2), 0, 1500, True)
+
+    if len(piles):
+        scene_piles(scene, piles)
+    return scene
+
+
+def read_variants(path):
+    """ List of variant dicts from a JSON or CSV file, with defaults filled in. """
+    with open(path, newline="") as fin:
+        if path.lower().endswith(".csv"):
+            rows = list(csv.DictReader(fin))
+        else:
+            rows = json.load(fin)
+
+    variants = []
+    for row in rows:
+        if not row.get("name"):
+            raise ValueError("Variant without a name: {}".format(row))
+        variant = dict(DEFAULTS)
+        # CSV gives empty strings for missing values.
+        variant.update((key, value) for key, value in row.items() if value != "")
+        for key in ("columns", "rows"):
+            variant[key] = int(variant[key])
+        for key in ("x_spacing", "y_spacing", "grid"):
+            variant[key] = float(variant[key])
+        variants.append(variant)
+    return variants
+
+
+def variant_positions(variant):
+    """ Top left corners of the piles, laid out as add_pile_0/1/2 do. """
+    return pile_grid(variant["columns"], variant["rows"],
+                     variant["x_spacing"], variant["y_spacing"])
+
+
+def variant_label(variant):
+    """ e.g. "6m x 5m. 9 piles. A4 Landscape. Scale 1:80" """
+    if variant["label"]:
+        return variant["label"]
+    return "{:g}m x {:g}m. {} piles. {}".format(
+            variant["x_spacing"], variant["y_spacing"],
+            variant["columns"] * variant["rows"], LABEL)
+
+
+def variant_scene(variant):
+    """ The scene of a variant, as draw_batch.draw_variant() draws it. """
+    return build_plan(variant_positions(variant), variant_label(variant),
+                      int(round(variant["grid"] * M1)))
+
+
+# Rendering. Shared by SVG and ODG.
+
+def _color(value):
+    return "#{:06x}".format(value & 0xFFFFFF)
+
+
+def _font_size(points):
+    """ Points to 1/100 mm. """
+    return points * 2540 / 72
+
+
+def line_end_points(shape):
+    """
+    Start and end of a LineShape, or the reference points of a MeasureShape,
+    after RotateAngle (1/100 degree, anticlockwise) about the start point.
+    """
+    x1, y1 = shape.x, shape.y
+    dx, dy = shape.width, shape.height
+    angle = shape.properties.get("RotateAngle", 0)
+    if angle:
+        radians = math.radians(angle / 100)
+        # Anticlockwise on the page, where y points down.
+        dx, dy = (dx * math.cos(radians) + dy * math.sin(radians),
+                  -dx * math.sin(radians) + dy * math.cos(radians))
+    return x1, y1, x1 + dx, y1 + dy
+
+
+def measure_line(shape):
+    """
+    The offset line of a MeasureShape, as (x1, y1, x2, y2), and its label,
+    the measured length at the plan scale in meters.
+    """
+    x1, y1, x2, y2 = line_end_points(shape)
+    length = math.hypot(x2 - x1, y2 - y1) or 1
+    distance = shape.properties.get("MeasureLineDistance", 0)
+    if shape.properties.get("MeasureBelowReferenceEdge"):
+        distance = -distance
+    # Normal to the left of the direction of measure. Up for left to right.
+    nx, ny = (y2 - y1) / length, -(x2 - x1) / length
+    ox, oy = nx * distance, ny * distance
+    return (x1 + ox, y1 + oy, x2 + ox, y2 + oy), "{:g} m".format(round(length / M1, 2))
+
+
+def _dash_array(dash, width):
+    """ SVG stroke-dasharray for a LineDash dict. Dots, then dashes. """
+    width = max(width, 10)
+    parts = []
+    for i in range(dash.get("Dots", 0)):
+        parts += [dash.get("DotLen", 0) or width, dash.get("Distance", 0)]
+    for i in range(dash.get("Dashes", 0)):
+        parts += [dash.get("DashLen", 0) or width, dash.get("Distance", 0)]
+    return " ".join("{:g}".format(part) for part in parts)
+
+
+def _svg_paint(properties, fill):
+    """ stroke and fill attributes. """
+    width = properties.get("LineWidth", 0) or 1
+    attributes = ['stroke="{}"'.format(_color(properties.get("LineColor", 0x3465A4))),
+                  'stroke-width="{:g}"'.format(width)]
+    if properties.get("LineStyle") == "DASH":
+        attributes.append('stroke-dasharray="{}"'.format(
+                _dash_array(properties.get("LineDash", {}), width)))
+        if properties.get("LineDash", {}).get("Style") == "ROUND":
+            attributes.append('stroke-linecap="round"')
+    if properties.get("LineJoint") == "MITER":
+        attributes.append('stroke-linejoin="miter"')
+    if fill and properties.get("FillStyle", "SOLID") != "NONE":
+        attributes.append('fill="{}"'.format(_color(properties.get("FillColor", 0x729FCF))))
+        transparence = properties.get("FillTransparence", 0)
+        if transparence:
+            attributes.append('fill-opacity="{:g}"'.format(1 - transparence / 100))
+    else:
+        attributes.append('fill="none"')
+    return " ".join(attributes)
+
+
+def _svg_text(properties, x, y, text, anchor="middle"):
+    size = _font_size(properties.get("CharHeight", 12))
+    weight = "bold" if properties.get("CharWeight", NORMAL) > NORMAL else "normal"
+    return ('<text x="{:g}" y="{:g}" font-family={} font-size="{:g}" font-weight="{}" '
+            'fill="{}" text-anchor="{}" dominant-baseline="central">{}</text>').format(
+            x, y, quoteattr(properties.get("CharFontName", "sans-serif")), size,
+            weight, _color(properties.get("CharColor", 0)), anchor, escape(text))
+
+
+def _svg_shape(shape):
+    """ List of SVG elements for a shape. """
+    p = shape.resolved()
+    kind = shape.shape_type
+    layer = 'class="layer-{}"'.format(LAYERS[shape.layer])
+    if kind == "GroupShape":
+        elements = ['<g id={} {}>'.format(quoteattr(shape.name), layer)]
+        for child in shape.children:
+            elements += _svg_shape(child)
+        return elements + ['</g>']
+    if kind == "RectangleShape":
+        elements = ['<rect x="{}" y="{}" width="{}" height="{}" {} {}/>'.format(
+                shape.x, shape.y, shape.width, shape.height, _svg_paint(p, True), layer)]
+        if shape.text:
+            elements.append(_svg_text(p, shape.x + shape.width / 2,
+                                      shape.y + shape.height / 2, shape.text))
+        return elements
+    if kind == "EllipseShape":
+        return ['<ellipse cx="{:g}" cy="{:g}" rx="{:g}" ry="{:g}" {} {}/>'.format(
+                shape.x + shape.width / 2, shape.y + shape.height / 2,
+                shape.width / 2, shape.height / 2, _svg_paint(p, True), layer)]
+    if kind == "TextShape":
+        return [_svg_text(p, shape.x + shape.width / 2, shape.y + shape.height / 2,
+                          shape.text)]
+    if kind == "PolyPolygonShape":
+        return ['<polygon points="{}" {} {}/>'.format(
+                " ".join("{},{}".format(x, y) for x, y in polygon),
+                _svg_paint(p, p.get("FillTransparence", 0) < 100), layer)
+                for polygon in shape.points]
+    if kind == "LineShape":
+        x1, y1, x2, y2 = line_end_points(shape)
+        marker = ' marker-start="url(#Arrow)"' if p.get("LineStartName") == "Arrow" else ""
+        return ['<line x1="{:g}" y1="{:g}" x2="{:g}" y2="{:g}" {}{} {}/>'.format(
+                x1, y1, x2, y2, _svg_paint(p, False), marker, layer)]
+    if kind == "MeasureShape":
+        rx1, ry1, rx2, ry2 = line_end_points(shape)
+        (x1, y1, x2, y2), text = measure_line(shape)
+        paint = _svg_paint(p, False)
+        return [
+            '<g {}>'.format(layer),
+            # Extension lines from the reference points.
+            '<line x1="{:g}" y1="{:g}" x2="{:g}" y2="{:g}" {}/>'.format(rx1, ry1, x1, y1, paint),
+            '<line x1="{:g}" y1="{:g}" x2="{:g}" y2="{:g}" {}/>'.format(rx2, ry2, x2, y2, paint),
+            '<line x1="{:g}" y1="{:g}" x2="{:g}" y2="{:g}" {} marker-start="url(#Measure)" '
+            'marker-end="url(#Measure)"/>'.format(x1, y1, x2, y2, paint),
+            _svg_text(p, (x1 + x2) / 2, (y1 + y2) / 2 - _font_size(p.get("CharHeight", 12)) / 2,
+                      text),
+            '</g>']
+    raise ValueError("No SVG for " + kind)
+
+
+def to_svg(scene):
+    """ The scene as an SVG document string. 1 user unit is 1/100 mm. """
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<svg xmlns="http://www.w3.org/2000/svg" width="{:g}mm" height="{:g}mm" '
+        'viewBox="0 0 {} {}">'.format(scene.width / 100, scene.height / 100,
+                                      scene.width, scene.height),
+        '<defs>',
+        '<marker id="Arrow" viewBox="0 0 20 30" refX="10" refY="0" markerWidth="4" '
+        'markerHeight="6" orient="auto-start-reverse"><path d="M10 0l-10 30h20z"/></marker>',
+        '<marker id="Measure" viewBox="0 0 20 30" refX="10" refY="0" markerWidth="6" '
+        'markerHeight="9" orient="auto-start-reverse"><path d="M10 0l-10 30h20z"/></marker>',
+        '</defs>',
+        '<rect width="{}" height="{}" fill="#ffffff"/>'.format(scene.width, scene.height),
+    ]
+    for shape in scene.shapes:
+        lines += _svg_shape(shape)
+    lines.append('</svg>')
+    return "\n".join(lines) + "\n"
+
+
+# Flat ODF drawing. https://docs.oasis-open.org/office/v1.2/
+
+ODF_NAMESPACES = {
+    "office": "urn:oasis:names:tc:opendocument:xmlns:office:1.0",
+    "style": "urn:oasis:names:tc:opendocument:xmlns:style:1.0",
+    "text": "urn:oasis:names:tc:opendocument:xmlns:text:1.0",
+    "draw": "urn:oasis:names:tc:opendocument:xmlns:drawing:1.0",
+    "fo": "urn:oasis:names:tc:opendocument:xmlns:xsl-fo-compatible:1.0",
+    "svg": "urn:oasis:names:tc:opendocument:xmlns:svg-compatible:1.0",
+}
+
+
+def _mm(value):
+    return "{:g}mm".format(round(value / 100, 3))
+
+
+def _odf_graphic_properties(properties, fill):
+    """ style:graphic-properties attributes, as a sorted tuple of pairs. """
+    attributes = {}
+    if "LineStyle" in properties or "LineColor" in properties or "LineWidth" in properties:
+        attributes["draw:stroke"] = "dash" if properties.get("LineStyle") == "DASH" else "solid"
+    if "LineColor" in properties:
+        attributes["svg:stroke-color"] = _color(properties["LineColor"])
+    if "LineWidth" in properties:
+        attributes["svg:stroke-width"] = _mm(properties["LineWidth"])
+    if properties.get("LineJoint") == "MITER":
+        attributes["draw:stroke-linejoin"] = "miter"
+    if properties.get("LineStartName"):
+        attributes["draw:marker-start"] = properties["LineStartName"]
+        attributes["draw:marker-start-width"] = _mm(properties.get("LineStartWidth", 200))
+    if not fill:
+        attributes["draw:fill"] = "none"
+    elif "FillColor" in properties or "FillStyle" in properties:
+        attributes["draw:fill"] = "solid"
+        attributes["draw:fill-color"] = _color(properties.get("FillColor", 0x729FCF))
+    if fill and properties.get("FillTransparence"):
+        attributes["draw:opacity"] = "{}%".format(100 - properties["FillTransparence"])
+    if "MeasureLineDistance" in properties:
+        attributes["draw:line-distance"] = _mm(properties["MeasureLineDistance"])
+        attributes["draw:placing"] = ("below" if properties.get("MeasureBelowReferenceEdge")
+                                      else "above")
+    return tuple(sorted(attributes.items()))
+
+
+def _odf_text_properties(properties):
+    attributes = {}
+    if "CharHeight" in properties:
+        attributes["fo:font-size"] = "{:g}pt".format(properties["CharHeight"])
+    if "CharColor" in properties:
+        attributes["fo:color"] = _color(properties["CharColor"])
+    if "CharFontName" in properties:
+        attributes["fo:font-family"] = properties["CharFontName"]
+    if "CharWeight" in properties:
+        attributes["fo:font-weight"] = "bold" if properties["CharWeight"] > NORMAL else "normal"
+    return tuple(sorted(attributes.items()))
+
+
+def _attributes(pairs):
+    return " ".join("{}={}".format(name, quoteattr(str(value))) for name, value in pairs)
+
+
+class _OdfStyles():
+    """ Automatic styles, one per distinct set of properties. """
+
+    def __init__(self):
+        self.graphic = {}
+        self.text = {}
+
+    def graphic_style(self, properties, parent, fill):
+        key = (parent, _odf_graphic_properties(properties, fill))
+        if key not in self.graphic:
+            self.graphic[key] = "gr{}".format(len(self.graphic) + 1)
+        return self.graphic[key]
+
+    def text_style(self, properties):
+        key = _odf_text_properties(properties)
+        if not key:
+            return None
+        if key not in self.text:
+            self.text[key] = "P{}".format(len(self.text) + 1)
+        return self.text[key]
+
+    def xml(self):
+        lines = []
+        for (parent, attributes), name in self.graphic.items():
+            parent_attribute = ' style:parent-style-name="{}"'.format(parent) if parent else ""
+            lines.append('<style:style style:name="{}" style:family="graphic"{}>'
+                         '<style:graphic-properties {}/></style:style>'.format(
+                                 name, parent_attribute, _attributes(attributes)))
+        for attributes, name in self.text.items():
+            lines.append('<style:style style:name="{}" style:family="paragraph">'
+                         '<style:text-properties {}/></style:style>'.format(
+                                 name, _attributes(attributes)))
+        return lines
+
+
+def _odf_shape(shape, styles):
+    """ List of XML lines for a shape. """
+    p = shape.properties
+    kind = shape.shape_type
+    common = 'draw:layer={}'.format(quoteattr(LAYERS[shape.layer]))
+    if shape.name:
+        common += ' draw:name={}'.format(quoteattr(shape.name))
+    fill = kind in ("RectangleShape", "EllipseShape", "PolyPolygonShape")
+    if kind == "PolyPolygonShape" and p.get("FillTransparence", 0) >= 100:
+        fill = False
+    if kind != "GroupShape":
+        common += ' draw:style-name="{}"'.format(
+                styles.graphic_style(p, shape.style, fill))
+    text_style = styles.text_style(p)
+    if text_style:
+        common += ' draw:text-style-name="{}"'.format(text_style)
+    box = 'svg:x="{}" svg:y="{}" svg:width="{}" svg:height="{}"'.format(
+            _mm(shape.x), _mm(shape.y), _mm(shape.width), _mm(shape.height))
+    text = '<text:p>{}</text:p>'.format(escape(shape.text)) if shape.text else ""
+
+    if kind == "GroupShape":
+        lines = ['<draw:g {}>'.format(common)]
+        for child in shape.children:
+            lines += _odf_shape(child, styles)
+        return lines + ['</draw:g>']
+    if kind == "RectangleShape":
+        return ['<draw:rect {} {}>{}</draw:rect>'.format(common, box, text)]
+    if kind == "EllipseShape":
+        return ['<draw:ellipse {} {}>{}</draw:ellipse>'.format(common, box, text)]
+    if kind == "TextShape":
+        return ['<draw:frame {} {}><draw:text-box>{}</draw:text-box></draw:frame>'.format(
+                common, box, text)]
+    if kind == "PolyPolygonShape":
+        lines = []
+        for polygon in shape.points:
+            xs = [x for x, y in polygon]
+            ys = [y for x, y in polygon]
+            left, top = min(xs), min(ys)
+            width, height = max(xs) - left, max(ys) - top
+            lines.append('<draw:polygon {} svg:x="{}" svg:y="{}" svg:width="{}" '
+                         'svg:height="{}" svg:viewBox="{} {} {} {}" draw:points="{}"/>'.format(
+                    common, _mm(left), _mm(top), _mm(width), _mm(height),
+                    left, top, width, height,
+                    " ".join("{},{}".format(x, y) for x, y in polygon)))
+        return lines
+    if kind in ("LineShape", "MeasureShape"):
+        x1, y1, x2, y2 = line_end_points(shape)
+        element = "draw:line" if kind == "LineShape" else "draw:measure"
+        return ['<{0} {1} svg:x1="{2}" svg:y1="{3}" svg:x2="{4}" svg:y2="{5}">{6}</{0}>'.format(
+                element, common, _mm(x1), _mm(y1), _mm(x2), _mm(y2), text)]
+    raise ValueError("No ODG for " + kind)
+
+
+def to_fodg(scene):
+    """ The scene as a flat ODF drawing document string. """
+    styles = _OdfStyles()
+    body = []
+    for shape in scene.shapes:
+        body += _odf_shape(shape, styles)
+
+    named_styles = []
+    for name, properties in sorted(STYLES.items()):
+        dash = properties.get("LineDash")
+        if dash:
+            named_styles.append(
+                    '<draw:stroke-dash draw:name="{0}" draw:style="{1}" draw:dots1="{2}" '
+                    'draw:dots1-length="{3}" draw:dots2="{4}" draw:dots2-length="{5}" '
+                    'draw:distance="{6}"/>'.format(
+                            name, "round" if dash["Style"] == "ROUND" else "rect",
+                            dash["Dots"], _mm(dash["DotLen"] or 1), dash["Dashes"],
+                            _mm(dash["DashLen"]), _mm(dash["Distance"])))
+        named_styles.append('<style:style style:name="{}" style:family="graphic">'
+                            '<style:graphic-properties {}{}/></style:style>'.format(
+                name, _attributes(_odf_graphic_properties(properties, False)),
+                ' draw:stroke-dash="{}"'.format(name) if dash else ""))
+
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<office:document {} office:version="1.2" '
+        'office:mimetype="application/vnd.oasis.opendocument.graphics">'.format(
+                " ".join('xmlns:{}="{}"'.format(prefix, uri)
+                         for prefix, uri in ODF_NAMESPACES.items())),
+        '<office:styles>',
+        '<draw:marker draw:name="Arrow" svg:viewBox="0 0 20 30" svg:d="M10 0l-10 30h20z"/>',
+    ] + named_styles + [
+        '</office:styles>',
+        '<office:automatic-styles>',
+        '<style:page-layout style:name="PM1"><style:page-layout-properties '
+        'fo:margin-top="{0}" fo:margin-bottom="{0}" fo:margin-left="{0}" fo:margin-right="{0}" '
+        'fo:page-width="{1}" fo:page-height="{2}" style:print-orientation="landscape"/>'
+        '</style:page-layout>'.format(_mm(scene.border), _mm(scene.width), _mm(scene.height)),
+        '<style:style style:name="dp1" style:family="drawing-page"/>',
+    ] + styles.xml() + [
+        '</office:automatic-styles>',
+        '<office:master-styles>',
+        '<draw:layer-set>',
+    ] + ['<draw:layer draw:name={}/>'.format(quoteattr(name)) for name in LAYERS] + [
+        '</draw:layer-set>',
+        '<style:master-page style:name="Default" style:page-layout-name="PM1" '
+        'draw:style-name="dp1"/>',
+        '</office:master-styles>',
+        '<office:body><office:drawing>',
+        '<draw:page draw:name="page1" draw:master-page-name="Default">',
+    ] + body + [
+        '</draw:page>',
+        '</office:drawing></office:body>',
+        '</office:document>',
+    ]
+    return "\n".join(lines) + "\n"
+
+
+# Renderer for each output file extension.
+RENDERERS = {
+    "svg": to_svg,
+    "fodg": to_fodg,
+}
+
+
+def write(scene, path):
+    """ Render the scene to path, as SVG or flat ODG by its extension. """
+    extension = os.path.splitext(path)[1].lstrip(".").lower()
+    if extension not in RENDERERS:
+        raise ValueError("Unknown format {}. Choose from: {}".format(
+                extension, ", ".join(RENDERERS)))
+    with open(path, "w", encoding="utf-8") as fout:
+        fout.write(RENDERERS[extension](scene))
+
+
+def main(argv=None):
+    """ Command line entry point. """
+    parser = argparse.ArgumentParser(
+            description="Render floor plan variants without LibreOffice.")
+    parser.add_argument("variants", help="JSON or CSV file of variants, as draw_batch.py")
+    parser.add_argument("--out", default="previews", help="output directory")
+    parser.add_argument("--formats", default="svg",
+                        help="comma separated, from: " + ", ".join(RENDERERS))
+    args = parser.parse_args(argv)
+
+    formats = [f.strip().lower() for f in args.formats.split(",") if f.strip()]
+    unknown = [f for f in formats if f not in RENDERERS]
+    if unknown:
+        parser.error("unknown format: " + ", ".join(unknown))
+
+    os.makedirs(args.out, exist_ok=True)
+    variants = read_variants(args.variants)
+    for variant in variants:
+        scene = variant_scene(variant)
+        for extension in formats:
+            write(scene, os.path.join(args.out, variant["name"] + "." + extension))
+    print("Rendered:", len(variants))
+    return 0
+
+
+if __name__ == "__main__":
+
+    sys.exit(main())
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+#
+# office_pool.py
+#
+# A pool of headless LibreOffice processes for batch document generation.
+# One soffice process is effectively single threaded, so N processes, each
+# on its own port and with its own user profile directory, let a batch use
+# N cores. Jobs are handed to idle workers. A worker whose office crashes
+# is restarted and its job retried.
+#
+# Usage:
+#   with office_pool.OfficePool(4) as pool:
+#       results = pool.map(job, items)
+#
+# where job(desktop, item) does the work for one item using that worker's
+# desktop, e.g. draw_batch.render_variant(). Results come back in order.
+# A job that still fails after the retries gives its exception as the result.
+#
+# The soffice program is found on the PATH, or set SOFFICE to its path.
+#
+# launch() starts one office for a script's own connection, when none is
+# already listening. See uno_connection.connect_or_launch(). It has a new
+# profile of its own, so scripts launching at once don't share one.
+#
+import atexit
+import os
+import queue
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+
+# Imports uno, which makes the com.sun.star names importable.
+import uno_connection
+
+from com.sun.star.uno import RuntimeException
+from com.sun.star.connection import NoConnectException
+
+# Seconds to wait for a new office to answer on its bridge.
+START_TIMEOUT = 60.0
+# Times a job is retried after its worker's office died.
+JOB_RETRIES = 2
+
+
+def find_soffice():
+    """ Path of the soffice program. """
+    path = os.environ.get("SOFFICE") or shutil.which("soffice") or shutil.which("libreoffice")
+    if not path:
+        raise FileNotFoundError("soffice not found. Install LibreOffice or set SOFFICE.")
+    return path
+
+
+def accept_string(connect_string):
+    """ soffice --accept= argument that a UNO connect string connects to. """
+    # "uno:socket,host=localhost,port=2002;urp;StarOffice.ComponentContext"
+    # --> "socket,host=localhost,port=2002;urp;StarOffice.ServiceManager"
+    connection, protocol = connect_string.split(":", 1)[1].split(";")[:2]
+    return "{};{};StarOffice.ServiceManager".format(connection, protocol)
+
+
+def free_port():
+    """ A TCP port on localhost that nothing is listening on just now. """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+class OfficeProcess():
+    """
+    One headless soffice, listening on its own port or named pipe, with its
+    own profile directory so it does not share (or lock) the user's profile.
+    Given a Connection, it listens where that connects to.
+    """
+
+    def __init__(self, port=None, profile_dir=None, soffice=None, pipe=None,
+                 connection=None):
+        self.soffice = soffice or find_soffice()
+        self._own_profile = profile_dir is None
+        self.profile_dir = profile_dir or tempfile.mkdtemp(prefix="lo_profile_")
+        if connection is not None:
+            self.connect_string = connection.connect_string
+        elif pipe:
+            self.connect_string = ("uno:pipe,name={};urp;"
+                                   "StarOffice.ComponentContext".format(pipe))
+        else:
+            self.connect_string = ("uno:socket,host=localhost,port={};urp;"
+                                   "StarOffice.ComponentContext".format(port or free_port()))
+        self.connection = connection or uno_connection.Connection(self.connect_string)
+        self.process = None
+        # Seconds from launch until the bridge answered, for the last start().
+        self.start_seconds = None
+
+    def command(self):
+        return [
+            self.soffice,
+            "--headless", "--invisible", "--nologo", "--norestore",
+            "--nodefault", "--nolockcheck",
+            "-env:UserInstallation=file://" + os.path.abspath(self.profile_dir),
+            "--accept=" + accept_string(self.connect_string),
+        ]
+
+    def start(self, timeout=START_TIMEOUT):
+        """ Launch soffice and wait until its bridge answers. """
+        started = time.monotonic()
+        self.process = subprocess.Popen(self.command(), stdin=subprocess.DEVNULL,
+                                        stdout=subprocess.DEVNULL,
+                                        stderr=subprocess.DEVNULL)
+        deadline = started + timeout
+        while True:
+            if self.process.poll() is not None:
+                raise RuntimeError("soffice exited with code {} for {}".format(
+                        self.process.returncode, self.connect_string))
+            try:
+                self.connection.connect()
+                self.start_seconds = time.monotonic() - started
+                return
+            except NoConnectException:
+                if time.monotonic() > deadline:
+                    self.stop()
+                    raise
+            time.sleep(0.1)
+
+    def is_alive(self):
+        """ True if the process is running and its bridge answers. """
+        return (self.process is not None and self.process.poll() is None and
+                self.connection.is_alive())
+
+    def restart(self):
+        self.stop(remove_profile=False)
+        self.start()
+
+    def stop(self, remove_profile=True, timeout=10.0):
+        """ Ask the office to terminate, then make sure the process is gone. """
+        if self.process is not None and self.process.poll() is None:
+            try:
+                if self.connection.is_alive():
+                    self.connection.desktop.terminate()
+            except RuntimeException:
+                # The bridge drops as the office exits. e.g. DisposedException
+                pass
+            try:
+                self.process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.connection.close()
+        self.process = None
+        if remove_profile and self._own_profile:
+            shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+
+class OfficePool():
+    """ N OfficeProcess workers, each served by its own thread. """
+
+    def __init__(self, size=None, soffice=None, job_retries=JOB_RETRIES,
+                 office_factory=None):
+        self.size = size or os.cpu_count() or 1
+        self.soffice = soffice
+        self.job_retries = job_retries
+        # Makes one worker. Another, e.g. uno_mock.MockOffice, runs the pool
+        # without soffice.
+        self.office_factory = office_factory or (lambda: OfficeProcess(soffice=soffice))
+        self.workers = []
+        # Counts of restarted workers and retried jobs, for reporting.
+        self.restarts = 0
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        """ Launch the workers. They start in parallel. """
+        self.workers = [self.office_factory() for i in range(self.size)]
+        errors = []
+
+        def start_worker(worker):
+            try:
+                worker.start()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=start_worker, args=(worker,))
+                   for worker in self.workers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            self.stop()
+            raise errors[0]
+
+    def stop(self):
+        for worker in self.workers:
+            worker.stop()
+        self.workers = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def map(self, job, items):
+        """ Run job(desktop, item) for every item. Returns results in order. """
+        items = list(items)
+        results = [None] * len(items)
+        jobs = queue.Queue()
+        for number, item in enumerate(items):
+            jobs.put((number, item, 0))
+
+        def serve(worker):
+            while True:
+                try:
+                    number, item, tries = jobs.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    results[number] = job(worker.connection.get_desktop(), item)
+                except Exception as e:
+                    if worker.is_alive():
+                        # The job failed, not the office.
+                        results[number] = e
+                        continue
+                    if tries < self.job_retries:
+                        with self._lock:
+                            self.retries += 1
+                        jobs.put((number, item, tries + 1))
+                    else:
+                        results[number] = e
+                    try:
+                        worker.restart()
+                    except Exception:
+                        # Leave the remaining jobs to the other workers.
+                        return
+                    with self._lock:
+                        self.restarts += 1
+
+        threads = [threading.Thread(target=serve, args=(worker,))
+                   for worker in self.workers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Any jobs left over had no worker to run them.
+        while not jobs.empty():
+            number, item, tries = jobs.get_nowait()
+            results[number] = RuntimeError("No office worker left to run the job")
+        return results
+
+
+def launch(connection, timeout=START_TIMEOUT):
+    """
+    Start a headless office for connection to connect to, and connect it.
+    The office, and its profile, are removed when Python exits. Returns the
+    OfficeProcess.
+    """
+    office = OfficeProcess(connection=connection)
+    try:
+        office.start(timeout)
+    except Exception:
+        # e.g. soffice exited at once. Remove its profile.
+        office.stop()
+        raise
+    atexit.register(office.stop)
+    return office
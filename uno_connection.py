@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+#
+# uno_connection.py
+#
+# Shared connection to a running LibreOffice, for draw_uno_plan.py and
+# calc_uno_python_amortization.py. The component context, service manager
+# and desktop are cached, so a callback does not create a new UnoUrlResolver
+# and resolve() the socket every time it runs.
+#
+# For the callbacks to find it, place a copy in:
+# ~/.config/libreoffice/4/user/Scripts/python/pythonpath/
+#
+# LibreOffice must be listening. e.g.
+# $ soffice "--accept=socket,host=localhost,port=2002;urp;StarOffice.ServiceManager"
+#
+# Usage:
+#   desktop = uno_connection.get_connection().get_desktop()
+#   doc = desktop.getCurrentComponent()
+#
+# Or, from a script run outside the office, start a headless office if none
+# is listening yet. It is terminated when the script exits:
+#   desktop = uno_connection.connect_or_launch().get_desktop()
+#
+# Batch many changes to a document, so the office repaints, and optionally
+# records undo, once at the end rather than for every call:
+#   with uno_connection.batch_updates(doc, lock_undo=True):
+#       ...
+#
+# Count and time the bridge calls made through the desktop, by calling
+# function. Set environment UNO_TRACE, or see uno_trace.py:
+#   tracer = uno_trace.enable()
+#
+# Or, a pool of bridges for work on several documents in parallel threads:
+#   pool = uno_connection.ConnectionPool(4)
+#   with pool.connection() as connection:
+#       desktop = connection.get_desktop()
+#
+import contextlib
+import os
+import queue
+import threading
+import time
+
+import uno
+
+from com.sun.star.lang import DisposedException
+from com.sun.star.connection import NoConnectException
+
+CONNECT_STRING = "uno:socket,host=localhost,port=2002;urp;StarOffice.ComponentContext"
+# https://wiki.openoffice.org/wiki/Documentation/DevGuide/ProUNO/Characteristics_of_the_Interprocess_Bridge
+# "uno:socket,host=localhost,port=2002;urp,Negotiate=0,ForceSynchronous=0;StarOffice.ServiceManager"
+
+# Reconnect attempts, and the delay before the first retry in seconds.
+# The delay doubles after each failed attempt.
+RETRIES = 4
+BACKOFF = 0.25
+
+# connect_or_launch() starts an office if none is listening. Set to False,
+# or set environment UNO_LAUNCH=0, to fail with NoConnectException instead.
+LAUNCH = os.environ.get("UNO_LAUNCH", "1") != "0"
+# Seconds to wait for a launched office to answer.
+LAUNCH_TIMEOUT = 60.0
+
+# The uno_trace.Tracer that get_desktop() wraps the desktop for, or None.
+# Set by uno_trace.enable(), or at import by environment UNO_TRACE.
+TRACER = None
+
+
+class Connection():
+    """
+    One bridge to the office. Connects on first use and caches the context,
+    service manager and desktop. If the bridge has been disposed, e.g. the
+    office was restarted, it reconnects with backoff.
+    """
+
+    def __init__(self, connect_string=CONNECT_STRING, retries=RETRIES,
+                 backoff=BACKOFF):
+        self.connect_string = connect_string
+        self.retries = retries
+        self.backoff = backoff
+        self.ctx = None
+        self.smgr = None
+        self.desktop = None
+        # Number of times resolve() has been called. 1 after a cold start.
+        self.connects = 0
+        # The office started by connect_or_launch(), and the seconds it took
+        # to answer. None if the office was already running.
+        self.office = None
+        self.cold_start = None
+
+    def connect(self):
+        """ Resolve the connect string. Raises NoConnectException if refused. """
+        # get the uno component context from the PyUNO runtime
+        localContext = uno.getComponentContext()
+        # create the UnoUrlResolver
+        resolver = localContext.ServiceManager.createInstanceWithContext(
+                "com.sun.star.bridge.UnoUrlResolver", localContext)
+        # connect to the running office
+        self.connects += 1
+        ctx = resolver.resolve(self.connect_string)
+        smgr = ctx.ServiceManager
+        # get the central desktop object
+        desktop = smgr.createInstanceWithContext("com.sun.star.frame.Desktop", ctx)
+        self.ctx, self.smgr, self.desktop = ctx, smgr, desktop
+
+    def reconnect(self):
+        """ Connect, retrying with a doubling delay. Re-raises the last error. """
+        self.close()
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            try:
+                self.connect()
+                return
+            except (NoConnectException, DisposedException):
+                if attempt == self.retries:
+                    raise
+            time.sleep(delay)
+            delay *= 2
+
+    def is_alive(self):
+        """ True if connected and the bridge still answers. One bridge call. """
+        if self.ctx is None:
+            return False
+        try:
+            self.ctx.getServiceManager()
+        except DisposedException:
+            return False
+        return True
+
+    def get_desktop(self):
+        """ The cached desktop, connecting or reconnecting first if needed. """
+        if not self.is_alive():
+            self.reconnect()
+        if TRACER is not None:
+            return TRACER.wrap(self.desktop, "Desktop")
+        return self.desktop
+
+    def close(self):
+        """ Forget the cached objects. The bridge goes when they are released. """
+        self.ctx = None
+        self.smgr = None
+        self.desktop = None
+
+
+# The Connection shared by the scripts in this process.
+_connection = None
+_lock = threading.Lock()
+
+
+def get_connection(connect_string=CONNECT_STRING):
+    """ The shared Connection. Created on first use. Not yet connected. """
+    global _connection
+    with _lock:
+        if _connection is None or _connection.connect_string != connect_string:
+            _connection = Connection(connect_string)
+        return _connection
+
+
+@contextlib.contextmanager
+def batch_updates(doc, lock_undo=False):
+    """
+    Lock the document's controllers and, if it has one, add an action lock,
+    so views are not repainted until the block ends. With lock_undo, the
+    UndoManager is locked too, and records no undo actions. Each lock is
+    released in turn even if the block raises. Blocks may be nested.
+    """
+    with contextlib.ExitStack() as stack:
+        doc.lockControllers()
+        stack.callback(doc.unlockControllers)
+        # A Calc document is XActionLockable. A Draw document is not.
+        if hasattr(doc, "addActionLock"):
+            doc.addActionLock()
+            stack.callback(doc.removeActionLock)
+        if lock_undo:
+            undo_manager = doc.getUndoManager()
+            undo_manager.lock()
+            stack.callback(undo_manager.unlock)
+        yield doc
+
+
+def connect_or_launch(connect_string=CONNECT_STRING, timeout=None):
+    """
+    The shared Connection, connected. A warm office, already listening on
+    connect_string, is used as is. Otherwise a headless office is launched
+    to listen on it. Not for callbacks, which run inside an office already.
+    """
+    connection = get_connection(connect_string)
+    if connection.is_alive():
+        return connection
+    try:
+        # One attempt, not reconnect(). Its backoff would only delay a launch.
+        connection.connect()
+        return connection
+    except NoConnectException:
+        if not LAUNCH:
+            raise
+    # Imported here as office_pool imports this module.
+    import office_pool
+    connection.office = office_pool.launch(connection, timeout or LAUNCH_TIMEOUT)
+    connection.cold_start = connection.office.start_seconds
+    print("Launched office. Cold start: {:.2f}s".format(connection.cold_start))
+    return connection
+
+
+class ConnectionPool():
+    """
+    A fixed number of Connections, each its own bridge, for threads working
+    on different documents at once. connect_strings may be one string, used
+    for every bridge, or a list of them, e.g. one per office process.
+    """
+
+    def __init__(self, size=2, connect_strings=CONNECT_STRING):
+        if isinstance(connect_strings, str):
+            connect_strings = [connect_strings] * size
+        self.connections = [Connection(s) for s in connect_strings]
+        self._idle = queue.Queue()
+        for connection in self.connections:
+            self._idle.put(connection)
+
+    def acquire(self, timeout=None):
+        """ Wait for an idle Connection. """
+        return self._idle.get(timeout=timeout)
+
+    def release(self, connection):
+        self._idle.put(connection)
+
+    @contextlib.contextmanager
+    def connection(self, timeout=None):
+        """ with pool.connection() as connection: ... """
+        connection = self.acquire(timeout)
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    def close(self):
+        for connection in self.connections:
+            connection.close()
+
+
+if os.environ.get("UNO_TRACE"):
+    # Imported here as uno_trace imports this module.
+    import uno_trace
+    uno_trace.enable(os.environ["UNO_TRACE"])
@@ -0,0 +1,1146 @@
+#!/usr/bin/env python3
+#
+# uno_mock.py
+#
+# A local stand-in for the UNO bridge so the scripts can be run and their
+# bridge traffic counted without LibreOffice. Every method call and every
+# property get or set on a mock object is one "round-trip" and is counted
+# by the MockBridge that owns it.
+#
+# Usage:
+#   import uno_mock
+#   bridge = uno_mock.install()   # Before importing the scripts.
+#   import calc_uno_python_amortization
+#   sheet = uno_mock.MockSheet(bridge)
+#   ...
+#   print(bridge.total, bridge.calls.most_common(5))
+#
+# Latency per call can be slept, to time a script as if over a real bridge,
+# or only added up in bridge.elapsed, which is deterministic. e.g.
+#   bridge = uno_mock.install(uno_mock.MockBridge(profile="socket", sleep=False))
+#
+# Form controls keep the script events registered on them, and fire() calls
+# the registered Python function, as the office would on a button push.
+#
+import collections
+import importlib
+import os
+import sys
+import time
+import types
+
+# Seconds per call, and per connect, of the ways a script reaches the
+# office. Rough figures for a local office. Measure yours with uno_trace.py
+PROFILES = {
+    "inprocess": (0.000005, 0.0),  # A macro run by the office itself.
+    "pipe": (0.00005, 0.05),
+    "socket": (0.0001, 0.1),
+}
+
+
+class MockBridge():
+    """ Counts the round-trips made by all of the mock objects it owns. """
+
+    def __init__(self, latency=0.0, connect_latency=0.0, profile=None, sleep=True):
+        self.calls = collections.Counter()
+        # Property values sent to the office. A rough measure of payload.
+        self.values = 0
+        # Seconds per call, and per resolve(), to imitate a bridge. Slept
+        # unless sleep is False. Either way added up in elapsed.
+        self.latency = latency
+        self.connect_latency = connect_latency
+        self.sleep = sleep
+        self.elapsed = 0.0
+        if profile:
+            self.use_profile(profile)
+        # Documents open in the mock office. The last is the current one.
+        self.components = []
+        # Set True to make resolve() fail, or the next call raise Disposed.
+        self.refuse = False
+        self.disposed = False
+        # Calls left before the office "crashes" and the bridge is disposed.
+        # None for never. See MockOffice.kill().
+        self.crash_after = None
+        # Controller and undo locks held on any document of this bridge, and
+        # the repaints and undo actions that changes made while unlocked
+        # would have cost the office.
+        self.controller_locks = 0
+        self.undo_locks = 0
+        self.repaints = 0
+        self.undo_actions = 0
+
+    def record(self, name, values=0):
+        if self.crash_after is not None:
+            self.crash_after -= 1
+            if self.crash_after < 0:
+                self.crash_after = None
+                self.disposed = True
+        if self.disposed:
+            raise DisposedException("Binary URP bridge disposed during call")
+        self.calls[name] += 1
+        self.values += values
+        if _is_change(name):
+            if not self.controller_locks:
+                self.repaints += 1
+            if not self.undo_locks:
+                self.undo_actions += 1
+        if self.latency:
+            self.elapsed += self.latency
+            if self.sleep:
+                time.sleep(self.latency)
+
+    def use_profile(self, profile):
+        """ Take the latencies of one of PROFILES, e.g. "socket". """
+        self.latency, self.connect_latency = PROFILES[profile]
+
+    @property
+    def total(self):
+        return sum(self.calls.values())
+
+    def reset(self):
+        self.calls.clear()
+        self.values = 0
+        self.repaints = 0
+        self.undo_actions = 0
+        self.elapsed = 0.0
+
+
+def _is_change(name):
+    """ True if the call named "Kind.method" changes a document. """
+    method = name.rsplit(".", 1)[-1]
+    return (method.startswith(("set", "add", "remove", "insert", "clear")) and
+            not method.endswith("ActionLock"))
+
+
+class MockObject():
+    """
+    Base for the mock UNO objects. Public attributes are UNO properties and
+    each get or set is counted. Methods are counted by calling _call().
+    Names starting with "_" are local Python state and are not counted.
+    """
+    _kind = "Object"
+    # A far side object, as uno_trace.is_proxy() sees it.
+    uno_proxy = True
+
+    def __init__(self, bridge, **properties):
+        object.__setattr__(self, "_bridge", bridge)
+        object.__setattr__(self, "_props", dict(properties))
+
+    def _call(self, method):
+        self._bridge.record(self._kind + "." + method)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        self._bridge.record(self._kind + ".get" + name)
+        try:
+            return self._props[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        if name.startswith("_"):
+            object.__setattr__(self, name, value)
+            return
+        self._bridge.record(self._kind + ".set" + name, 1)
+        self._props[name] = value
+
+
+class MockCell(MockObject):
+    """ A single cell. Value and String are stored on the sheet. """
+    _kind = "Cell"
+
+    def __init__(self, bridge, sheet, col, row):
+        MockObject.__init__(self, bridge)
+        self._sheet = sheet
+        self._key = (col, row)
+
+    def __getattr__(self, name):
+        if name in ("Value", "String"):
+            self._bridge.record(self._kind + ".get" + name)
+            value = self._sheet._data.get(self._key, "")
+            if name == "Value":
+                return value if isinstance(value, float) else 0.0
+            return value if isinstance(value, str) else str(value)
+        return MockObject.__getattr__(self, name)
+
+    def __setattr__(self, name, value):
+        if name == "Value":
+            self._bridge.record(self._kind + ".setValue", 1)
+            self._sheet._data[self._key] = float(value)
+        elif name == "String":
+            self._bridge.record(self._kind + ".setString", 1)
+            if value == "":
+                self._sheet._data.pop(self._key, None)
+            else:
+                self._sheet._data[self._key] = value
+        else:
+            MockObject.__setattr__(self, name, value)
+
+
+class MockCellRange(MockObject):
+    """ A rectangular block of cells. Inclusive, as getCellRangeByPosition. """
+    _kind = "CellRange"
+
+    def __init__(self, bridge, sheet, left, top, right, bottom):
+        MockObject.__init__(self, bridge)
+        self._sheet = sheet
+        self._area = (left, top, right, bottom)
+
+    def _keys(self):
+        left, top, right, bottom = self._area
+        for row in range(top, bottom + 1):
+            for col in range(left, right + 1):
+                yield col, row
+
+    def setDataArray(self, data):
+        self._bridge.record(self._kind + ".setDataArray",
+                            sum(len(row) for row in data))
+        left, top, right, bottom = self._area
+        if len(data) != bottom - top + 1 or any(
+                len(row) != right - left + 1 for row in data):
+            raise ValueError("setDataArray: data does not match the range size")
+        for i, row in enumerate(data):
+            for j, value in enumerate(row):
+                if isinstance(value, str):
+                    if value == "":
+                        self._sheet._data.pop((left + j, top + i), None)
+                    else:
+                        self._sheet._data[(left + j, top + i)] = value
+                else:
+                    self._sheet._data[(left + j, top + i)] = float(value)
+
+    def clearContents(self, flags):
+        self._call("clearContents")
+        for key in self._keys():
+            value = self._sheet._data.get(key)
+            if value is None:
+                continue
+            if isinstance(value, str) and flags & 4:  # STRING
+                del self._sheet._data[key]
+            elif not isinstance(value, str) and flags & 1:  # VALUE
+                del self._sheet._data[key]
+
+    def getDataArray(self):
+        self._call("getDataArray")
+        left, top, right, bottom = self._area
+        return tuple(
+                tuple(self._sheet._data.get((col, row), "")
+                      for col in range(left, right + 1))
+                for row in range(top, bottom + 1))
+
+
+class MockTableChart(MockObject):
+    """ A chart on a sheet. Holds the cell ranges it plots. """
+    _kind = "TableChart"
+
+    def __init__(self, bridge, ranges, name=""):
+        MockObject.__init__(self, bridge, Name=name)
+        self._ranges = ranges
+        self._chart = None
+
+    def __getattr__(self, name):
+        if name == "EmbeddedObject":
+            self._bridge.record(self._kind + ".getEmbeddedObject")
+            if self._chart is None:
+                self._chart = MockAutoObject(self._bridge, "ChartDocument")
+            return self._chart
+        return MockObject.__getattr__(self, name)
+
+    def getRanges(self):
+        self._call("getRanges")
+        # A copy, as the bridge returns a new sequence each time.
+        return tuple(_struct("CellRangeAddress", ())(**vars(r)) for r in self._ranges)
+
+    def setRanges(self, ranges):
+        self._call("setRanges")
+        self._ranges = tuple(ranges)
+
+
+class MockTableCharts(MockObject):
+    """ The charts of a sheet. """
+    _kind = "TableCharts"
+
+    def __init__(self, bridge):
+        MockObject.__init__(self, bridge)
+        self._charts = []
+
+    def getByIndex(self, index):
+        self._call("getByIndex")
+        return self._charts[index]
+
+    def getCount(self):
+        self._call("getCount")
+        return len(self._charts)
+
+    def addNewByName(self, name, rectangle, ranges, column_headers, row_headers):
+        self._call("addNewByName")
+        self._charts.append(MockTableChart(self._bridge, tuple(
+                _struct("CellRangeAddress", ())(**vars(r)) for r in ranges), name))
+
+    def hasByName(self, name):
+        self._call("hasByName")
+        return any(chart._props["Name"] == name for chart in self._charts)
+
+    def getByName(self, name):
+        self._call("getByName")
+        for chart in self._charts:
+            if chart._props["Name"] == name:
+                return chart
+        raise KeyError("NoSuchElementException: " + name)
+
+    def removeByName(self, name):
+        self._call("removeByName")
+        self._charts = [chart for chart in self._charts if chart._props["Name"] != name]
+
+
+class MockAutoObject(MockObject):
+    """ 
+    A chart document, or a part of one. Any part, e.g. Title or Diagram,
+    appears on first get, and createInstance() makes a new one.
+    """
+
+    def __init__(self, bridge, kind):
+        MockObject.__init__(self, bridge)
+        self._kind = kind
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        self._bridge.record(self._kind + ".get" + name)
+        if name not in self._props:
+            self._props[name] = MockAutoObject(self._bridge, name)
+        return self._props[name]
+
+    def createInstance(self, service):
+        self._call("createInstance")
+        return MockAutoObject(self._bridge, service.rsplit(".", 1)[-1])
+
+
+class MockSheet(MockObject):
+    """ 
+    A spreadsheet. Cell contents are held in a dict keyed by (col, row).
+    With chart, it has one, of the balance column as set up by setup_chart().
+    """
+    _kind = "Sheet"
+
+    def __init__(self, bridge, name="Amortization", chart=True, doc=None):
+        MockObject.__init__(self, bridge, Name=name)
+        self._data = {}
+        self._doc = doc
+        self._draw_page = None
+        self._charts = MockTableCharts(bridge)
+        if chart:
+            self._charts._charts.append(MockTableChart(bridge, (
+                    _struct("CellRangeAddress", ())(Sheet=0, StartColumn=0, StartRow=9,
+                                                    EndColumn=2, EndRow=369),), "MyChart"))
+
+    def __getattr__(self, name):
+        if name == "Charts":
+            self._bridge.record(self._kind + ".getCharts")
+            return self._charts
+        if name == "DrawPage":
+            self._bridge.record(self._kind + ".getDrawPage")
+            if self._draw_page is None:
+                self._draw_page = MockDrawPage(self._bridge, self._doc)
+            return self._draw_page
+        return MockObject.__getattr__(self, name)
+
+    def setName(self, name):
+        """ Renames the sheet in its document's Sheets too. """
+        self._call("setName")
+        if self._doc is not None:
+            sheets = self._doc._sheets._elements
+            sheets[name] = sheets.pop(self._props["Name"])
+        self._props["Name"] = name
+
+    def getCellByPosition(self, col, row):
+        self._call("getCellByPosition")
+        return MockCell(self._bridge, self, col, row)
+
+    def getCellRangeByPosition(self, left, top, right, bottom):
+        self._call("getCellRangeByPosition")
+        return MockCellRange(self._bridge, self, left, top, right, bottom)
+
+
+class MockShape(MockObject):
+    """ A drawing shape. Created by MockDocument.createInstance(). """
+
+    def __init__(self, bridge, kind):
+        MockObject.__init__(self, bridge, Name="", LayerID=0, String="",
+                            LineDash=_struct("LineDash", ())())
+        self._kind = kind
+        self._position = (0, 0)
+        self._size = (0, 0)
+        self._page = None
+
+    def setPosition(self, point):
+        self._call("setPosition")
+        self._position = (point.X, point.Y)
+
+    def getPosition(self):
+        self._call("getPosition")
+        return _MODULES["com.sun.star.awt"]["Point"](*self._position)
+
+    def setSize(self, size):
+        self._call("setSize")
+        self._size = (size.Width, size.Height)
+
+    def getSize(self):
+        self._call("getSize")
+        return _MODULES["com.sun.star.awt"]["Size"](*self._size)
+
+    def setPropertyValues(self, names, values):
+        self._bridge.record(self._kind + ".setPropertyValues", len(values))
+        if list(names) != sorted(names):
+            raise ValueError("setPropertyValues: names must be sorted")
+        self._props.update(zip(names, values))
+
+    def setPropertyValue(self, name, value):
+        self._bridge.record(self._kind + ".setPropertyValue", 1)
+        self._props[name] = value
+
+    def getPropertyValue(self, name):
+        self._call("getPropertyValue")
+        return self._props[name]
+
+    def setString(self, text):
+        self._bridge.record(self._kind + ".setString", 1)
+        self._props["String"] = text
+
+    def setControl(self, model):
+        self._bridge.record(self._kind + ".setControl", 1)
+        self._props["Control"] = model
+
+    def getControl(self):
+        self._call("getControl")
+        return self._props.get("Control")
+
+
+def _remove_from_end(shapes, shape):
+    """ Remove shape from the list, searching from the top down. """
+    for i in range(len(shapes) - 1, -1, -1):
+        if shapes[i] is shape:
+            del shapes[i]
+            return
+    raise ValueError("remove: shape is not on this page")
+
+
+class MockGroupShape(MockShape):
+    """ A GroupShape. Holds child shapes like a page does. """
+
+    def __init__(self, bridge, kind="GroupShape"):
+        MockShape.__init__(self, bridge, kind)
+        self._shapes = []
+
+    def add(self, shape):
+        self._call("add")
+        shape._page = self
+        self._shapes.append(shape)
+
+    def remove(self, shape):
+        self._call("remove")
+        _remove_from_end(self._shapes, shape)
+        shape._page = None
+
+    def getCount(self):
+        self._call("getCount")
+        return len(self._shapes)
+
+    def getByIndex(self, index):
+        self._call("getByIndex")
+        return self._shapes[index]
+
+
+class MockDrawPage(MockObject):
+    """ 
+    A Draw page, or the draw page of a sheet. Holds its shapes in order, as
+    getByIndex() sees them, and the Forms of its form controls.
+    """
+    _kind = "DrawPage"
+
+    def __init__(self, bridge, doc=None):
+        MockObject.__init__(self, bridge)
+        self._shapes = []
+        self._forms = MockForms(bridge, doc)
+
+    def __getattr__(self, name):
+        if name == "Count":
+            self._bridge.record(self._kind + ".getCount")
+            return len(self._shapes)
+        if name == "Forms":
+            return self.getForms()
+        return MockObject.__getattr__(self, name)
+
+    def getForms(self):
+        self._call("getForms")
+        return self._forms
+
+    def add(self, shape):
+        self._call("add")
+        shape._page = self
+        self._shapes.append(shape)
+        model = shape._props.get("Control")
+        if model is not None and model._props.get("Parent") is None:
+            # As the office does, a control not yet in a form goes into the
+            # page's first form, made if need be.
+            if not self._forms._forms:
+                self._forms._insert(MockForm(self._bridge, Name="Standard"))
+            self._forms._forms[0]._insert(model._props["Name"], model)
+
+    def remove(self, shape):
+        self._call("remove")
+        _remove_from_end(self._shapes, shape)
+        shape._page = None
+
+    def getCount(self):
+        self._call("getCount")
+        return len(self._shapes)
+
+    def getByIndex(self, index):
+        self._call("getByIndex")
+        return self._shapes[index]
+
+
+class MockControlModel(MockObject):
+    """ 
+    The model of a form control, e.g. a ScrollBar or CommandButton. As in the
+    office, a new control takes its DefaultScrollValue as its ScrollValue.
+    """
+
+    def __init__(self, bridge, kind, **properties):
+        properties.setdefault("Name", "")
+        MockObject.__init__(self, bridge, Parent=None, **properties)
+        self._kind = kind
+
+    def __setattr__(self, name, value):
+        MockObject.__setattr__(self, name, value)
+        if name == "DefaultScrollValue":
+            self._props["ScrollValue"] = value
+
+
+class MockForm(MockControlModel):
+    """ 
+    A form. Holds control models by index and name, and the script events
+    registered for each index by registerScriptEvent().
+    """
+
+    def __init__(self, bridge, **properties):
+        MockControlModel.__init__(self, bridge, "Form", **properties)
+        self._models = []
+        self._events = {}
+
+    def _insert(self, name, model):
+        model._props["Name"] = name
+        model._props["Parent"] = self
+        self._models.append(model)
+
+    def insertByName(self, name, model):
+        self._call("insertByName")
+        self._insert(name, model)
+
+    def hasByName(self, name):
+        self._call("hasByName")
+        return any(model._props["Name"] == name for model in self._models)
+
+    def getByName(self, name):
+        self._call("getByName")
+        for model in self._models:
+            if model._props["Name"] == name:
+                return model
+        raise KeyError("NoSuchElementException: " + name)
+
+    def getCount(self):
+        self._call("getCount")
+        return len(self._models)
+
+    def getByIndex(self, index):
+        self._call("getByIndex")
+        return self._models[index]
+
+    def registerScriptEvent(self, index, descriptor):
+        self._bridge.record(self._kind + ".registerScriptEvent", 1)
+        if not 0 <= index < len(self._models):
+            raise IndexError("IllegalArgumentException: no control {}".format(index))
+        # A copy. The scripts reuse one descriptor for several events.
+        self._events.setdefault(index, []).append(dict(vars(descriptor)))
+
+    def getScriptEvents(self, index):
+        self._call("getScriptEvents")
+        return tuple(_struct("ScriptEventDescriptor", ())(**event)
+                     for event in self._events.get(index, ()))
+
+
+class MockForms(MockObject):
+    """ The forms of a draw page. Indexable, as pyuno allows forms[0]. """
+    _kind = "Forms"
+
+    def __init__(self, bridge, doc=None):
+        MockObject.__init__(self, bridge, Parent=doc)
+        self._forms = []
+
+    def _insert(self, form, index=None):
+        form._props["Parent"] = self
+        self._forms.insert(len(self._forms) if index is None else index, form)
+
+    def insertByIndex(self, index, form):
+        self._call("insertByIndex")
+        self._insert(form, index)
+
+    def getCount(self):
+        self._call("getCount")
+        return len(self._forms)
+
+    def getByIndex(self, index):
+        self._call("getByIndex")
+        return self._forms[index]
+
+    def __getitem__(self, index):
+        return self.getByIndex(index)
+
+    def hasByName(self, name):
+        self._call("hasByName")
+        return any(form._props["Name"] == name for form in self._forms)
+
+    def getByName(self, name):
+        self._call("getByName")
+        for form in self._forms:
+            if form._props["Name"] == name:
+                return form
+        raise KeyError("NoSuchElementException: " + name)
+
+
+class MockControl(MockObject):
+    """ The view of a form control, an event's Source. Model is its model. """
+    _kind = "Control"
+
+
+class MockNumberFormats(MockObject):
+    """ Number format codes of a document, by key. """
+    _kind = "NumberFormats"
+
+    def __init__(self, bridge):
+        MockObject.__init__(self, bridge)
+        self._keys = {}
+
+    def queryKey(self, format_string, locale, scan):
+        self._call("queryKey")
+        return self._keys.get(format_string, -1)
+
+    def addNew(self, format_string, locale):
+        self._call("addNew")
+        self._keys[format_string] = 100 + len(self._keys)
+        return self._keys[format_string]
+
+
+class MockNameContainer(MockObject):
+    """ A container of named elements, e.g. a style family. """
+    _kind = "NameContainer"
+
+    def __init__(self, bridge, kind="NameContainer"):
+        MockObject.__init__(self, bridge)
+        self._kind = kind
+        self._elements = {}
+
+    def hasByName(self, name):
+        self._call("hasByName")
+        return name in self._elements
+
+    def getByName(self, name):
+        self._call("getByName")
+        return self._elements[name]
+
+    def insertByName(self, name, element):
+        self._call("insertByName")
+        if name in self._elements:
+            raise KeyError("ElementExistException: " + name)
+        self._elements[name] = element
+
+    def removeByName(self, name):
+        self._call("removeByName")
+        del self._elements[name]
+
+    def getElementNames(self):
+        self._call("getElementNames")
+        return tuple(self._elements)
+
+
+class MockLayer(MockObject):
+    _kind = "Layer"
+
+
+class MockLayerManager(MockObject):
+    """ The layers of a Draw document. Starts with the 5 standard layers. """
+    _kind = "LayerManager"
+
+    def __init__(self, bridge):
+        MockObject.__init__(self, bridge)
+        self._layers = [MockLayer(bridge, Name=name, IsVisible=True, IsPrintable=True)
+                        for name in ("layout", "background", "backgroundobjects",
+                                     "controls", "measurelines")]
+
+    def __getattr__(self, name):
+        if name == "Count":
+            self._bridge.record(self._kind + ".getCount")
+            return len(self._layers)
+        return MockObject.__getattr__(self, name)
+
+    def getCount(self):
+        self._call("getCount")
+        return len(self._layers)
+
+    def getByIndex(self, index):
+        self._call("getByIndex")
+        return self._layers[index]
+
+    def insertNewByIndex(self, index):
+        self._call("insertNewByIndex")
+        layer = MockLayer(self._bridge, Name="", IsVisible=True, IsPrintable=True)
+        self._layers.insert(index, layer)
+        return layer
+
+    def remove(self, layer):
+        self._call("remove")
+        self._layers.remove(layer)
+
+
+class MockController(MockObject):
+    """ The view of a document. Shows rows 0 to visible_rows - 1 of a sheet. """
+    _kind = "Controller"
+
+    def __init__(self, bridge, visible_rows=40):
+        MockObject.__init__(self, bridge)
+        self._visible_rows = visible_rows
+
+    def getVisibleRange(self):
+        self._call("getVisibleRange")
+        return _struct("CellRangeAddress", ())(
+                Sheet=0, StartColumn=0, StartRow=0, EndColumn=12,
+                EndRow=self._visible_rows - 1)
+
+    def setFormDesignMode(self, mode):
+        self._call("setFormDesignMode")
+
+
+class MockUndoManager(MockObject):
+    """ Records no undo actions while locked. """
+    _kind = "UndoManager"
+
+    def __init__(self, bridge):
+        MockObject.__init__(self, bridge)
+        self._locks = 0
+
+    def lock(self):
+        self._call("lock")
+        self._locks += 1
+        self._bridge.undo_locks += 1
+
+    def unlock(self):
+        self._call("unlock")
+        self._locks -= 1
+        self._bridge.undo_locks -= 1
+
+    def isLocked(self):
+        self._call("isLocked")
+        return self._locks > 0
+
+
+class MockDocument(MockObject):
+    """ 
+    A Calc document model. Also a Draw one where the action lock, which
+    only Calc has, does not matter. See MockDrawDocument. Its one sheet is
+    sheet_name, by default the finished "Amortization" sheet with its
+    chart. A new Calc document from loadComponentFromURL() has an empty
+    "Sheet1".
+    """
+    _kind = "Document"
+
+    def __init__(self, bridge, sheet_name="Amortization", chart=True):
+        MockObject.__init__(self, bridge)
+        self._style_families = MockNameContainer(bridge, "StyleFamilies")
+        for family in ("graphics", "cell-styles"):
+            self._style_families._elements[family] = MockNameContainer(
+                    bridge, "StyleFamily")
+        self._pages = [MockDrawPage(bridge, self)]
+        self._layer_manager = MockLayerManager(bridge)
+        self._sheets = MockNameContainer(bridge, "Sheets")
+        self._sheets._elements[sheet_name] = MockSheet(bridge, sheet_name, chart, self)
+        self._number_formats = MockNumberFormats(bridge)
+        # URL given to storeAsURL(), and the number of store() calls.
+        self._url = ""
+        self._saves = 0
+        self._controller = MockController(bridge)
+        self._locks = 0
+        # Services createInstance() fails for, as if this office lacks them.
+        self._unknown_services = set()
+        self._action_locks = 0
+        self._undo_manager = MockUndoManager(bridge)
+        # URLs and filter names passed to storeToURL().
+        self._stored = []
+        self._closed = False
+
+    def __getattr__(self, name):
+        if name == "DrawPages":
+            self._bridge.record(self._kind + ".getDrawPages")
+            return self._pages
+        if name == "Sheets":
+            self._bridge.record(self._kind + ".getSheets")
+            return self._sheets
+        if name == "NumberFormats":
+            self._bridge.record(self._kind + ".getNumberFormats")
+            return self._number_formats
+        return MockObject.__getattr__(self, name)
+
+    def getCurrentController(self):
+        self._call("getCurrentController")
+        return self._controller
+
+    def lockControllers(self):
+        self._call("lockControllers")
+        self._locks += 1
+        self._bridge.controller_locks += 1
+
+    def unlockControllers(self):
+        self._call("unlockControllers")
+        self._locks -= 1
+        self._bridge.controller_locks -= 1
+        if not self._bridge.controller_locks:
+            # The one repaint of everything changed while locked.
+            self._bridge.repaints += 1
+
+    def hasControllersLocked(self):
+        self._call("hasControllersLocked")
+        return self._locks > 0
+
+    def addActionLock(self):
+        self._call("addActionLock")
+        self._action_locks += 1
+
+    def removeActionLock(self):
+        self._call("removeActionLock")
+        self._action_locks -= 1
+
+    def isActionLocked(self):
+        self._call("isActionLocked")
+        return self._action_locks > 0
+
+    def getUndoManager(self):
+        self._call("getUndoManager")
+        return self._undo_manager
+
+    def getLayerManager(self):
+        self._call("getLayerManager")
+        return self._layer_manager
+
+    def storeToURL(self, url, properties):
+        """ Writes a small placeholder file, so resumed runs can see it. """
+        self._call("storeToURL")
+        filter_name = [p.Value for p in properties if p.Name == "FilterName"]
+        self._stored.append((url, filter_name[0] if filter_name else ""))
+        if url.startswith("file://"):
+            with open(url[len("file://"):], "w") as fout:
+                fout.write("uno_mock export: {}\n".format(self._stored[-1][1]))
+
+    def storeAsURL(self, url, properties):
+        """ Recorded only. No file is written. """
+        self._call("storeAsURL")
+        self._url = url
+        self._saves += 1
+
+    def store(self):
+        self._call("store")
+        self._saves += 1
+
+    def dispose(self):
+        self._call("dispose")
+        self._remove()
+
+    def close(self, deliver_ownership):
+        self._call("close")
+        self._remove()
+
+    def _remove(self):
+        self._closed = True
+        if self in self._bridge.components:
+            self._bridge.components.remove(self)
+
+    def createInstance(self, service):
+        self._call("createInstance")
+        if service in self._unknown_services:
+            raise UnoException("Service not registered: " + service)
+        kind = service.rsplit(".", 1)[-1]
+        if kind == "GroupShape":
+            return MockGroupShape(self._bridge)
+        if service == "com.sun.star.form.component.Form":
+            return MockForm(self._bridge)
+        if service.startswith("com.sun.star.form.component."):
+            return MockControlModel(self._bridge, kind)
+        return MockShape(self._bridge, kind)
+
+    def getStyleFamilies(self):
+        self._call("getStyleFamilies")
+        return self._style_families
+
+
+class UnoException(Exception):
+    """ Base for the mock UNO exceptions. pyuno exceptions have typeName. """
+    typeName = "com.sun.star.uno.Exception"
+
+    def __init__(self, Message="", Context=None):
+        Exception.__init__(self, Message)
+        self.Message = Message
+        self.Context = Context
+
+
+class RuntimeException(UnoException):
+    typeName = "com.sun.star.uno.RuntimeException"
+
+
+class DisposedException(RuntimeException):
+    typeName = "com.sun.star.lang.DisposedException"
+
+
+class NoConnectException(UnoException):
+    typeName = "com.sun.star.connection.NoConnectException"
+
+
+class MockDrawDocument(MockDocument):
+    """ A Draw document. Unlike a Calc document, it has no action lock. """
+    _unsupported = ("addActionLock", "removeActionLock", "isActionLocked")
+
+    def __getattribute__(self, name):
+        if name in MockDrawDocument._unsupported:
+            raise AttributeError(name)
+        return MockDocument.__getattribute__(self, name)
+
+    def __getattr__(self, name):
+        if name in MockDrawDocument._unsupported:
+            raise AttributeError(name)
+        return MockDocument.__getattr__(self, name)
+
+
+class MockDesktop(MockObject):
+    """ The office Desktop. Documents are kept in bridge.components. """
+    _kind = "Desktop"
+
+    def getCurrentComponent(self):
+        self._call("getCurrentComponent")
+        return self._bridge.components[-1] if self._bridge.components else None
+
+    def loadComponentFromURL(self, url, target, flags, properties):
+        self._call("loadComponentFromURL")
+        if url == "private:factory/scalc":
+            doc = MockDocument(self._bridge, "Sheet1", chart=False)
+        else:
+            doc = MockDrawDocument(self._bridge)
+        self._bridge.components.append(doc)
+        return doc
+
+
+class MockOffice():
+    """
+    Stands in for office_pool.OfficePool's OfficeProcess. Each start() is a
+    new office, with a MockBridge and Desktop of its own. e.g.
+        office_pool.OfficePool(2, office_factory=lambda: MockOffice("socket"))
+    """
+
+    def __init__(self, profile=None, sleep=True):
+        self.profile = profile
+        self.sleep = sleep
+        self.bridge = None
+        self.desktop = None
+        # start() raises while this is above 0, as if soffice exited at once.
+        self.fail_starts = 0
+        self.starts = 0
+        self.start_seconds = None
+        # The pool asks the connection for the desktop. It is this office.
+        self.connection = self
+
+    def start(self, timeout=None):
+        if self.fail_starts > 0:
+            self.fail_starts -= 1
+            raise RuntimeError("soffice exited with code 1")
+        self.bridge = MockBridge(profile=self.profile, sleep=self.sleep)
+        if self.bridge.connect_latency and self.sleep:
+            time.sleep(self.bridge.connect_latency)
+        self.start_seconds = self.bridge.connect_latency
+        self.desktop = MockDesktop(self.bridge)
+        self.starts += 1
+
+    def get_desktop(self):
+        if not self.is_alive():
+            raise DisposedException("Binary URP bridge disposed during call")
+        return self.desktop
+
+    def is_alive(self):
+        return self.bridge is not None and not self.bridge.disposed
+
+    def kill(self, after_calls=0):
+        """ Crash the office after that many more bridge calls, e.g. mid-job. """
+        self.bridge.crash_after = after_calls
+
+    def restart(self):
+        self.stop(remove_profile=False)
+        self.start()
+
+    def stop(self, remove_profile=True):
+        if self.bridge is not None:
+            self.bridge.disposed = True
+        self.bridge = self.desktop = None
+
+
+class MockServiceManager(MockObject):
+    """ Creates the few services the scripts ask a service manager for. """
+    _kind = "ServiceManager"
+
+    def createInstanceWithContext(self, service, ctx):
+        self._call("createInstanceWithContext")
+        if service == "com.sun.star.bridge.UnoUrlResolver":
+            return MockResolver(self._bridge)
+        if service == "com.sun.star.frame.Desktop":
+            return MockDesktop(self._bridge)
+        return MockObject(self._bridge)
+
+
+class MockContext(MockObject):
+    """ A component context. ServiceManager is a property and a method. """
+    _kind = "ComponentContext"
+
+    def __init__(self, bridge):
+        MockObject.__init__(self, bridge)
+        self._smgr = MockServiceManager(bridge)
+
+    def __getattr__(self, name):
+        if name == "ServiceManager":
+            return self.getServiceManager()
+        return MockObject.__getattr__(self, name)
+
+    def getServiceManager(self):
+        self._call("getServiceManager")
+        return self._smgr
+
+
+class MockResolver(MockObject):
+    """ UnoUrlResolver. resolve() opens the "remote" bridge. """
+    _kind = "UnoUrlResolver"
+
+    def resolve(self, url):
+        # Resolve runs in this process, against the remote bridge.
+        remote = _office_bridge
+        if remote.refuse:
+            raise NoConnectException("Connector : couldn't connect to socket")
+        remote.disposed = False
+        remote.record("UnoUrlResolver.resolve")
+        if remote.connect_latency:
+            remote.elapsed += remote.connect_latency
+            if remote.sleep:
+                time.sleep(remote.connect_latency)
+        return MockContext(remote)
+
+
+class _Struct():
+    """ Plain UNO struct. Local to the Python process, so not counted. """
+
+    def __init__(self, *args, **kwargs):
+        for name, value in zip(self._fields, args):
+            setattr(self, name, value)
+        for name, value in kwargs.items():
+            setattr(self, name, value)
+
+
+def _struct(name, fields):
+    return type(name, (_Struct,), {"_fields": fields})
+
+
+# UNO names imported by the scripts at load time.
+_MODULES = {
+    "com.sun.star.beans": {
+        "PropertyValue": _struct("PropertyValue", ("Name", "Handle", "Value", "State")),
+    },
+    "com.sun.star.awt": {
+        "Size": _struct("Size", ("Width", "Height")),
+        "Point": _struct("Point", ("X", "Y")),
+    },
+    "com.sun.star.drawing.FillStyle": {"NONE": "NONE", "SOLID": "SOLID"},
+    "com.sun.star.drawing.LineJoint": {"MITER": "MITER"},
+    "com.sun.star.drawing.LineStyle": {"NONE": "NONE", "SOLID": "SOLID", "DASH": "DASH"},
+    "com.sun.star.drawing.DashStyle": {"RECT": "RECT", "ROUND": "ROUND"},
+    "com.sun.star.chart.ChartLegendPosition": {"BOTTOM": "BOTTOM"},
+    "com.sun.star.table.CellHoriJustify": {"CENTER": "CENTER"},
+    "com.sun.star.awt.FontWeight": {"NORMAL": 100.0, "BOLD": 150.0},
+    "com.sun.star.sheet.CellFlags": {"VALUE": 1, "DATETIME": 2, "STRING": 4,
+                                     "ANNOTATION": 8, "FORMULA": 16},
+    "com.sun.star.awt.MessageBoxType": {"MESSAGEBOX": "MESSAGEBOX"},
+    "com.sun.star.lang": {"DisposedException": DisposedException},
+    "com.sun.star.uno": {"Exception": UnoException, "RuntimeException": RuntimeException},
+    "com.sun.star.connection": {"NoConnectException": NoConnectException},
+}
+
+# The bridge that resolve() connects to. Set by install().
+_office_bridge = None
+
+
+def control_event(model, **properties):
+    """ 
+    An event from the control of model, e.g. a button push. Its Source is
+    the control, with Model and any other properties, e.g. Value.
+    """
+    control = MockControl(model._bridge, Model=model, **properties)
+    return _struct("EventObject", ("Source",))(control)
+
+
+def resolve_script(url):
+    """ 
+    The Python function a "vnd.sun.star.script:file.py$function?..." URL
+    names. The module is imported by the file's name, as the office would.
+    """
+    location = url.split(":", 1)[1].split("?", 1)[0]
+    path, function = location.rsplit("$", 1)
+    module = importlib.import_module(os.path.splitext(os.path.basename(path))[0])
+    return getattr(module, function)
+
+
+def fire(form, index, event_method, event):
+    """ 
+    Call the scripts registered on form for control index and event_method,
+    e.g. "actionPerformed", with event. Returns the number called.
+    """
+    called = 0
+    for descriptor in form._events.get(index, ()):
+        if descriptor["EventMethod"] == event_method:
+            resolve_script(descriptor["ScriptCode"])(event)
+            called += 1
+    return called
+
+
+def install(bridge=None, profile=None):
+    """
+    Register fake "uno" and "com.sun.star..." modules so the scripts can be
+    imported without LibreOffice. Returns the MockBridge in use. profile is
+    one of PROFILES, for a new MockBridge that adds up, not sleeps, latency.
+    """
+    global _office_bridge
+    bridge = bridge or MockBridge(profile=profile, sleep=profile is None)
+    _office_bridge = bridge
+    # The local context is in this process. Its calls are not counted.
+    local_context = MockContext(MockBridge())
+
+    uno_module = types.ModuleType("uno")
+    uno_module.createUnoStruct = lambda name: _struct(name.rsplit(".", 1)[-1], ())()
+    uno_module.getComponentContext = lambda: local_context
+    uno_module.systemPathToFileUrl = lambda path: "file://" + path
+    uno_module.fileUrlToSystemPath = lambda url: url[len("file://"):]
+    uno_module.bridge = bridge
+    sys.modules["uno"] = uno_module
+
+    for dotted, names in _MODULES.items():
+        parts = dotted.split(".")
+        for i in range(1, len(parts) + 1):
+            name = ".".join(parts[:i])
+            if name not in sys.modules:
+                sys.modules[name] = types.ModuleType(name)
+        module = sys.modules[dotted]
+        for key, value in names.items():
+            setattr(module, key, value)
+
+    return bridge
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+#
+# uno_trace.py
+#
+# Opt-in counts and timings of UNO bridge calls, grouped by the Python
+# functions that made them, to find which of the hundreds of calls in
+# draw_uno_plan.main() or recalculate() take the time.
+#
+# Tracing wraps UNO objects in a Proxy. Every method call and property get
+# or set through a Proxy is timed, and any UNO object it returns is wrapped
+# too. So wrapping the desktop traces everything reached from it. Once
+# enabled, uno_connection.get_desktop() returns a wrapped desktop. When not
+# enabled nothing is wrapped, and the only cost is one test in get_desktop().
+#
+# Usage:
+#   tracer = uno_trace.enable()
+#   draw_uno_plan.main()
+#   tracer.report()
+#   tracer.dump("trace.json")   # or "trace.folded" for a flame graph.
+#
+# Or with no change to a script, set UNO_TRACE to the file to write when
+# Python exits, or to 1 to print the report:
+# $ UNO_TRACE=main.folded python3 draw_uno_plan.py
+# $ flamegraph.pl main.folded > main.svg
+#
+# Objects that do not come from the desktop, e.g. event.Source in a
+# callback, can be wrapped by hand with tracer.wrap(obj, "Label").
+#
+import atexit
+import collections
+import json
+import os
+import sys
+import time
+
+# Labels for the objects some calls return, where the call name is no help.
+LABELS = {
+    "getCurrentComponent": "Document",
+    "loadComponentFromURL": "Document",
+    "getDrawPage": "DrawPage",
+}
+
+
+def is_proxy(value):
+    """ True for a UNO object, i.e. an interface on the far side of the bridge. """
+    # pyuno structs and enums are local values, of other types.
+    return type(value).__name__ == "pyuno" or getattr(type(value), "uno_proxy", False)
+
+
+def item_label(label):
+    """ Label for an element of a container. e.g. "DrawPages" --> "DrawPage" """
+    return label[:-1] if label.endswith("s") else label + " item"
+
+
+def unwrap(value):
+    """ The UNO object behind a Proxy, also inside tuples and lists. """
+    if isinstance(value, Proxy):
+        return object.__getattribute__(value, "_target")
+    if isinstance(value, (tuple, list)) and value:
+        return type(value)(unwrap(item) for item in value)
+    return value
+
+
+class Tracer():
+    """ Counts and seconds of bridge calls by (calling stack, call). """
+
+    def __init__(self):
+        # (stack, call) to [count, seconds]. stack is a tuple of
+        # "module.function", outermost first.
+        self.stats = collections.defaultdict(lambda: [0, 0.0])
+        self._names = {}
+
+    def reset(self):
+        self.stats.clear()
+
+    def wrap(self, target, label="Object"):
+        """ target in a Proxy that records to this tracer. Also in a tuple or list. """
+        if isinstance(target, (tuple, list)):
+            if not any(is_proxy(item) for item in target):
+                return target
+            return type(target)(self.wrap(item, item_label(label)) for item in target)
+        if isinstance(target, Proxy) or not is_proxy(target):
+            return target
+        return Proxy(target, label, self)
+
+    def _stack(self):
+        """ The calling Python functions, outermost first, less this module. """
+        names = []
+        frame = sys._getframe(2)
+        while frame is not None:
+            code = frame.f_code
+            name = self._names.get(code)
+            if name is None:
+                module = os.path.splitext(os.path.basename(code.co_filename))[0]
+                # co_qualname, e.g. "ShapeIndex.add", is Python 3.11 on.
+                name = self._names[code] = "{}.{}".format(
+                        module, getattr(code, "co_qualname", code.co_name))
+            if not name.startswith("uno_trace."):
+                names.append(name)
+            frame = frame.f_back
+        return tuple(reversed(names))
+
+    def record(self, call, seconds):
+        entry = self.stats[(self._stack(), call)]
+        entry[0] += 1
+        entry[1] += seconds
+
+    def total(self):
+        """ (calls, seconds) over everything recorded. """
+        return (sum(count for count, seconds in self.stats.values()),
+                sum(seconds for count, seconds in self.stats.values()))
+
+    def by_function(self):
+        """ Dict of the function that made the calls to [count, seconds]. """
+        functions = collections.defaultdict(lambda: [0, 0.0])
+        for (stack, call), (count, seconds) in self.stats.items():
+            entry = functions[stack[-1] if stack else "<module>"]
+            entry[0] += count
+            entry[1] += seconds
+        return functions
+
+    def by_call(self):
+        """ Dict of call, e.g. "RectangleShape.setPosition()", to [count, seconds]. """
+        calls = collections.defaultdict(lambda: [0, 0.0])
+        for (stack, call), (count, seconds) in self.stats.items():
+            entry = calls[call]
+            entry[0] += count
+            entry[1] += seconds
+        return calls
+
+    def report(self, top=15, fout=None):
+        """ Print the functions and the calls that took the most time. """
+        fout = fout or sys.stdout
+        calls, seconds = self.total()
+        print("UNO calls: {}. Time: {:.1f}ms".format(calls, seconds * 1000), file=fout)
+        for title, rows in (("Calling function", self.by_function()),
+                            ("Call", self.by_call())):
+            print("{:<44} {:>8} {:>10}".format(title, "Calls", "ms"), file=fout)
+            ranked = sorted(rows.items(), key=lambda item: item[1][1], reverse=True)
+            for name, (count, seconds) in ranked[:top]:
+                print("{:<44} {:>8} {:>10.2f}".format(name, count, seconds * 1000),
+                      file=fout)
+
+    def folded(self, value="us"):
+        """
+        Lines of "outer;inner;call value" for flamegraph.pl and speedscope.
+        value is "us", microseconds, or "count".
+        """
+        lines = []
+        for (stack, call), (count, seconds) in sorted(self.stats.items()):
+            weight = count if value == "count" else max(1, int(round(seconds * 1e6)))
+            lines.append("{} {}".format(";".join(stack + (call,)), weight))
+        return lines
+
+    def to_json(self):
+        return {
+            "calls": [{"stack": list(stack), "call": call, "count": count,
+                       "seconds": seconds}
+                      for (stack, call), (count, seconds) in sorted(self.stats.items())],
+        }
+
+    def dump(self, path):
+        """ Write the trace to path. JSON if it ends .json, else folded stacks. """
+        with open(path, "w") as fout:
+            if path.lower().endswith(".json"):
+                json.dump(self.to_json(), fout, indent=1)
+            else:
+                fout.write("\n".join(self.folded()) + "\n")
+
+
+class Proxy():
+    """
+    Stands in for one UNO object. Passes every attribute through, timing
+    the bridge call, and wraps the UNO objects that come back. Compares and
+    hashes as the object it wraps, so ShapeIndex lookups still work.
+    """
+    __slots__ = ("_target", "_label", "_tracer")
+
+    def __init__(self, target, label, tracer):
+        object.__setattr__(self, "_target", target)
+        object.__setattr__(self, "_label", label)
+        object.__setattr__(self, "_tracer", tracer)
+
+    def __getattr__(self, name):
+        target = object.__getattribute__(self, "_target")
+        if name.startswith("_"):
+            # Python's own, not UNO.
+            return getattr(target, name)
+        tracer = object.__getattribute__(self, "_tracer")
+        label = object.__getattribute__(self, "_label")
+        start = time.perf_counter()
+        value = getattr(target, name)
+        if callable(value) and not is_proxy(value):
+            return _method(value, label, name, tracer)
+        tracer.record("{}.{}".format(label, name), time.perf_counter() - start)
+        return tracer.wrap(value, name)
+
+    def __setattr__(self, name, value):
+        target = object.__getattribute__(self, "_target")
+        if name.startswith("_"):
+            setattr(target, name, value)
+            return
+        start = time.perf_counter()
+        setattr(target, name, unwrap(value))
+        object.__getattribute__(self, "_tracer").record(
+                "{}.{}=".format(object.__getattribute__(self, "_label"), name),
+                time.perf_counter() - start)
+
+    def __getitem__(self, index):
+        # e.g. oDoc.DrawPages[0], a getByIndex() by the bridge.
+        label = object.__getattribute__(self, "_label")
+        tracer = object.__getattribute__(self, "_tracer")
+        start = time.perf_counter()
+        value = object.__getattribute__(self, "_target")[index]
+        tracer.record("{}[]".format(label), time.perf_counter() - start)
+        return tracer.wrap(value, item_label(label))
+
+    def __len__(self):
+        return len(object.__getattribute__(self, "_target"))
+
+    def __eq__(self, other):
+        return object.__getattribute__(self, "_target") == unwrap(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(object.__getattribute__(self, "_target"))
+
+    def __repr__(self):
+        return "<traced {} {!r}>".format(object.__getattribute__(self, "_label"),
+                                         object.__getattribute__(self, "_target"))
+
+
+def _method(method, label, name, tracer):
+    """ A callable that times method and wraps the UNO object it returns. """
+    call = "{}.{}()".format(label, name)
+
+    def traced(*args):
+        start = time.perf_counter()
+        try:
+            value = method(*unwrap(args))
+        finally:
+            tracer.record(call, time.perf_counter() - start)
+        if name == "createInstance" and args:
+            # e.g. "RectangleShape" for "com.sun.star.drawing.RectangleShape"
+            return tracer.wrap(value, str(args[0]).rsplit(".", 1)[-1])
+        if name in LABELS:
+            return tracer.wrap(value, LABELS[name])
+        if name in ("getByIndex", "getByName"):
+            return tracer.wrap(value, item_label(label))
+        return tracer.wrap(value, name[3:] if name.startswith("get") and len(name) > 3
+                           else label)
+    return traced
+
+
+def enable(path=None):
+    """
+    Trace from now on, through uno_connection.get_desktop(). With path,
+    write the trace there when Python exits, or print the report if path
+    is "1". Returns the Tracer.
+    """
+    import uno_connection
+    tracer = uno_connection.TRACER or Tracer()
+    uno_connection.TRACER = tracer
+    if path == "1":
+        atexit.register(tracer.report)
+    elif path:
+        atexit.register(tracer.dump, path)
+    return tracer
+
+
+def disable():
+    """ Stop wrapping new desktops. Objects already wrapped still record. """
+    import uno_connection
+    uno_connection.TRACER = None